@@ -8,15 +8,23 @@ YouTube下载器 - 启动入口
 
 import sys
 import os
-20秒
+import multiprocessing
+
 # 将当前目录添加到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    # 导入并启动应用程序
-    from youtube_downloader.main import main
-    
     if __name__ == "__main__":
+        # 打包后的程序需要支持提取子进程
+        multiprocessing.freeze_support()
+        
+        if len(sys.argv) > 1:
+            # 带参数时以命令行模式运行（下载/频道同步）
+            from youtube_downloader.cli import run
+            sys.exit(run(sys.argv[1:]))
+        
+        # 导入并启动应用程序
+        from youtube_downloader.main import main
         main()
         
 except ImportError as e:
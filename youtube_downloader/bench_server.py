@@ -0,0 +1,246 @@
+"""
+测速服务器模块 - 本地支持Range请求、按连接限速的HTTP服务器，以及限制总带宽的HTTP代理，
+用于比较下载引擎、测试限速处理和代理分配
+"""
+import os
+import re
+import time
+import threading
+import http.client
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    """返回固定内容的文件，支持单个字节区间，每个连接单独限速"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _respond(self, send_body):
+        payload = self.server.payload
+        size = len(payload)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"bench"')
+        self.end_headers()
+        if send_body:
+            self._send_throttled(memoryview(payload)[start:end + 1])
+
+    def _send_throttled(self, data):
+        """按每连接速率限制发送数据；同一地址累计发送超过阈值后降为限速速率"""
+        server = self.server
+        rate = server.bytes_per_second
+        start = time.time()
+        sent = 0
+        try:
+            while sent < len(data):
+                if server.is_url_throttled(self.path):
+                    # 地址被限速：按低速率逐块发送
+                    block = max(1024, server.throttled_rate // 10)
+                    self.wfile.write(data[sent:sent + block])
+                    sent += block
+                    server.count_bytes(self.path, block)
+                    time.sleep(block / server.throttled_rate)
+                    continue
+                block = max(1024, rate // 20) if rate else 256 * 1024
+                self.wfile.write(data[sent:sent + block])
+                sent += block
+                server.count_bytes(self.path, block)
+                if rate:
+                    delay = sent / rate - (time.time() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class _BenchHTTPServer(ThreadingHTTPServer):
+    """记录每个地址（含查询参数）已发送的字节数"""
+
+    daemon_threads = True
+
+    def __init__(self, address, payload, bytes_per_second, throttle_after, throttled_rate):
+        super().__init__(address, _RangeHandler)
+        self.payload = payload
+        self.bytes_per_second = int(bytes_per_second)
+        self.throttle_after = throttle_after
+        self.throttled_rate = int(throttled_rate)
+        self._sent = {}
+        self._lock = threading.Lock()
+
+    def count_bytes(self, path, length):
+        with self._lock:
+            self._sent[path] = self._sent.get(path, 0) + length
+
+    def is_url_throttled(self, path):
+        if not self.throttle_after:
+            return False
+        with self._lock:
+            return self._sent.get(path, 0) >= self.throttle_after
+
+
+class ThrottledRangeServer:
+    """本地测速服务器
+
+    模拟上游对单个连接的限速；设置throttle_after时还模拟按地址限速：
+    同一地址累计发送超过该字节数后，该地址的所有连接降为throttled_rate，换用新地址（如不同的签名参数）即恢复。
+    """
+
+    def __init__(self, size, bytes_per_second=0, host='127.0.0.1', port=0,
+                 throttle_after=None, throttled_rate=32 * 1024):
+        self.httpd = _BenchHTTPServer((host, port), os.urandom(size), bytes_per_second,
+                                      throttle_after, throttled_rate)
+        self._thread = None
+        self._signature = 0
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/bench.mp4"
+
+    def signed_url(self):
+        """生成一个新的地址（模拟重新提取得到的新签名）"""
+        self._signature += 1
+        return f"{self.url}?sig={self._signature}"
+
+    @property
+    def payload(self):
+        return self.httpd.payload
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    """转发绝对地址的GET请求（仅HTTP），所有连接共享代理的总带宽"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        target = urlsplit(self.path)
+        if self.server.fail:
+            self.send_error(502)
+            return
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        try:
+            path = target.path + (f"?{target.query}" if target.query else "")
+            headers = {k: v for k, v in self.headers.items() if k.lower() not in ('proxy-connection', 'connection')}
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            self.send_response(response.status)
+            for key, value in response.getheaders():
+                if key.lower() not in ('connection', 'transfer-encoding'):
+                    self.send_header(key, value)
+            self.end_headers()
+            while True:
+                block = response.read(16 * 1024)
+                if not block:
+                    break
+                self.server.limit(len(block))
+                self.wfile.write(block)
+                self.server.bytes_served += len(block)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            conn.close()
+
+
+class _BandwidthProxyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, bytes_per_second):
+        super().__init__(address, _ProxyHandler)
+        self.bytes_per_second = int(bytes_per_second)
+        self.bytes_served = 0
+        self.fail = False
+        self._next_time = 0
+        self._lock = threading.Lock()
+
+    def limit(self, length):
+        """令牌桶式的总带宽限制：所有连接按顺序预约发送时间"""
+        if not self.bytes_per_second:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_time)
+            self._next_time = start + length / self.bytes_per_second
+        if start > now:
+            time.sleep(start - now)
+
+
+class BandwidthLimitedProxy:
+    """本地HTTP代理替身（总带宽有上限），fail=True时对所有请求返回502"""
+
+    def __init__(self, bytes_per_second, host='127.0.0.1', port=0):
+        self.httpd = _BandwidthProxyServer((host, port), bytes_per_second)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def bytes_served(self):
+        return self.httpd.bytes_served
+
+    def set_failing(self, fail=True):
+        self.httpd.fail = fail
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
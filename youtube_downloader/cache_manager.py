@@ -5,7 +5,15 @@ import os
 import shutil
 import time
 import json
+import threading
 from pathlib import Path
+from .config import config
+from .stream_store import StreamStore
+from .disk_space import get_volume_key
+
+
+# 缓存目录与下载目录不在同一文件系统时，在下载目录下用于暂存会话的隐藏目录
+STAGING_DIR_NAME = ".youtube_downloader_staging"
 
 
 class CacheManager:
@@ -16,6 +24,8 @@ class CacheManager:
         self.cache_dir = self._get_cache_dir()
         self.cache_info_file = os.path.join(self.cache_dir, "cache_info.json")
         self._ensure_cache_dir()
+        self.stream_store = StreamStore(os.path.join(self.cache_dir, "streams"))
+        self._lock = threading.Lock()
     
     def _get_cache_dir(self):
         """获取缓存目录路径"""
@@ -30,11 +40,88 @@ class CacheManager:
             os.makedirs(self.cache_dir, exist_ok=True)
             print(f"📁 创建缓存目录: {self.cache_dir}")
     
+    def _load_cache_info(self):
+        """读取缓存信息文件（记录下载目录中的暂存目录）"""
+        try:
+            with open(self.cache_info_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_cache_info(self, cache_info):
+        try:
+            with open(self.cache_info_file, 'w', encoding='utf-8') as f:
+                json.dump(cache_info, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"保存缓存信息失败: {e}")
+    
+    def get_staging_roots(self):
+        """下载目录中仍存在的暂存目录"""
+        with self._lock:
+            roots = self._load_cache_info().get('staging_roots', [])
+        return [root for root in roots if os.path.isdir(root)]
+    
+    def get_session_roots(self):
+        """所有可能存放会话目录的根目录"""
+        return [self.cache_dir] + self.get_staging_roots()
+    
+    def _walk_session_roots(self):
+        """遍历缓存目录和所有暂存目录"""
+        for base_dir in self.get_session_roots():
+            yield from os.walk(base_dir)
+    
+    def _register_staging_root(self, staging_root):
+        with self._lock:
+            cache_info = self._load_cache_info()
+            roots = cache_info.setdefault('staging_roots', [])
+            if staging_root not in roots:
+                roots.append(staging_root)
+                self._save_cache_info(cache_info)
+    
+    def _unregister_staging_root(self, staging_root):
+        with self._lock:
+            cache_info = self._load_cache_info()
+            roots = cache_info.get('staging_roots', [])
+            if staging_root in roots:
+                roots.remove(staging_root)
+                self._save_cache_info(cache_info)
+    
+    def get_staging_root(self, target_dir):
+        """选择会话目录所在的根目录，使下载结果与目标目录在同一文件系统，完成时只需重命名
+        
+        缓存目录与目标目录不在同一文件系统（如本地缓存、NAS目标）时，在目标目录下的隐藏目录中暂存；
+        无法创建时仍使用缓存目录，完成时再复制。
+        """
+        if not target_dir or not config.get("stage_on_target_volume", True):
+            return self.cache_dir
+        if get_volume_key(self.cache_dir)[0] == get_volume_key(target_dir)[0]:
+            return self.cache_dir
+        staging_root = os.path.join(os.path.abspath(target_dir), STAGING_DIR_NAME)
+        try:
+            os.makedirs(staging_root, exist_ok=True)
+        except OSError as e:
+            print(f"⚠️ 无法在下载目录中暂存，使用缓存目录: {e}")
+            return self.cache_dir
+        self._register_staging_root(staging_root)
+        return staging_root
+    
+    def release_staging_session(self, session_dir):
+        """删除下载目录暂存区中已完成的会话，暂存区为空时一并删除（缓存目录中的会话照旧保留）"""
+        staging_root = os.path.dirname(session_dir)
+        if os.path.basename(staging_root) != STAGING_DIR_NAME:
+            return
+        self.cleanup_session(session_dir)
+        try:
+            os.rmdir(staging_root)
+            self._unregister_staging_root(staging_root)
+        except OSError:
+            pass
+    
     def get_cache_size(self):
         """获取缓存大小（字节）"""
         total_size = 0
         try:
-            for root, dirs, files in os.walk(self.cache_dir):
+            for root, dirs, files in self._walk_session_roots():
                 for file in files:
                     if file != "cache_info.json":  # 排除缓存信息文件
                         file_path = os.path.join(root, file)
@@ -61,7 +148,7 @@ class CacheManager:
         }
         
         try:
-            for root, dirs, files in os.walk(self.cache_dir):
+            for root, dirs, files in self._walk_session_roots():
                 for file in files:
                     if file != "cache_info.json":
                         file_path = os.path.join(root, file)
@@ -80,14 +167,46 @@ class CacheManager:
         
         return cache_info
     
-    def create_download_session(self, video_title, quality):
-        """创建下载会话，返回会话ID和临时目录"""
+    def _find_cancelled_session(self, base_dir, video_id, quality):
+        """查找同一视频（按视频ID，标题可能重复）、同一清晰度被取消后保留的会话"""
+        try:
+            names = os.listdir(base_dir)
+        except OSError:
+            return None
+        for name in names:
+            session_info_file = os.path.join(base_dir, name, "session_info.json")
+            try:
+                with open(session_info_file, 'r', encoding='utf-8') as f:
+                    session_info = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if (session_info.get('status') == 'cancelled' and session_info.get('video_id') == video_id
+                    and session_info.get('quality') == quality):
+                return session_info.get('session_id'), os.path.join(base_dir, name)
+        return None
+    
+    def create_download_session(self, video_title, quality, staging_root=None, video_id=None, resume=False):
+        """创建下载会话，返回会话ID和临时目录（staging_root为会话所在根目录，默认为缓存目录）
+        
+        resume=True且有视频ID时优先沿用之前取消时保留的会话，已下载的部分从断点继续。
+        """
+        if resume and video_id:
+            # 查找与认领在同一把锁内完成，同时开始的两个任务不会认领同一个会话
+            with self._lock:
+                found = self._find_cancelled_session(staging_root or self.cache_dir, video_id, quality)
+                if found:
+                    self.update_session_status(found[1], "downloading")
+            if found:
+                session_id, session_dir = found
+                print(f"📁 继续之前取消的下载会话: {session_id} - {video_title}")
+                return session_id, session_dir
+        
         import uuid
         session_id = str(uuid.uuid4())[:8]  # 使用UUID的前8位作为会话ID
         
         # 清理文件名中的非法字符
         safe_title = self._clean_filename(video_title)
-        session_dir = os.path.join(self.cache_dir, f"{safe_title}_{session_id}")
+        session_dir = os.path.join(staging_root or self.cache_dir, f"{safe_title}_{session_id}")
         
         # 创建会话目录
         os.makedirs(session_dir, exist_ok=True)
@@ -95,6 +214,7 @@ class CacheManager:
         # 记录会话信息
         session_info = {
             'session_id': session_id,
+            'video_id': video_id,
             'video_title': video_title,
             'quality': quality,
             'created_time': time.time(),
@@ -151,14 +271,22 @@ class CacheManager:
                     print(f"删除文件失败 {file_info['path']}: {e}")
             
             # 清理空目录
-            for root, dirs, files in os.walk(self.cache_dir, topdown=False):
-                for dir_name in dirs:
-                    dir_path = os.path.join(root, dir_name)
-                    try:
-                        if not os.listdir(dir_path):  # 目录为空
-                            os.rmdir(dir_path)
-                    except Exception:
-                        pass
+            staging_roots = self.get_staging_roots()
+            for base_dir in [self.cache_dir] + staging_roots:
+                for root, dirs, files in os.walk(base_dir, topdown=False):
+                    for dir_name in dirs:
+                        dir_path = os.path.join(root, dir_name)
+                        try:
+                            if not os.listdir(dir_path):  # 目录为空
+                                os.rmdir(dir_path)
+                        except Exception:
+                            pass
+            for staging_root in staging_roots:
+                try:
+                    os.rmdir(staging_root)
+                    self._unregister_staging_root(staging_root)
+                except OSError:
+                    pass
             
             print(f"🗑️ 清理完成: {cleaned_count} 个文件, {self.format_cache_size(cleaned_size)}")
             return cleaned_count, cleaned_size
@@ -174,7 +302,7 @@ class CacheManager:
             max_age_seconds = max_age_hours * 3600
             cleaned_count = 0
             
-            for root, dirs, files in os.walk(self.cache_dir):
+            for root, dirs, files in self._walk_session_roots():
                 for dir_name in dirs:
                     session_dir = os.path.join(root, dir_name)
                     session_info_file = os.path.join(session_dir, "session_info.json")
@@ -194,6 +322,11 @@ class CacheManager:
             if cleaned_count > 0:
                 print(f"🗑️ 清理过期会话: {cleaned_count} 个")
             
+            # 清理过期的流缓存
+            removed_streams = self.stream_store.cleanup(config.get("stream_store_max_age_hours", 72))
+            if removed_streams > 0:
+                print(f"🗑️ 清理过期流缓存: {removed_streams} 个")
+            
             return cleaned_count
             
         except Exception as e:
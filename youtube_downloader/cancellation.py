@@ -0,0 +1,66 @@
+"""
+取消模块 - 每个下载任务一个取消令牌，提取、传输、合并各阶段协作检查，取消后立即结束并释放资源
+"""
+import threading
+from yt_dlp.utils import DownloadCancelled as YtdlpDownloadCancelled
+
+
+class DownloadCancelled(YtdlpDownloadCancelled):
+    """下载已被取消（继承yt-dlp的取消异常，在进度回调中抛出时yt-dlp直接中止而不重试）"""
+
+    msg = "下载已取消"
+
+
+class CancelToken:
+    """任务的取消令牌
+
+    接口与threading.Event兼容（is_set/wait），可直接作为cancel_event传给提取进程池和重试策略；
+    取消时调用已注册的回调（如结束子进程），不必等到下一次检查。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def cancel(self):
+        """取消任务（可重复调用）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"取消回调出错: {e}")
+
+    def check(self):
+        """已取消时抛出DownloadCancelled"""
+        if self._event.is_set():
+            raise DownloadCancelled()
+
+    def register(self, callback):
+        """注册取消时调用的回调（已取消时立即调用），返回注销函数"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
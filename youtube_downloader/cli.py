@@ -0,0 +1,272 @@
+"""
+命令行模块 - 无界面运行下载与频道同步（适合计划任务定时执行）
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import yt_dlp
+from .config import config
+from .video_downloader import VideoDownloader
+from .ffmpeg_tools import FFmpegTools
+from .cache_manager import CacheManager
+from .postprocess_executor import PostProcessExecutor
+from .download_pipeline import DownloadPipeline
+from .download_archive import DownloadArchive
+from .multi_url import parse_url_list, guess_video_id
+from .extraction_pool import ExtractionWorkerPool, get_extraction_profile
+from .range_downloader import RangeDownloader
+from .bench_server import ThrottledRangeServer
+from .throttle_detector import ThrottleDetector
+
+
+# 命令行质量参数与界面质量选项的对应关系
+QUALITY_CHOICES = dict(zip(['best', '1080', '720', '480', 'audio'], VideoDownloader.GENERIC_QUALITY_OPTIONS))
+
+
+class _ImmediateRoot:
+    """代替Tk根窗口：after回调直接在当前线程执行"""
+
+    def after(self, ms, func=None, *args):
+        if func is not None:
+            func(*args)
+
+
+class _HeadlessGui:
+    """代替GuiInterface：界面刷新为空操作"""
+
+    def update_cache_button(self):
+        pass
+
+    def reset_thumbnail_display(self):
+        pass
+
+
+class HeadlessApp:
+    """命令行模式下的应用对象，提供与YouTubeDownloaderApp相同的组件属性"""
+
+    def __init__(self, quiet=False):
+        self.root = _ImmediateRoot()
+        self.quiet = quiet
+        self.download_paused = False
+        self.download_stage = "waiting"
+        self.video_file = None
+        self.audio_file = None
+        self.needs_merge = False
+        self._last_print = 0
+
+        self.gui = _HeadlessGui()
+        self.downloader = VideoDownloader(self)
+        self.ffmpeg = FFmpegTools(self)
+        self.cache_manager = CacheManager(self)
+        self.postprocessor = PostProcessExecutor(self)
+        self.pipeline = DownloadPipeline(self)
+        self.download_archive = DownloadArchive()
+        self.extraction_pool = ExtractionWorkerPool(self)
+
+    def update_progress(self, percentage, status_text):
+        """输出进度（限频，避免刷屏）"""
+        if self.quiet:
+            return
+        now = time.time()
+        if percentage >= 100 or now - self._last_print >= 1:
+            self._last_print = now
+            print(f"[{percentage:5.1f}%] {status_text}")
+
+    def update_cancel_button(self):
+        """命令行模式没有取消按钮（按Ctrl+C取消全部任务）"""
+        pass
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(prog="youtube_downloader", description="YouTube视频下载器命令行模式")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(sub):
+        sub.add_argument('urls', nargs='*', help="视频、播放列表或频道链接")
+        sub.add_argument('-a', '--batch-file', help="从文件读取链接（每行一个）")
+        sub.add_argument('-o', '--output', default=config.get("download_path"), help="保存目录")
+        sub.add_argument('-q', '--quality', choices=sorted(QUALITY_CHOICES), default='best', help="下载质量")
+        sub.add_argument('--quiet', action='store_true', help="不输出进度")
+
+    download = subparsers.add_parser('download', help="下载视频或整个列表")
+    add_common(download)
+    download.add_argument('--start', help="片段开始时间（如 1:30 或 90），只下载指定片段")
+    download.add_argument('--end', help="片段结束时间，留空表示到视频结尾")
+    add_common(subparsers.add_parser('sync', help="增量同步频道/播放列表，只下载新上传的视频"))
+
+    bench = subparsers.add_parser('benchmark', help="比较各提取方案的信息提取耗时")
+    bench.add_argument('urls', nargs='*', help="测试用视频链接")
+    bench.add_argument('-a', '--batch-file', help="从文件读取测试链接（每行一个）")
+    bench.add_argument('-p', '--profiles', nargs='+', help="要比较的提取方案（默认全部）")
+    bench.add_argument('-n', '--runs', type=int, default=3, help="每个链接每个方案的提取次数")
+
+    engine = subparsers.add_parser('benchmark-engine', help="在本地限速服务器上比较下载引擎的吞吐量")
+    engine.add_argument('--size', type=int, default=32, help="测试文件大小（MB）")
+    engine.add_argument('--rate', type=int, default=1024, help="服务器每个连接的限速（KB/s），0为不限速")
+    engine.add_argument('-c', '--connections', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="要测试的分段下载连接数")
+    engine.add_argument('--throttle-after', type=int, default=0,
+                        help="同一地址下载超过该大小（MB）后降为低速，用于测试限速检测与地址刷新")
+    return parser
+
+
+def read_urls(args):
+    """合并命令行和文件中的链接"""
+    urls = list(args.urls)
+    if args.batch_file:
+        with open(args.batch_file, 'r', encoding='utf-8', errors='ignore') as f:
+            urls.extend(f.read().split())
+    return parse_url_list("\n".join(urls))
+
+
+def run(argv=None):
+    """命令行入口，返回退出码"""
+    args = build_parser().parse_args(argv)
+    if args.command == 'benchmark-engine':
+        return _run_engine_benchmark(args)
+    if args.command != 'benchmark' and not os.path.isdir(args.output):
+        print(f"保存目录不存在: {args.output}")
+        return 2
+
+    urls = read_urls(args)
+    if not urls:
+        print("没有找到有效的链接")
+        return 2
+
+    app = HeadlessApp(quiet=getattr(args, 'quiet', True))
+    try:
+        if args.command == 'benchmark':
+            return _run_benchmark(app, args, urls)
+        return _run_downloads(app, args, urls)
+    finally:
+        app.extraction_pool.shutdown()
+
+
+def _run_benchmark(app, args, urls):
+    """对每个提取方案测量提取耗时、格式数量和返回数据大小"""
+    profile_names = args.profiles or list(config.get("extraction_profiles") or {"full": {}})
+    runs = max(1, args.runs)
+    app.extraction_pool.warm_up()
+
+    print(f"{'方案':<8}{'成功':>6}{'中位耗时':>10}{'最短耗时':>10}{'格式数':>8}{'数据大小':>10}")
+    for name in profile_names:
+        _, profile = get_extraction_profile(name)
+        latencies = []
+        formats = []
+        sizes = []
+        failed = 0
+        for url in urls:
+            for _ in range(runs):
+                start = time.time()
+                try:
+                    info = app.downloader._extract_with_profile(url, profile)
+                except Exception as e:
+                    failed += 1
+                    print(f"  ⚠️ [{name}] {url}: {str(e).splitlines()[0]}")
+                    continue
+                latencies.append(time.time() - start)
+                formats.append(len(info.get('formats') or []))
+                sizes.append(len(json.dumps(info)))
+
+        succeeded = f"{len(latencies)}/{len(latencies) + failed}"
+        if not latencies:
+            print(f"{name:<8}{succeeded:>6}{'-':>10}{'-':>10}{'-':>8}{'-':>10}")
+            continue
+        print(f"{name:<8}{succeeded:>6}{statistics.median(latencies):>9.2f}s{min(latencies):>9.2f}s"
+              f"{statistics.median(formats):>8.0f}{statistics.median(sizes) / 1024:>8.0f}KB")
+    return 0
+
+
+def _run_engine_benchmark(args):
+    """在本地按连接限速的Range服务器上比较yt-dlp内置下载和多连接分段下载"""
+    size = max(1, args.size) * 1024 * 1024
+    throttle_after = args.throttle_after * 1024 * 1024 or None
+    with ThrottledRangeServer(size, args.rate * 1024, throttle_after=throttle_after) as server, \
+            tempfile.TemporaryDirectory() as temp_dir:
+        print(f"📡 测速服务器: {server.url} ({args.size}MB, 每连接 {args.rate}KB/s)")
+        if throttle_after:
+            print(f"🐢 同一地址下载 {args.throttle_after}MB 后限速，分段下载会刷新地址继续")
+
+        # 每次测试使用新地址，互不影响地址限速计数
+        def run_ytdlp(path):
+            info = {'id': 'bench', 'title': 'bench', 'url': server.signed_url(), 'ext': 'mp4', 'protocol': 'http'}
+            with yt_dlp.YoutubeDL({'outtmpl': path, 'quiet': True, 'no_warnings': True,
+                                   'noprogress': True}) as ydl:
+                ydl.process_ie_result(info, download=True)
+
+        def run_native(connections):
+            return lambda path: RangeDownloader(
+                server.signed_url(), path, connections=connections,
+                throttle_detector=ThrottleDetector.from_config() if throttle_after else None,
+                url_refresher=lambda: (server.signed_url(), {})).download()
+
+        engines = [("yt-dlp", run_ytdlp)]
+        engines += [(f"native x{n}", run_native(n)) for n in args.connections]
+
+        print(f"{'引擎':<12}{'耗时':>10}{'吞吐量':>14}{'校验':>6}")
+        for index, (name, func) in enumerate(engines):
+            path = os.path.join(temp_dir, f"bench_{index}.mp4")
+            start = time.time()
+            try:
+                func(path)
+            except Exception as e:
+                print(f"{name:<12}{'-':>10}{'-':>14}{'-':>6}  ⚠️ {str(e).splitlines()[0]}")
+                continue
+            elapsed = max(time.time() - start, 0.001)
+            with open(path, 'rb') as f:
+                verified = "✓" if f.read() == server.payload else "✗"
+            print(f"{name:<12}{elapsed:>9.2f}s{size / elapsed / 1024 / 1024:>10.2f}MB/s{verified:>6}")
+    return 0
+
+
+def _run_downloads(app, args, urls):
+    """提交全部链接并等待下载完成"""
+    quality = QUALITY_CHOICES[args.quality]
+    try:
+        clip = app.downloader.parse_clip_range(getattr(args, 'start', None), getattr(args, 'end', None))
+    except Exception as e:
+        print(f"❌ {e}")
+        return 2
+    enumerators = []
+    submitted_ids = set()
+
+    for url in urls:
+        if app.downloader.is_playlist_url(url):
+            if clip:
+                print(f"⚠️ 片段下载只支持单个视频，已忽略: {url}")
+                continue
+            enumerators.append(app.pipeline.submit_playlist(url, args.output, quality, sync=(args.command == 'sync')))
+        elif args.command == 'sync':
+            print(f"⚠️ 同步只支持播放列表/频道链接，已忽略: {url}")
+        else:
+            # 同一视频的不同链接只下载一次
+            video_id = guess_video_id(url)
+            if video_id and video_id in submitted_ids:
+                continue
+            submitted_ids.add(video_id)
+            app.pipeline.submit(url, args.output, quality, clip=clip)
+
+    # 等待列表枚举结束后再等待全部任务完成
+    try:
+        for enumerator in enumerators:
+            enumerator.join()
+        app.pipeline.wait_all()
+    except KeyboardInterrupt:
+        # 取消全部任务，等待各阶段结束子进程并保存续传状态
+        print("⏹️ 正在取消全部任务...")
+        app.pipeline.cancel_all()
+        app.pipeline.wait_all(timeout=15)
+        return 130
+
+    summary = app.pipeline.get_summary()
+    print(f"📦 完成 {summary['completed']}/{summary['total']}，失败 {summary['failed']}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
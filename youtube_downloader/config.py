@@ -26,8 +26,60 @@ class Config:
             "theme": "default",
             "language": "zh-CN",
             "max_concurrent_downloads": 3,
+            "max_concurrent_extractions": 4,
+            "per_host_extractions": 2,
+            "extraction_workers": 2,  # 信息提取进程数
+            "extraction_worker_max_jobs": 50,  # 每个提取进程处理多少次后回收
+            "extraction_timeout": 20,  # 单次信息提取超时（秒），超时后结束提取进程
+            "info_cache_ttl": 60,  # 刚提取过的视频信息在多少秒内直接复用
+            "extraction_profile": "fast",  # 信息提取方案，见extraction_profiles
+            "extraction_profiles": {
+                # 精简方案：只用一个播放器客户端，跳过点播用不到的DASH/HLS清单，丢弃不显示的字段
+                "fast": {
+                    "extractor_args": {"youtube": {"player_client": ["tv"], "skip": ["dash", "hls", "translated_subs"]}},
+                    "drop_fields": ["tags", "categories", "chapters", "release_date", "playable_in_embed"]
+                },
+                # 完整方案：yt-dlp默认设置（直播或精简方案失败时使用）
+                "full": {}
+            },
+            "concurrent_fragment_downloads": 4,  # HLS/DASH分片并发数（自适应时为初始值）
+            "adaptive_fragment_concurrency": True,  # 按吞吐量和错误率自动调整分片并发
+            "max_fragment_concurrency": 16,
+            # 各协议使用的下载后端，如{"https": "native"}：native（内置多连接分段下载）、aria2c（需已安装）、ytdlp；
+            # 未列出的协议使用yt-dlp
+            "download_backends": {},
+            "native_download_connections": 4,  # 分段下载的并行连接数
+            "aria2c_path": "",  # 留空在PATH中查找aria2c
+            "aria2c_connections": 8,  # aria2c每个文件的连接数
+            "aria2c_file_allocation": "falloc",  # aria2c预分配方式（falloc/prealloc/trunc/none），文件系统不支持falloc时改为none
+            "disk_space_margin_mb": 200,  # 下载前检查磁盘空间时额外保留的余量
+            "stage_on_target_volume": True,  # 缓存目录与下载目录不在同一文件系统时，在下载目录的隐藏目录中暂存，完成时只需重命名
+            "cancelled_session_policy": "keep",  # 取消的下载：keep保留已下载部分（再次下载同一视频同一清晰度时续传），clean删除
+            "record_content_hash": True,  # 在下载记录中保存文件的内容哈希（只在下载或跨盘复制时顺带计算，合并的视频记录输入流的哈希），供去重和完整性检查
+            "throttle_detection": True,  # 下载速度相对自身历史持续骤降时刷新地址或换用等效格式
+            "throttle_drop_ratio": 0.3,  # 速度低于历史中位数的该比例视为骤降
+            "throttle_sustain_seconds": 8,  # 骤降持续多少秒判定为被限速
+            "throttle_max_refreshes": 2,  # 每个格式最多刷新几次下载地址，之后换用等效格式
+            "download_retries": 5,  # yt-dlp内部的请求/分片重试次数
+            "retry_max_attempts": 4,  # 提取或下载遇到网络、限流等可重试错误时的最多尝试次数
+            "retry_backoff_base": 1.0,  # 退避等待基数（秒），每次重试翻倍并加随机抖动
+            "retry_backoff_max": 60,  # 单次退避等待上限（秒）
+            "circuit_failure_threshold": 5,  # 同一主机连续失败多少次后暂停所有任务对它的请求
+            "circuit_cooldown_seconds": 30,  # 暂停时长，恢复试探失败时加倍
+            "circuit_cooldown_max": 300,
+            "clip_accurate_cuts": False,  # 片段下载是否在切点重新编码以精确切割（默认按关键帧切割）
+            "max_concurrent_merges": 0,  # 0表示根据CPU和I/O负载自动决定
+            "sync_stop_after_known": 3,  # 增量同步时连续遇到几个已下载视频即停止
             "ffmpeg_path": "",
+            "ffmpeg_download_url": "",  # 留空使用当前系统的默认静态编译版本
+            "ffmpeg_sha256": "",  # 配置后下载完整压缩包并校验
+            "ffmpeg_download_connections": 4,
+            "thumbnail_memory_cache_size": 128,
+            "stream_store_max_age_hours": 72,  # 已下载的音视频流保留多久供其它清晰度复用
             "proxy": "",
+            "proxies": [],  # 代理池（如 http://host:port、socks5://host:port），按健康度和吞吐量分配给各任务
+            "proxy_cooldown_seconds": 60,  # 代理连续失败后暂停使用的时长（多次暂停时加长）
+            "http_pool_sizes": {"i.ytimg.com": 16, "objects.githubusercontent.com": 8},
             "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
         }
         self.settings = self.load_settings()
@@ -38,9 +90,13 @@ class Config:
             if os.path.exists(self.config_file):
                 with open(self.config_file, 'r', encoding='utf-8') as f:
                     loaded_settings = json.load(f)
-                # 合并默认设置和加载的设置
+                # 合并默认设置和加载的设置；字典类型的设置逐项合并，旧配置文件也能获得新增的子项
                 settings = self.default_settings.copy()
-                settings.update(loaded_settings)
+                for key, value in loaded_settings.items():
+                    default = settings.get(key)
+                    if isinstance(default, dict) and isinstance(value, dict):
+                        value = dict(default, **value)
+                    settings[key] = value
                 return settings
         except Exception as e:
             print(f"配置文件加载失败: {e}")
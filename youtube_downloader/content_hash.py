@@ -0,0 +1,85 @@
+"""
+内容哈希模块 - 在下载或复制文件的过程中按块增量计算内容哈希，记录到下载记录中供去重和完整性检查
+"""
+import os
+import hashlib
+import threading
+
+
+BLOCK_SIZE = 1024 * 1024
+# 写入下载记录的哈希算法标识（块大小变化时哈希值不可比较）
+HASH_ALGORITHM = "sha256-blocks-1m"
+
+
+class BlockHasher:
+    """分块内容哈希
+
+    文件按1MB分块，各块的SHA-256按顺序拼接后再取SHA-256，多连接乱序写入时每块仍可各自增量计算。
+    没有从块首顺序经过update()的块（续传前已下载、写入边界未对齐）视为缺失：digest()返回None，
+    finish()从磁盘补读。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 块序号 -> 完整块的摘要(bytes)、计算中的[哈希对象, 已计算字节数]，或None表示需要补读
+        self._blocks = {}
+
+    def update(self, offset, data):
+        """记录写入到offset处的数据"""
+        view = memoryview(data)
+        position = 0
+        with self._lock:
+            while position < len(view):
+                index, block_offset = divmod(offset + position, BLOCK_SIZE)
+                length = min(len(view) - position, BLOCK_SIZE - block_offset)
+                state = self._blocks.get(index)
+                if block_offset == 0:
+                    # 从块首写入（首次写入、重写或复制时补齐缺失的块）：以新数据为准
+                    state = self._blocks[index] = [hashlib.sha256(), 0]
+                if isinstance(state, list) and state[1] == block_offset:
+                    state[0].update(view[position:position + length])
+                    state[1] += length
+                    if state[1] == BLOCK_SIZE:
+                        self._blocks[index] = state[0].digest()
+                else:
+                    self._blocks[index] = None
+                position += length
+
+    def _block_digest(self, index, length):
+        """已完整计算的块摘要，缺失时返回None（调用方持有锁）"""
+        state = self._blocks.get(index)
+        if isinstance(state, bytes) and length == BLOCK_SIZE:
+            return state
+        if isinstance(state, list) and state[1] == length:
+            return state[0].digest()
+        return None
+
+    def digest(self, size):
+        """所有数据都经过update()时返回size字节文件的内容哈希（十六进制），有缺失的块时返回None，不读取文件"""
+        digests = []
+        with self._lock:
+            for index in range((size + BLOCK_SIZE - 1) // BLOCK_SIZE):
+                digest = self._block_digest(index, min(BLOCK_SIZE, size - index * BLOCK_SIZE))
+                if digest is None:
+                    return None
+                digests.append(digest)
+        return hashlib.sha256(b''.join(digests)).hexdigest()
+
+    def finish(self, path):
+        """补读缺失的块，返回文件的内容哈希（十六进制）"""
+        size = os.path.getsize(path)
+        digests = []
+        with self._lock, open(path, 'rb') as f:
+            for index in range((size + BLOCK_SIZE - 1) // BLOCK_SIZE):
+                length = min(BLOCK_SIZE, size - index * BLOCK_SIZE)
+                digest = self._block_digest(index, length)
+                if digest is None:
+                    f.seek(index * BLOCK_SIZE)
+                    digest = hashlib.sha256(f.read(length)).digest()
+                digests.append(digest)
+        return hashlib.sha256(b''.join(digests)).hexdigest()
+
+
+def hash_file(path):
+    """读取整个文件计算内容哈希（完整性检查时使用）"""
+    return BlockHasher().finish(path)
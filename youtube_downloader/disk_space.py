@@ -0,0 +1,81 @@
+"""
+磁盘空间模块 - 下载前按预估大小检查缓存盘和目标盘的剩余空间，并为排队中的任务预留空间
+"""
+import os
+import errno
+import shutil
+import threading
+from .config import config
+
+
+def get_volume_key(path):
+    """路径所在的卷（不存在的路径取最近的已存在上级目录）"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    try:
+        return os.stat(path).st_dev, path
+    except OSError:
+        return path, path
+
+
+class InsufficientDiskSpace(OSError):
+    """剩余空间不足以完成下载（按磁盘错误分类，不重试）"""
+
+
+class DiskSpaceReserver:
+    """磁盘空间预留
+
+    每个任务在开始下载前按卷登记预计要写入的字节数，检查时扣除其它任务尚未写入的预留，
+    避免多个排队任务各自检查都通过、最后一起写满磁盘。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reservations = {}  # 任务 -> {卷: (路径, 字节数)}
+
+    def _reserved_on(self, volume, exclude=None):
+        return sum(needs[volume][1] for job, needs in self._reservations.items()
+                   if job is not exclude and volume in needs)
+
+    def reserve(self, job, needs):
+        """按[(路径, 字节数)]为任务预留空间，任一卷空间不足时抛出InsufficientDiskSpace"""
+        margin = int(config.get("disk_space_margin_mb", 200)) * 1024 * 1024
+        by_volume = {}
+        for path, size in needs:
+            if not size:
+                continue
+            volume, existing = get_volume_key(path)
+            previous = by_volume.get(volume, (existing, 0))
+            by_volume[volume] = (previous[0], previous[1] + int(size))
+
+        with self._lock:
+            for volume, (path, size) in by_volume.items():
+                try:
+                    free = shutil.disk_usage(path).free
+                except OSError:
+                    continue
+                others = self._reserved_on(volume, exclude=job)
+                if free - others < size + margin:
+                    raise InsufficientDiskSpace(
+                        errno.ENOSPC, f"磁盘空间不足: {path} 剩余 {free / 1024 ** 3:.2f}GB，"
+                            f"本任务需要约 {size / 1024 ** 3:.2f}GB"
+                            + (f"，其它排队任务已预留 {others / 1024 ** 3:.2f}GB" if others else ""))
+            self._reservations[job] = by_volume
+
+    def shrink(self, job, path, size):
+        """任务已把部分数据写入磁盘后，减少该路径所在卷的预留"""
+        volume, _ = get_volume_key(path)
+        with self._lock:
+            needs = self._reservations.get(job)
+            if needs and volume in needs:
+                existing, reserved = needs[volume]
+                needs[volume] = (existing, max(0, reserved - int(size)))
+
+    def release(self, job):
+        """任务结束（完成或失败），释放全部预留"""
+        with self._lock:
+            self._reservations.pop(job, None)
@@ -0,0 +1,160 @@
+"""
+下载记录模块 - 持久化记录已下载的视频及各频道/播放列表的同步进度
+"""
+import os
+import json
+import time
+import threading
+from .config import config
+from .content_hash import hash_file, HASH_ALGORITHM
+
+
+class DownloadArchive:
+    """下载记录（JSON文件，与设置文件放在同一目录）"""
+
+    def __init__(self, archive_file=None):
+        self.archive_file = archive_file or os.path.join(
+            os.path.dirname(config.config_file), "download_archive.json")
+        self._lock = threading.RLock()
+        self._data = self._load()
+
+    def _load(self):
+        """加载下载记录"""
+        try:
+            if os.path.exists(self.archive_file):
+                with open(self.archive_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                data.setdefault('videos', {})
+                data.setdefault('collections', {})
+                return data
+        except Exception as e:
+            print(f"下载记录加载失败: {e}")
+        return {'videos': {}, 'collections': {}}
+
+    def save(self):
+        """原子写入下载记录"""
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.archive_file), exist_ok=True)
+                temp_file = self.archive_file + ".tmp"
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, ensure_ascii=False)
+                os.replace(temp_file, self.archive_file)
+                return True
+            except Exception as e:
+                print(f"下载记录保存失败: {e}")
+                return False
+
+    # ------------------------------------------------
+    # 视频记录
+    # ------------------------------------------------
+
+    def is_downloaded(self, video_id):
+        """视频是否已下载过"""
+        if not video_id:
+            return False
+        with self._lock:
+            return video_id in self._data['videos']
+
+    def get_video(self, video_id):
+        """获取视频的下载记录"""
+        with self._lock:
+            record = self._data['videos'].get(video_id)
+            return dict(record) if record else None
+
+    def record_download(self, video_id, title, path, quality, collection=None,
+                        upload_date=None, **extra):
+        """记录一次完成的下载"""
+        if not video_id:
+            return
+        with self._lock:
+            record = {
+                'title': title,
+                'path': path,
+                'quality': quality,
+                'completed_time': time.time(),
+            }
+            if upload_date:
+                record['upload_date'] = upload_date
+            record.update(extra)
+            self._data['videos'][video_id] = record
+
+            # 水位线由mark_synced在整次同步成功后推进，单个视频完成时只记入已知列表
+            if collection:
+                entry = self._get_collection_entry(collection)
+                if video_id not in entry['known_ids']:
+                    entry['known_ids'].append(video_id)
+                if video_id in entry.get('pending_ids', []):
+                    entry['pending_ids'].remove(video_id)
+            self.save()
+
+    def find_by_hash(self, content_hash):
+        """按内容哈希查找已下载的视频（用于去重），返回[(视频ID, 记录)]
+
+        合并的视频没有记录结果文件的哈希，按其输入流（stream_hashes）的哈希匹配。
+        """
+        if not content_hash:
+            return []
+        with self._lock:
+            return [(video_id, dict(record)) for video_id, record in self._data['videos'].items()
+                    if record.get('content_hash') == content_hash
+                    or content_hash in (record.get('stream_hashes') or {}).values()]
+
+    def check_integrity(self, video_id):
+        """检查已下载文件是否完好：大小不符直接判定损坏，否则比较内容哈希；没有记录哈希时返回None"""
+        record = self.get_video(video_id)
+        if not record or not record.get('content_hash'):
+            return None
+        if record.get('hash_algorithm') != HASH_ALGORITHM:
+            return None
+        path = record.get('path')
+        if not path or not os.path.exists(path) or os.path.getsize(path) != record.get('size'):
+            return False
+        return hash_file(path) == record['content_hash']
+
+    # ------------------------------------------------
+    # 频道/播放列表同步记录
+    # ------------------------------------------------
+
+    def _get_collection_entry(self, collection_url):
+        """获取（或创建）频道/播放列表的同步记录"""
+        collections = self._data['collections']
+        if collection_url not in collections:
+            collections[collection_url] = {'known_ids': [], 'watermark': None, 'last_sync': None}
+        return collections[collection_url]
+
+    def get_collection(self, collection_url):
+        """获取同步记录的副本：known_ids为集合，watermark为最新已下载的上传日期"""
+        with self._lock:
+            entry = self._data['collections'].get(collection_url)
+            if not entry:
+                return {'known_ids': set(), 'pending_ids': set(), 'watermark': None, 'last_sync': None}
+            return {
+                'known_ids': set(entry['known_ids']),
+                'pending_ids': set(entry.get('pending_ids', [])),
+                'watermark': entry.get('watermark'),
+                'last_sync': entry.get('last_sync'),
+            }
+
+    def is_known(self, collection_url, video_id, collection=None):
+        """视频是否已属于该频道的已下载记录（或全局已下载）"""
+        if self.is_downloaded(video_id):
+            return True
+        collection = collection or self.get_collection(collection_url)
+        return video_id in collection['known_ids']
+
+    def mark_synced(self, collection_url, upload_dates=(), pending_ids=()):
+        """记录一次同步的结果
+
+        本次同步的任务全部成功时，才把水位线推进到本次下载的最新上传日期并记录同步时间；
+        有任务失败或取消时只记下这些视频，水位线不动，下次同步会重新下载它们。
+        """
+        with self._lock:
+            entry = self._get_collection_entry(collection_url)
+            entry['pending_ids'] = sorted(set(pending_ids))
+            if not pending_ids:
+                latest = max((date for date in upload_dates if date), default=None)
+                if latest and latest > (entry.get('watermark') or ''):
+                    entry['watermark'] = latest
+                entry['last_sync'] = time.time()
+            self.save()
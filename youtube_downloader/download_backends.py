@@ -0,0 +1,268 @@
+"""
+下载后端模块 - 传输阶段可由yt-dlp、内置多连接分段下载或aria2c执行，按协议在配置中选择
+"""
+import os
+import re
+import copy
+import time
+import shutil
+import subprocess
+import yt_dlp
+from yt_dlp.utils import download_range_func
+from .config import config
+from .multi_url import get_host_key
+from .range_downloader import RangeDownloader
+from .throttle_detector import StreamThrottled
+from .fragment_concurrency import DownloadLogger
+from .retry_policy import compute_backoff
+from .content_hash import BlockHasher
+
+
+def is_progressive(fmt):
+    """是否为单一地址的http/https渐进式格式"""
+    return (fmt is not None and fmt.get('protocol') in ('http', 'https') and bool(fmt.get('url'))
+            and not fmt.get('fragments') and not fmt.get('requested_formats'))
+
+
+class DownloadBackend:
+    """下载后端基类
+
+    download()把一个格式下载到outtmpl（%(ext)s替换为格式扩展名），返回文件路径；
+    进度以yt-dlp进度字典的格式传给hook，持续限速时抛出StreamThrottled。
+    """
+
+    name = None
+
+    def __init__(self, parent):
+        self.parent = parent  # VideoDownloader
+
+    def is_available(self):
+        """后端当前是否可用"""
+        return True
+
+    def supports(self, fmt):
+        """是否能下载该格式（fmt为None表示由yt-dlp按选择器决定格式）"""
+        return is_progressive(fmt)
+
+    def download(self, job, fmt, format_selector, outtmpl, hook, detector=None, url_refresher=None):
+        raise NotImplementedError
+
+    def discard(self, fmt, outtmpl):
+        """删除未完成的下载文件；改用其它后端前调用，避免对方把不完整的文件当作已下载（或续传）"""
+
+    def _target(self, fmt, outtmpl):
+        return outtmpl.replace('%(ext)s', fmt.get('ext') or 'mp4')
+
+    def _report(self, hook, filename, downloaded, total, speed):
+        """按yt-dlp的格式报告下载进度"""
+        hook({
+            'status': 'downloading',
+            'filename': filename,
+            'downloaded_bytes': downloaded,
+            'total_bytes': total,
+            'speed': speed,
+            'eta': (total - downloaded) / speed if speed and total else None,
+        })
+
+
+class YtdlpBackend(DownloadBackend):
+    """yt-dlp内置下载器，支持所有协议、按选择器下载和片段下载"""
+
+    name = "ytdlp"
+
+    def supports(self, fmt):
+        return True
+
+    def download(self, job, fmt, format_selector, outtmpl, hook, detector=None, url_refresher=None):
+        """HLS/DASH分片格式按主机的自适应并发数并行下载分片，结束后把吞吐量和重试情况反馈给控制器"""
+        finished = []
+        stats = {'start': None, 'bytes': 0, 'fragments': 0}
+
+        def progress_hook(d):
+            if d.get('status') == 'downloading':
+                if stats['start'] is None:
+                    stats['start'] = time.time()
+                stats['bytes'] = d.get('downloaded_bytes') or stats['bytes']
+                stats['fragments'] = d.get('fragment_count') or stats['fragments']
+                if detector is not None and d.get('downloaded_bytes') and detector.update(d['downloaded_bytes']):
+                    raise StreamThrottled("下载速度持续过低，疑似被限速")
+            elif d.get('status') == 'finished':
+                finished.append(d.get('filename'))
+            hook(d)
+
+        controller = self.parent.fragment_controller
+        host = get_host_key(job.url)
+        concurrency = controller.get_concurrency(host)
+        logger = DownloadLogger()
+        ydl_opts = {
+            'format': format_selector,
+            'outtmpl': outtmpl,
+            'progress_hooks': [progress_hook],
+            'logger': logger,
+            'concurrent_fragment_downloads': concurrency,
+            'socket_timeout': 20,  # 添加20秒网络超时
+            'retries': config.get("download_retries", 5),
+            'fragment_retries': config.get("download_retries", 5),
+            # yt-dlp内部重试同样使用带抖动的指数退避
+            'retry_sleep_functions': {'http': lambda n: compute_backoff(n),
+                                      'fragment': lambda n: compute_backoff(n)},
+        }
+        if job.proxy:
+            ydl_opts['proxy'] = job.proxy
+        if job.clip:
+            # 只下载指定时间范围；默认按关键帧切割（不重新编码），可配置为精确切割
+            ydl_opts['download_ranges'] = download_range_func(None, [job.clip])
+            ydl_opts['force_keyframes_at_cuts'] = bool(config.get("clip_accurate_cuts", False))
+
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                if job.info is not None and job.info.raw and job.info.formats:
+                    # 复用提取阶段的信息，避免每个流都重新解析一次页面
+                    ydl.process_ie_result(copy.deepcopy(job.info.raw), download=True)
+                else:
+                    ydl.download([job.url])
+        finally:
+            if stats['fragments'] and stats['start']:
+                elapsed = max(time.time() - stats['start'], 0.001)
+                controller.report(host, concurrency, stats['bytes'] / elapsed,
+                                  stats['fragments'], logger.retries, logger.throttled)
+        return finished[-1] if finished else None
+
+
+class NativeRangeBackend(DownloadBackend):
+    """内置多连接分段下载（渐进式格式），限速时原地换用刷新后的地址"""
+
+    name = "native"
+
+    def download(self, job, fmt, format_selector, outtmpl, hook, detector=None, url_refresher=None):
+        target = self._target(fmt, outtmpl)
+        # 沿用yt-dlp对该格式的分块大小（过大的区间请求会被限速）
+        chunk_size = (fmt.get('downloader_options') or {}).get('http_chunk_size')
+        hasher = BlockHasher() if config.get("record_content_hash", True) else None
+        downloader = RangeDownloader(
+            fmt['url'], target, headers=fmt.get('http_headers'),
+            connections=config.get("native_download_connections", 4),
+            expected_size=fmt.get('filesize'), max_chunk_size=chunk_size,
+            progress_callback=lambda downloaded, total, speed: self._report(hook, target, downloaded, total, speed),
+            throttle_detector=detector, url_refresher=url_refresher, proxy=job.proxy, hasher=hasher)
+        downloader.download()
+        if hasher is not None:
+            job.stream_hashers[target] = hasher
+        hook({'status': 'finished', 'filename': target})
+        return target
+
+    def discard(self, fmt, outtmpl):
+        # 预分配的.native.part中未下载的部分全是空洞
+        RangeDownloader.discard(self._target(fmt, outtmpl))
+
+
+class Aria2cBackend(DownloadBackend):
+    """调用外部aria2c多连接下载（渐进式格式），从其控制台输出解析进度
+
+    限速时结束aria2c并抛出StreamThrottled，刷新地址后重新调用时aria2c按控制文件续传。
+    """
+
+    name = "aria2c"
+
+    # 控制台进度行，如: [#2089b0 12MiB/100MiB(12%) CN:8 DL:3.2MiB ETA:27s]
+    PROGRESS_PATTERN = re.compile(
+        r'\[#\w+\s+([\d.]+)(\w+)/([\d.]+)(\w+)\(\d+%\)(?:\s+CN:\d+)?(?:\s+DL:([\d.]+)(\w+))?')
+    UNITS = {'B': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4}
+
+    def get_executable(self):
+        """aria2c路径：优先使用配置的路径，其次在PATH中查找"""
+        configured = config.get("aria2c_path", "")
+        if configured and os.path.isfile(configured):
+            return configured
+        return shutil.which('aria2c')
+
+    def is_available(self):
+        return self.get_executable() is not None
+
+    def _to_bytes(self, value, unit):
+        return int(float(value) * self.UNITS.get(unit, 1))
+
+    def download(self, job, fmt, format_selector, outtmpl, hook, detector=None, url_refresher=None):
+        if job.proxy and not job.proxy.startswith(('http://', 'https://')):
+            raise Exception(f"aria2c只支持HTTP代理: {job.proxy}")
+        target = self._target(fmt, outtmpl)
+        connections = str(max(1, int(config.get("aria2c_connections", 8))))
+        cmd = [self.get_executable(), '--continue=true', '--auto-file-renaming=false',
+               '--allow-overwrite=true', f'--file-allocation={config.get("aria2c_file_allocation", "falloc")}',
+               '--enable-color=false',
+               '--summary-interval=1', '--console-log-level=warn', '--download-result=hide',
+               '-x', connections, '-s', connections, '-k', '1M',
+               '-d', os.path.dirname(target) or '.', '-o', os.path.basename(target)]
+        for key, value in (fmt.get('http_headers') or {}).items():
+            cmd.append(f'--header={key}: {value}')
+        if job.proxy:
+            cmd.append(f'--all-proxy={job.proxy}')
+        cmd.append(fmt['url'])
+
+        # 创建startupinfo以隐藏命令行窗口
+        startupinfo = None
+        if os.name == 'nt':  # Windows系统
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            startupinfo.wShowWindow = subprocess.SW_HIDE
+
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   startupinfo=startupinfo)
+        # 取消时立即结束aria2c，不必等下一行进度输出
+        unregister = job.cancel_token.register(process.terminate)
+        output_tail = []
+        try:
+            self._read_progress(process, target, hook, detector, output_tail)
+            returncode = process.wait()
+        finally:
+            unregister()
+            if process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        job.cancel_token.check()
+
+        if returncode != 0 or not os.path.exists(target):
+            detail = " ".join(output_tail[-3:])
+            raise Exception(f"aria2c下载失败（返回码{returncode}）: {detail}")
+        size = os.path.getsize(target)
+        self._report(hook, target, size, size, None)
+        hook({'status': 'finished', 'filename': target})
+        return target
+
+    def discard(self, fmt, outtmpl):
+        # aria2c直接写入（并预分配）目标文件，yt-dlp看到目标文件存在会当作已下载完成
+        target = self._target(fmt, outtmpl)
+        for path in (target + '.aria2', target):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"删除aria2c未完成的文件失败: {e}")
+
+    def _read_progress(self, process, target, hook, detector, output_tail):
+        """逐行读取aria2c输出（进度行以\\r或\\n结尾）并转换为进度回调"""
+        buffer = b''
+        while True:
+            data = process.stdout.read1(4096) if hasattr(process.stdout, 'read1') else process.stdout.read(4096)
+            if not data:
+                break
+            buffer += data
+            *lines, buffer = re.split(rb'[\r\n]', buffer)
+            for raw_line in lines:
+                line = raw_line.decode('utf-8', errors='ignore').strip()
+                if not line:
+                    continue
+                match = self.PROGRESS_PATTERN.search(line)
+                if not match:
+                    output_tail.append(line)
+                    del output_tail[:-10]
+                    continue
+                downloaded = self._to_bytes(match.group(1), match.group(2))
+                total = self._to_bytes(match.group(3), match.group(4))
+                speed = self._to_bytes(match.group(5), match.group(6)) if match.group(5) else None
+                self._report(hook, target, downloaded, total, speed)
+                if detector is not None and detector.update(downloaded):
+                    raise StreamThrottled("下载速度持续过低，疑似被限速")
@@ -0,0 +1,330 @@
+"""
+批量下载流水线模块 - 将提取、传输、合并、移动拆分为独立阶段并行执行
+"""
+import queue
+import threading
+import time
+from .config import config
+from .cancellation import CancelToken
+
+
+class DownloadJob:
+    """单个下载任务的状态"""
+
+    def __init__(self, url, download_path, quality, on_progress=None, clip=None, cancel_token=None):
+        self.url = url
+        self.download_path = download_path
+        self.quality = quality
+        self.on_progress = on_progress  # 回调: on_progress(job, percentage, status_text)
+        self.clip = clip  # 片段下载的(开始秒, 结束秒)，None表示下载完整视频
+
+        self.collection = None  # 所属的播放列表/频道链接
+
+        # 提取阶段填充
+        self.info = None
+        self.video_id = None
+        self.upload_date = None
+        self.title = None
+        self.clean_title = None
+        self.final_filename = None
+        self.final_path = None
+        self.needs_merge = False
+        self.session_id = None
+        self.session_dir = None
+
+        # 传输/合并阶段填充
+        self.video_file = None
+        self.audio_file = None
+        self.merged = False
+        self.proxy = None  # 传输期间固定使用的代理，None为直接连接
+        self.stream_hashers = {}  # 下载时已同时计算内容哈希的文件 -> BlockHasher
+        self.content_hash = None
+        self.stream_hashes = {}  # 合并任务的输入流内容哈希 {'video': ..., 'audio': ...}
+
+        # 每个任务独立的大小缓存，避免并行任务互相覆盖
+        self.prefetched_sizes = {}
+        self.cached_total_bytes = {}
+
+        self.stage = "pending"
+        self.progress = 0
+        self.error = None
+        self.cancel_token = cancel_token or CancelToken()
+        self.created_time = time.time()
+        self.finished_time = None
+        self._done = threading.Event()
+
+    @property
+    def display_name(self):
+        """用于进度显示的任务名称"""
+        return self.title or self.url
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.cancelled
+
+    def cancel(self):
+        """取消任务：正在进行的提取、传输、合并立即结束，排队中的阶段直接跳过"""
+        self.cancel_token.cancel()
+
+    def done(self):
+        """任务是否已结束（成功、失败或取消）"""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """等待任务结束"""
+        return self._done.wait(timeout)
+
+
+class DownloadPipeline:
+    """下载流水线：各阶段拥有独立的工作线程，通过有界队列衔接
+
+    网络传输与FFmpeg合并交错进行，任务N合并时任务N+1已经在下载。
+    """
+
+    STAGES = ("extract", "transfer", "merge", "move")
+
+    def __init__(self, parent, queue_size=2, playlist_lookahead=4):
+        self.parent = parent
+        self.queue_size = queue_size
+        self.playlist_lookahead = playlist_lookahead
+        self._queues = {}
+        self._workers = []
+        self._started = False
+        self._lock = threading.Lock()
+        self.jobs = []
+        self._enumerations = []  # 正在枚举的列表的取消令牌
+
+    def _get_stage_workers(self):
+        """各阶段的工作线程数"""
+        max_downloads = max(1, int(config.get("max_concurrent_downloads", 3) or 1))
+        merge_limit = self.parent.postprocessor.get_concurrency_limit()
+        return {
+            "extract": 2,
+            "transfer": max_downloads,
+            "merge": max(2, merge_limit),
+            # 跨文件系统复制较慢，多一个线程使其它任务的重命名不必排在后面
+            "move": 2,
+        }
+
+    def _ensure_started(self):
+        """首次提交任务时启动各阶段工作线程"""
+        with self._lock:
+            if self._started:
+                return
+            # 提取队列不设上限（只是URL），后续阶段用有界队列形成背压，
+            # 避免提前提取过多任务导致签名URL过期
+            self._queues["extract"] = queue.Queue()
+            self._queues["transfer"] = queue.Queue(maxsize=self.queue_size)
+            self._queues["merge"] = queue.Queue(maxsize=self.queue_size)
+            self._queues["move"] = queue.Queue(maxsize=self.queue_size)
+
+            for stage, count in self._get_stage_workers().items():
+                for index in range(count):
+                    worker = threading.Thread(target=self._stage_worker, args=(stage,),
+                                              name=f"pipeline-{stage}-{index}", daemon=True)
+                    worker.start()
+                    self._workers.append(worker)
+            self._started = True
+
+    def submit(self, url, download_path, quality, info=None, clip=None):
+        """提交下载任务，返回DownloadJob"""
+        self._ensure_started()
+        job = DownloadJob(url, download_path, quality, on_progress=self._on_job_progress, clip=clip)
+        job.info = info
+        # 排队较深的任务轮到时格式地址多半已过期，只保留紧凑信息，到时重新提取
+        if info is not None and self._queues["extract"].qsize() >= self.playlist_lookahead:
+            info.release_raw()
+        with self._lock:
+            self.jobs.append(job)
+        self._queues["extract"].put(job)
+        self.parent.root.after(0, self.parent.update_cancel_button)
+        return job
+
+    def submit_playlist(self, url, download_path, quality, sync=False):
+        """边枚举播放列表/频道边提交下载任务，返回枚举线程
+
+        sync=True时为增量同步：遇到连续若干个已下载的视频，或上传日期早于
+        上次同步的水位线时停止枚举，不再列出整个频道。
+        """
+        self._ensure_started()
+        archive = self.parent.download_archive
+        stop_after_known = max(1, int(config.get("sync_stop_after_known", 3) or 1))
+        cancel_token = CancelToken()
+        with self._lock:
+            self._enumerations.append(cancel_token)
+
+        def enumerate_thread():
+            count = 0
+            skipped = 0
+            known_streak = 0
+            submitted = []
+            completed_enumeration = False
+            collection = archive.get_collection(url) if sync else None
+            entries = self.parent.downloader.iter_playlist_entries(url)
+            try:
+                for entry in entries:
+                    if cancel_token.cancelled:
+                        print(f"⏹️ 已取消，停止枚举: {url}")
+                        break
+                    if archive.is_known(url, entry.get('id'), collection):
+                        skipped += 1
+                        known_streak += 1
+                        # 置顶视频等会打乱顺序，连续命中多个才认为到达已同步部分；
+                        # 上次同步有失败的视频时继续往下找，直到水位线
+                        if sync and known_streak >= stop_after_known and not collection['pending_ids']:
+                            print(f"🔄 已到达上次同步位置，停止枚举: {url}")
+                            break
+                        continue
+                    known_streak = 0
+
+                    watermark = collection['watermark'] if collection else None
+                    if sync and watermark and entry.get('upload_date') and entry['upload_date'] < watermark:
+                        print(f"🔄 上传日期早于水位线 {watermark}，停止枚举: {url}")
+                        break
+
+                    # 只预先排入少量任务，列表再长也不会一次性展开
+                    while self._queues["extract"].qsize() >= self.playlist_lookahead and not cancel_token.cancelled:
+                        time.sleep(0.2)
+                    if cancel_token.cancelled:
+                        continue
+                    job = self.submit(entry['url'], download_path, quality)
+                    job.title = entry.get('title')
+                    job.collection = url
+                    submitted.append((entry.get('id'), job))
+                    count += 1
+                completed_enumeration = not cancel_token.cancelled
+            except Exception as e:
+                print(f"❌ 列表枚举失败: {e}")
+            finally:
+                entries.close()
+                with self._lock:
+                    self._enumerations.remove(cancel_token)
+            print(f"📃 列表枚举完成: 共加入 {count} 个视频，跳过已下载 {skipped} 个")
+
+            if sync and completed_enumeration:
+                # 等本次同步的任务全部结束后再记录同步结果，失败或取消的视频下次重试
+                for _, job in submitted:
+                    job.wait()
+                pending_ids = [video_id or job.video_id or job.url for video_id, job in submitted
+                               if job.error or job.stage == "cancelled"]
+                archive.mark_synced(url, upload_dates=[job.upload_date for _, job in submitted],
+                                    pending_ids=pending_ids)
+                if pending_ids:
+                    print(f"⚠️ 同步中有 {len(pending_ids)} 个视频未完成，下次同步时重试: {url}")
+
+        thread = threading.Thread(target=enumerate_thread, daemon=True)
+        thread.start()
+        return thread
+
+    def _stage_worker(self, stage):
+        """阶段工作线程主循环"""
+        downloader = self.parent.downloader
+        stage_queue = self._queues[stage]
+        while True:
+            job = stage_queue.get()
+            try:
+                # 已取消的任务不再进入后续阶段
+                job.cancel_token.check()
+                if stage == "extract":
+                    downloader.prepare_job(job)
+                    next_stage = "transfer"
+                elif stage == "transfer":
+                    downloader.transfer_job(job)
+                    next_stage = "merge" if job.needs_merge else "move"
+                elif stage == "merge":
+                    downloader.merge_job(job)
+                    next_stage = "move"
+                else:
+                    downloader.finalize_job(job)
+                    next_stage = None
+            except Exception as e:
+                if job.cancelled:
+                    # 取消时各阶段可能以不同异常结束（如重试等待被打断），统一按取消处理
+                    downloader.release_cancelled_job(job)
+                else:
+                    job.error = e
+                    job.stage = "failed"
+                    job.info = None
+                    downloader.disk_reservations.release(job)
+                    print(f"❌ 批量任务失败 [{job.display_name}]: {e}")
+                self._finish_job(job)
+                continue
+            finally:
+                stage_queue.task_done()
+
+            if next_stage:
+                # 下游阶段忙时在此阻塞，形成背压
+                self._queues[next_stage].put(job)
+            else:
+                self._finish_job(job)
+
+    def _finish_job(self, job):
+        """标记任务结束并刷新汇总进度"""
+        job.finished_time = time.time()
+        job._done.set()
+        summary = self.get_summary()
+        status_text = (f"📦 批量下载: 完成 {summary['completed']}/{summary['total']}"
+                       f"，失败 {summary['failed']}")
+        if summary['cancelled']:
+            status_text += f"，取消 {summary['cancelled']}"
+        self.parent.root.after(0, lambda: self.parent.update_progress(summary['percentage'], status_text))
+        if summary['completed'] + summary['failed'] + summary['cancelled'] == summary['total']:
+            self.parent.root.after(0, lambda: self.parent.gui.update_cache_button())
+            self.parent.root.after(0, self.parent.update_cancel_button)
+
+    def _on_job_progress(self, job, percentage, status_text):
+        """单个任务的进度回调，汇总为整体进度"""
+        job.progress = percentage
+        summary = self.get_summary()
+        finished = summary['completed'] + summary['failed'] + summary['cancelled']
+        text = f"[{finished}/{summary['total']}] {job.display_name[:30]} - {status_text}"
+        self.parent.root.after(0, lambda: self.parent.update_progress(summary['percentage'], text))
+
+    def get_summary(self):
+        """获取批量任务汇总信息"""
+        with self._lock:
+            jobs = list(self.jobs)
+        total = len(jobs)
+        cancelled = sum(1 for job in jobs if job.done() and job.stage == "cancelled")
+        completed = sum(1 for job in jobs if job.done() and not job.error) - cancelled
+        failed = sum(1 for job in jobs if job.error)
+        stages = {}
+        for job in jobs:
+            if not job.done():
+                stages[job.stage] = stages.get(job.stage, 0) + 1
+        percentage = sum(100 if job.done() else job.progress for job in jobs) / total if total else 0
+        return {
+            'total': total,
+            'completed': completed,
+            'failed': failed,
+            'cancelled': cancelled,
+            'active_stages': stages,
+            'percentage': percentage,
+        }
+
+    def has_active_jobs(self):
+        """是否还有未结束的任务或正在枚举的列表"""
+        with self._lock:
+            return bool(self._enumerations) or any(not job.done() for job in self.jobs)
+
+    def cancel_all(self):
+        """取消所有未结束的任务并停止列表枚举，返回取消的任务数"""
+        with self._lock:
+            jobs = [job for job in self.jobs if not job.done()]
+            enumerations = list(self._enumerations)
+        for cancel_token in enumerations:
+            cancel_token.cancel()
+        for job in jobs:
+            job.cancel()
+        return len(jobs)
+
+    def wait_all(self, timeout=None):
+        """等待当前所有任务结束"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            if not job.wait(remaining):
+                return False
+        return True
@@ -0,0 +1,228 @@
+"""
+信息提取进程池模块 - 在独立进程中运行yt-dlp提取，可超时强制结束并定期回收
+"""
+import time
+import threading
+import multiprocessing
+from .config import config
+
+
+# 界面和下载都用不到、体积又大的字段，提取后在子进程中直接丢弃
+DROPPED_INFO_FIELDS = (
+    'thumbnails', 'automatic_captions', 'subtitles', 'heatmap', 'comments',
+    'requested_formats', 'requested_downloads', 'requested_subtitles',
+)
+
+
+def compact_info(info, drop_fields=()):
+    """精简信息字典，只保留界面显示和下载所需的字段"""
+    for field in DROPPED_INFO_FIELDS + tuple(drop_fields):
+        info.pop(field, None)
+    return info
+
+
+def get_extraction_profile(name=None):
+    """获取配置中的提取方案，不存在时使用完整方案"""
+    name = name or config.get("extraction_profile", "fast")
+    profiles = config.get("extraction_profiles") or {}
+    if name not in profiles:
+        name = "full"
+    return name, profiles.get(name) or {}
+
+
+def apply_extraction_profile(ydl_opts, profile):
+    """把提取方案合并到yt-dlp参数中，返回(新参数, 需丢弃的字段)"""
+    ydl_opts = dict(ydl_opts)
+    if profile.get("extractor_args"):
+        ydl_opts['extractor_args'] = profile["extractor_args"]
+    return ydl_opts, tuple(profile.get("drop_fields") or ())
+
+
+def _worker_main(conn):
+    """工作进程主循环：接收(url, ydl_opts, drop_fields)，返回精简后的信息字典"""
+    import yt_dlp
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+
+        url, ydl_opts, drop_fields = request
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+                payload = compact_info(ydl.sanitize_info(info), drop_fields)
+            conn.send(('ok', payload))
+        except Exception as e:
+            conn.send(('error', type(e).__name__, str(e)))
+
+
+class ExtractionTimeout(Exception):
+    """提取超时（工作进程已被结束）"""
+
+
+class ExtractionCancelled(Exception):
+    """提取被取消（工作进程已被结束）"""
+
+
+class _Worker:
+    """单个工作进程"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def stop(self):
+        """正常退出"""
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.process.join(2)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        """强制结束（超时或取消时使用，释放其占用的网络连接和CPU）"""
+        try:
+            self.process.terminate()
+            self.process.join(2)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join(2)
+        except Exception as e:
+            print(f"结束提取进程失败: {e}")
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class ExtractionWorkerPool:
+    """yt-dlp提取进程池
+
+    提取在子进程中执行，不再与Tk线程争抢GIL；超时或取消时直接结束进程，
+    不会留下后台线程；每个进程处理一定数量的任务后回收，限制yt-dlp内存增长。
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = []
+        self._total = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    @property
+    def max_workers(self):
+        return max(1, int(config.get("extraction_workers", 2) or 1))
+
+    @property
+    def max_jobs_per_worker(self):
+        return max(1, int(config.get("extraction_worker_max_jobs", 50) or 1))
+
+    def warm_up(self):
+        """预先启动一个工作进程，避免首次提取时等待进程启动"""
+        worker = self._acquire()
+        self._release(worker)
+
+    def _acquire(self, timeout=None):
+        """取得空闲进程，没有时在上限内新建"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.is_alive():
+                        return worker
+                    self._total -= 1
+                if self._total < self.max_workers:
+                    self._total += 1
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise ExtractionTimeout("等待空闲提取进程超时")
+                self._cond.wait(remaining)
+
+        try:
+            return _Worker(self._context)
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, worker):
+        """归还进程；达到任务上限的进程回收"""
+        with self._cond:
+            if self._closed or worker.jobs >= self.max_jobs_per_worker or not worker.is_alive():
+                self._total -= 1
+                retire = True
+            else:
+                self._idle.append(worker)
+                retire = False
+            self._cond.notify()
+        if retire:
+            threading.Thread(target=worker.stop, daemon=True).start()
+
+    def _discard(self, worker):
+        """强制结束进程并从池中移除"""
+        worker.kill()
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def extract(self, url, ydl_opts, timeout=20, cancel_event=None, drop_fields=()):
+        """在工作进程中提取视频信息，返回精简后的信息字典"""
+        deadline = time.time() + timeout
+        worker = self._acquire(timeout)
+        try:
+            worker.conn.send((url, ydl_opts, tuple(drop_fields)))
+            worker.jobs += 1
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    self._discard(worker)
+                    worker = None
+                    raise ExtractionCancelled("信息提取已取消")
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._discard(worker)
+                    worker = None
+                    raise ExtractionTimeout("信息提取超时")
+                if worker.conn.poll(min(0.2, remaining)):
+                    break
+            message = worker.conn.recv()
+        except (EOFError, OSError, BrokenPipeError):
+            # 进程意外退出
+            if worker is not None:
+                self._discard(worker)
+                worker = None
+            raise Exception("提取进程意外退出")
+        finally:
+            if worker is not None and worker.is_alive():
+                self._release(worker)
+            elif worker is not None:
+                self._discard(worker)
+
+        if message[0] == 'ok':
+            return message[1]
+        raise Exception(message[2])
+
+    def shutdown(self):
+        """关闭所有空闲进程"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for worker in idle:
+            worker.stop()
@@ -0,0 +1,410 @@
+"""
+FFmpeg安装包下载模块 - 多连接分段下载、断点续传、校验并直接从已下载区段解压
+"""
+import os
+import json
+import time
+import struct
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .http_session import http_pool
+
+
+class FFmpegInstaller:
+    """FFmpeg安装包下载器
+
+    ZIP包只下载中央目录和目标可执行文件所在的字节区段，由zipfile直接从
+    预分配的分段文件中读取（CRC32自动校验）；tar.xz等不支持随机访问的格式
+    下载完整文件后流式解压。配置了SHA-256时会下载完整压缩包并校验。
+    """
+
+    # 默认下载地址（BtbN静态编译版本）
+    DEFAULT_URLS = {
+        'nt': "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip",
+        'posix': "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-linux64-gpl.tar.xz",
+    }
+
+    MIN_CHUNK_SIZE = 1024 * 1024          # 分段最小1MB
+    MAX_CHUNK_SIZE = 16 * 1024 * 1024     # 分段最大16MB
+    MIN_READ_SIZE = 64 * 1024             # 读缓冲初始64KB
+    MAX_READ_SIZE = 1024 * 1024           # 读缓冲最大1MB
+
+    def __init__(self, url, dest_dir, binary_name, progress_callback=None,
+                 connections=4, expected_sha256=None):
+        self.url = url
+        self.dest_dir = dest_dir
+        self.binary_name = binary_name
+        self.progress_callback = progress_callback
+        self.connections = max(1, int(connections))
+        self.expected_sha256 = (expected_sha256 or "").strip().lower() or None
+
+        archive_name = os.path.basename(url.split('?')[0]) or "ffmpeg_archive"
+        self.part_path = os.path.join(dest_dir, archive_name + ".part")
+        self.state_path = self.part_path + ".json"
+
+        self._state = None
+        self._state_lock = threading.Lock()
+        self._bytes_needed = 0
+        self._bytes_done = 0
+        self._start_time = None
+        self._last_report = 0
+        self._stop = threading.Event()  # 某个分段失败后其它连接停止写入
+
+    @classmethod
+    def get_default_url(cls):
+        """获取当前系统的默认下载地址"""
+        return cls.DEFAULT_URLS['nt' if os.name == 'nt' else 'posix']
+
+    # ------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------
+
+    def install(self):
+        """下载并解压FFmpeg，返回可执行文件路径"""
+        os.makedirs(self.dest_dir, exist_ok=True)
+        self._report(5, "🌐 连接到FFmpeg下载服务器...")
+
+        size, accept_ranges, etag = self._probe()
+        is_zip = self.url.split('?')[0].lower().endswith('.zip')
+
+        if not accept_ranges or not size:
+            # 服务器不支持分段请求，只能单连接顺序下载
+            self._download_sequential(size)
+            self._verify_archive()
+        else:
+            self._load_state(size, etag)
+            if is_zip and not self.expected_sha256:
+                # 只下载中央目录和目标文件的区段
+                self._download_zip_member_ranges(size)
+            else:
+                self._download_ranges([(0, size)], size)
+                self._verify_archive()
+
+        self._report(80, "📦 解压FFmpeg可执行文件...")
+        binary_path = os.path.join(self.dest_dir, self.binary_name)
+        try:
+            if is_zip:
+                self._extract_from_zip(binary_path)
+            else:
+                self._extract_from_tar(binary_path)
+        except (zipfile.BadZipFile, tarfile.TarError):
+            # CRC错误或压缩包损坏：丢弃已下载的区段，下次重新下载
+            self._cleanup_partial()
+            raise
+
+        self._cleanup_partial()
+        return binary_path
+
+    # ------------------------------------------------
+    # 探测与状态
+    # ------------------------------------------------
+
+    def _probe(self):
+        """探测文件大小、是否支持Range及ETag"""
+        response = http_pool.get(self.url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=30)
+        try:
+            response.raise_for_status()
+            etag = response.headers.get('ETag', '')
+            if response.status_code == 206:
+                content_range = response.headers.get('Content-Range', '')
+                total = content_range.rsplit('/', 1)[-1]
+                if total.isdigit():
+                    return int(total), True, etag
+            return int(response.headers.get('content-length', 0) or 0), False, etag
+        finally:
+            response.close()
+
+    def _choose_chunk_size(self, size):
+        """根据文件大小和连接数选择分段大小"""
+        chunk_size = size // (self.connections * 8)
+        return max(self.MIN_CHUNK_SIZE, min(self.MAX_CHUNK_SIZE, chunk_size))
+
+    def _load_state(self, size, etag):
+        """加载断点续传状态，文件变化时重新开始"""
+        state = None
+        try:
+            if os.path.exists(self.state_path) and os.path.exists(self.part_path):
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if (state.get('url') != self.url or state.get('size') != size or
+                        state.get('etag') != etag or os.path.getsize(self.part_path) != size):
+                    print("♻️ 远程文件已变化，重新下载FFmpeg")
+                    state = None
+        except Exception as e:
+            print(f"读取下载状态失败: {e}")
+            state = None
+
+        if state is None:
+            state = {'url': self.url, 'size': size, 'etag': etag,
+                     'chunk_size': self._choose_chunk_size(size), 'done': []}
+            # 预分配分段文件，各连接按偏移写入
+            with open(self.part_path, 'wb') as f:
+                f.truncate(size)
+            self._save_state(state)
+        else:
+            done_bytes = len(state['done']) * state['chunk_size']
+            print(f"⏯️ 恢复FFmpeg下载: 已完成 {len(state['done'])} 个分段 (约{done_bytes // (1024 * 1024)}MB)")
+
+        state['done'] = set(state['done'])
+        self._state = state
+
+    def _save_state(self, state):
+        """原子写入下载状态"""
+        data = dict(state)
+        data['done'] = sorted(data['done'])
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.state_path)
+
+    def _cleanup_partial(self):
+        """删除分段文件和状态文件"""
+        for path in (self.part_path, self.state_path):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # ------------------------------------------------
+    # 下载
+    # ------------------------------------------------
+
+    def _download_ranges(self, byte_ranges, size):
+        """并行下载覆盖指定字节区间的所有分段"""
+        chunk_size = self._state['chunk_size']
+        needed = set()
+        for start, end in byte_ranges:
+            first = start // chunk_size
+            last = (min(end, size) - 1) // chunk_size
+            needed.update(range(first, last + 1))
+
+        pending = sorted(needed - self._state['done'])
+        self._bytes_needed = sum(min(chunk_size, size - i * chunk_size) for i in needed)
+        self._bytes_done = self._bytes_needed - sum(min(chunk_size, size - i * chunk_size) for i in pending)
+        self._start_time = time.time()
+        if not pending:
+            return
+
+        total_str = self._format_bytes(self._bytes_needed)
+        self._report(10, f"📥 开始下载FFmpeg ({total_str}, {self.connections}个连接)...")
+
+        self._stop.clear()
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            futures = [executor.submit(self._fetch_chunk, index, chunk_size, size) for index in pending]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                # 通知其它连接停止并取消未开始的分段；退出with时等待正在下载的连接结束，
+                # 之后调用方才能报告失败或重新下载
+                self._stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _fetch_chunk(self, index, chunk_size, size):
+        """下载单个分段并写入对应偏移"""
+        if self._stop.is_set():
+            return
+        start = index * chunk_size
+        end = min(size, start + chunk_size) - 1
+        response = http_pool.get(self.url, headers={'Range': f'bytes={start}-{end}'}, stream=True, timeout=30)
+        try:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise Exception(f"服务器未返回分段内容 (HTTP {response.status_code})")
+
+            read_size = self.MIN_READ_SIZE
+            written = 0
+            with open(self.part_path, 'r+b') as f:
+                f.seek(start)
+                while not self._stop.is_set():
+                    read_start = time.time()
+                    chunk = response.raw.read(read_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    written += len(chunk)
+                    self._add_progress(len(chunk))
+                    # 读取很快说明带宽充足，增大缓冲减少系统调用
+                    if time.time() - read_start < 0.05 and read_size < self.MAX_READ_SIZE:
+                        read_size *= 2
+
+            if self._stop.is_set():
+                return
+            if written != end - start + 1:
+                raise Exception(f"分段 {index} 不完整: {written}/{end - start + 1}")
+        finally:
+            response.close()
+
+        with self._state_lock:
+            self._state['done'].add(index)
+            self._save_state(self._state)
+
+    def _download_sequential(self, size):
+        """单连接顺序下载（服务器不支持Range时使用）"""
+        self._bytes_needed = size
+        self._bytes_done = 0
+        self._start_time = time.time()
+        self._report(10, "📥 开始下载FFmpeg...")
+
+        response = http_pool.get(self.url, stream=True, timeout=30)
+        try:
+            response.raise_for_status()
+            read_size = self.MIN_READ_SIZE
+            with open(self.part_path, 'wb') as f:
+                while True:
+                    read_start = time.time()
+                    chunk = response.raw.read(read_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    self._add_progress(len(chunk))
+                    if time.time() - read_start < 0.05 and read_size < self.MAX_READ_SIZE:
+                        read_size *= 2
+        finally:
+            response.close()
+
+    def _download_zip_member_ranges(self, size):
+        """只下载ZIP的中央目录和目标文件所在区段"""
+        # 1. 末尾区段：包含中央目录结束记录（EOCD）
+        tail_start = max(0, size - 65536 - 22)
+        self._download_ranges([(tail_start, size)], size)
+        cd_offset, cd_size = self._read_central_directory_location(size, tail_start)
+        self._download_ranges([(cd_offset, cd_offset + cd_size), (tail_start, size)], size)
+
+        # 2. 通过zipfile解析中央目录，定位目标文件
+        with zipfile.ZipFile(self.part_path, 'r') as zip_ref:
+            member = self._find_member(zip_ref.infolist())
+            header_offset = member.header_offset
+            compress_size = member.compress_size
+
+        # 3. 本地文件头长度可变，先取文件头再取数据
+        self._download_ranges([(header_offset, header_offset + 30)], size)
+        with open(self.part_path, 'rb') as f:
+            f.seek(header_offset)
+            header = f.read(30)
+        if header[:4] != b'PK\x03\x04':
+            raise zipfile.BadZipFile("本地文件头无效")
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        data_end = header_offset + 30 + name_len + extra_len + compress_size
+
+        self._download_ranges([(header_offset, data_end), (cd_offset, cd_offset + cd_size),
+                               (tail_start, size)], size)
+
+    def _read_central_directory_location(self, size, tail_start):
+        """从末尾区段解析EOCD，返回中央目录的偏移和大小"""
+        with open(self.part_path, 'rb') as f:
+            f.seek(tail_start)
+            tail = f.read(size - tail_start)
+        eocd_pos = tail.rfind(b'PK\x05\x06')
+        if eocd_pos < 0:
+            raise zipfile.BadZipFile("未找到ZIP中央目录")
+        cd_size, cd_offset = struct.unpack('<II', tail[eocd_pos + 12:eocd_pos + 20])
+        if cd_offset == 0xFFFFFFFF:
+            # ZIP64：由zip64定位记录给出中央目录位置
+            locator_pos = tail.rfind(b'PK\x06\x07', 0, eocd_pos)
+            if locator_pos < 0:
+                raise zipfile.BadZipFile("ZIP64定位记录缺失")
+            eocd64_offset = struct.unpack('<Q', tail[locator_pos + 8:locator_pos + 16])[0]
+            rel = eocd64_offset - tail_start
+            cd_size, cd_offset = struct.unpack('<QQ', tail[rel + 40:rel + 56])
+        return cd_offset, cd_size
+
+    def _find_member(self, members):
+        """在压缩包成员中查找目标可执行文件"""
+        for info in members:
+            if os.path.basename(info.filename) == self.binary_name and not info.is_dir():
+                return info
+        raise Exception("压缩包中未找到FFmpeg可执行文件")
+
+    # ------------------------------------------------
+    # 校验与解压
+    # ------------------------------------------------
+
+    def _verify_archive(self):
+        """校验完整压缩包的SHA-256（如已配置）"""
+        if not self.expected_sha256:
+            return
+        self._report(75, "🔍 校验FFmpeg压缩包...")
+        digest = hashlib.sha256()
+        with open(self.part_path, 'rb') as f:
+            for block in iter(lambda: f.read(self.MAX_READ_SIZE), b''):
+                digest.update(block)
+        if digest.hexdigest() != self.expected_sha256:
+            self._cleanup_partial()
+            raise Exception("FFmpeg压缩包校验失败（SHA-256不匹配），已删除损坏的文件")
+
+    def _extract_from_zip(self, binary_path):
+        """从分段文件中解压目标可执行文件（zipfile读取时校验CRC32）"""
+        temp_path = binary_path + ".tmp"
+        with zipfile.ZipFile(self.part_path, 'r') as zip_ref:
+            member = self._find_member(zip_ref.infolist())
+            with zip_ref.open(member) as source, open(temp_path, 'wb') as target:
+                shutil.copyfileobj(source, target, self.MAX_READ_SIZE)
+        self._finish_binary(temp_path, binary_path)
+
+    def _extract_from_tar(self, binary_path):
+        """流式读取tar压缩包并解压目标可执行文件"""
+        temp_path = binary_path + ".tmp"
+        with tarfile.open(self.part_path, 'r:*') as tar_ref:
+            for member in tar_ref:
+                if member.isfile() and os.path.basename(member.name) == self.binary_name:
+                    source = tar_ref.extractfile(member)
+                    with source, open(temp_path, 'wb') as target:
+                        shutil.copyfileobj(source, target, self.MAX_READ_SIZE)
+                    break
+            else:
+                raise Exception("压缩包中未找到FFmpeg可执行文件")
+        self._finish_binary(temp_path, binary_path)
+
+    def _finish_binary(self, temp_path, binary_path):
+        """替换为最终的可执行文件"""
+        if os.name != 'nt':
+            os.chmod(temp_path, 0o755)
+        os.replace(temp_path, binary_path)
+
+    # ------------------------------------------------
+    # 进度
+    # ------------------------------------------------
+
+    def _add_progress(self, num_bytes):
+        """累计下载字节数并限频上报进度"""
+        with self._state_lock:
+            self._bytes_done += num_bytes
+            done = self._bytes_done
+        now = time.time()
+        if now - self._last_report < 0.5 and done < self._bytes_needed:
+            return
+        self._last_report = now
+
+        elapsed = now - self._start_time if self._start_time else 0
+        if self._bytes_needed > 0:
+            percent = min(100.0, done / self._bytes_needed * 100)
+            overall = 10 + percent * 0.6  # 10-70%
+            status_text = f"📥 下载FFmpeg: {percent:.1f}% ({self._format_bytes(done)}/{self._format_bytes(self._bytes_needed)})"
+        else:
+            overall = 40
+            status_text = f"📥 下载FFmpeg: {self._format_bytes(done)}"
+        if elapsed > 0:
+            speed = done / elapsed
+            status_text += f" | 速度: {self._format_bytes(speed)}/s"
+        self._report(overall, status_text)
+
+    def _report(self, percentage, status_text):
+        """上报进度"""
+        if self.progress_callback:
+            self.progress_callback(percentage, status_text)
+
+    def _format_bytes(self, bytes_val):
+        """格式化字节数"""
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if bytes_val < 1024.0:
+                return f"{bytes_val:.1f}{unit}"
+            bytes_val /= 1024.0
+        return f"{bytes_val:.1f}TB"
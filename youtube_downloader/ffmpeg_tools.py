@@ -12,6 +12,10 @@ from tkinter import messagebox
 import tkinter as tk
 from tkinter import ttk
 import time
+from .config import config
+from .ffmpeg_installer import FFmpegInstaller
+from .file_transfer import make_temp_path
+from .cancellation import DownloadCancelled
 
 
 class FFmpegTools:
@@ -55,13 +59,8 @@ class FFmpegTools:
     def get_ffmpeg_cache_dir(self):
         """获取FFmpeg缓存目录"""
         try:
-            # 尝试使用用户的AppData目录
-            appdata = os.environ.get('APPDATA')
-            if appdata:
-                cache_dir = os.path.join(appdata, 'YouTubeDownloader', 'ffmpeg')
-            else:
-                # 回退到当前目录
-                cache_dir = os.path.join(os.getcwd(), 'ffmpeg_cache')
+            # 放在应用程序数据目录下（Windows为%APPDATA%\\YouTubeDownloader）
+            cache_dir = os.path.join(os.path.dirname(config.config_file), 'ffmpeg')
             
             os.makedirs(cache_dir, exist_ok=True)
             return cache_dir
@@ -72,26 +71,60 @@ class FFmpegTools:
     def get_local_ffmpeg_path(self):
         """获取本地FFmpeg可执行文件路径"""
         cache_dir = self.get_ffmpeg_cache_dir()
-        return os.path.join(cache_dir, 'ffmpeg.exe')
+        binary_name = 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg'
+        return os.path.join(cache_dir, binary_name)
+    
+    def get_ffmpeg_path(self):
+        """获取可用的FFmpeg路径（系统PATH优先），未安装时返回None"""
+        if shutil.which('ffmpeg'):
+            return 'ffmpeg'
+        local_ffmpeg = self.get_local_ffmpeg_path()
+        if os.path.exists(local_ffmpeg):
+            return local_ffmpeg
+        return None
     
-    def merge_video_audio(self, video_file, audio_file, output_file):
-        """合并视频和音频文件"""
+    def ensure_ffmpeg_on_path(self):
+        """把本地FFmpeg目录加入PATH，返回是否可用
+        
+        yt-dlp的分段下载检查FFmpeg时不读取ffmpeg_location参数，只在PATH中查找。
+        """
+        ffmpeg_path = self.get_ffmpeg_path()
+        if ffmpeg_path and ffmpeg_path != 'ffmpeg':
+            os.environ['PATH'] = os.path.dirname(ffmpeg_path) + os.pathsep + os.environ.get('PATH', '')
+        return ffmpeg_path is not None
+    
+    def merge_video_audio(self, video_file, audio_file, output_file, progress_callback=None, shortest=False,
+                          cancel_event=None):
+        """合并视频和音频文件
+        
+        shortest=True时以较短的流为准（片段下载时视频按关键帧切割，可能比音频略长）；
+        cancel_event被设置时结束FFmpeg进程并抛出DownloadCancelled。
+        """
+        def report(percentage, status_text):
+            if progress_callback:
+                progress_callback(percentage, status_text)
+            else:
+                self.parent.root.after(0, lambda: self.parent.update_progress(percentage, status_text))
+        
         try:
+            # 排队期间已取消时不再启动FFmpeg
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled()
+            
             # 检查FFmpeg
-            ffmpeg_path = 'ffmpeg'
-            if not shutil.which('ffmpeg'):
-                local_ffmpeg = self.get_local_ffmpeg_path()
-                if os.path.exists(local_ffmpeg):
-                    ffmpeg_path = local_ffmpeg
-                else:
-                    raise Exception("FFmpeg未安装")
+            ffmpeg_path = self.get_ffmpeg_path()
+            if not ffmpeg_path:
+                raise Exception("FFmpeg未安装")
             
             # 获取文件大小信息
             video_size = self.format_bytes(os.path.getsize(video_file))
             audio_size = self.format_bytes(os.path.getsize(audio_file))
             
             # 更新进度 - 开始合并
-            self.parent.root.after(0, lambda: self.parent.update_progress(90, f"🔧 步骤3/3 - 正在合并文件: 视频({video_size}) + 音频({audio_size})"))
+            report(90, f"🔧 步骤3/3 - 正在合并文件: 视频({video_size}) + 音频({audio_size})")
+            
+            # 先写入目标目录中的临时文件，成功后再重命名，失败时不留下不完整的输出文件
+            temp_file = make_temp_path(output_file)
             
             # 构建FFmpeg命令
             cmd = [
@@ -100,12 +133,16 @@ class FFmpegTools:
                 '-i', audio_file,
                 '-c:v', 'copy',    # 直接复制视频流，不重新编码
                 '-c:a', 'aac',     # 音频转为AAC格式
-                '-y',              # 覆盖输出文件
-                output_file
             ]
+            if shortest:
+                cmd.append('-shortest')
+            cmd.extend([
+                '-y',              # 覆盖输出文件
+                temp_file
+            ])
             
             # 执行合并
-            self.parent.root.after(0, lambda: self.parent.update_progress(95, f"🔧 步骤3/3 - 视频与音频合并处理中..."))
+            report(95, f"🔧 步骤3/3 - 视频与音频合并处理中...")
             
             # 创建startupinfo以隐藏命令行窗口
             startupinfo = None
@@ -114,7 +151,13 @@ class FFmpegTools:
                 startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
                 startupinfo.wShowWindow = subprocess.SW_HIDE
             
-            process = subprocess.run(cmd, capture_output=True, text=True, timeout=300, startupinfo=startupinfo)
+            try:
+                process = self._run_ffmpeg(cmd, startupinfo, timeout=300, cancel_event=cancel_event)
+                if process.returncode == 0:
+                    os.replace(temp_file, output_file)
+            finally:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
             
             if process.returncode == 0:
                 # 合并成功，显示简洁的完成信息
@@ -124,7 +167,7 @@ class FFmpegTools:
                 else:
                     status_text = f"✅ 下载完成: {os.path.basename(output_file)}"
                 
-                self.parent.root.after(0, lambda: self.parent.update_progress(100, status_text))
+                report(100, status_text)
                 return True
             else:
                 error_msg = process.stderr if process.stderr else "未知错误"
@@ -132,9 +175,30 @@ class FFmpegTools:
                 
         except subprocess.TimeoutExpired:
             raise Exception("合并超时，文件可能过大")
+        except DownloadCancelled:
+            raise
         except Exception as e:
             raise Exception(f"合并失败: {str(e)}")
     
+    def _run_ffmpeg(self, cmd, startupinfo, timeout, cancel_event=None):
+        """运行FFmpeg并等待结束，超时或取消时结束进程（返回带returncode和stderr的CompletedProcess）"""
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                   startupinfo=startupinfo)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=0.5)
+                return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+            except subprocess.TimeoutExpired:
+                cancelled = cancel_event is not None and cancel_event.is_set()
+                if not cancelled and time.time() < deadline:
+                    continue
+                process.kill()
+                process.communicate()
+                if cancelled:
+                    raise DownloadCancelled()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+    
     def format_bytes(self, bytes_val):
         """格式化字节数"""
         try:
@@ -149,105 +213,18 @@ class FFmpegTools:
     def download_and_extract_ffmpeg(self):
         """下载并解压FFmpeg"""
         try:
-            # FFmpeg下载链接 (Windows 64位版本)
-            ffmpeg_url = "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip"
+            # FFmpeg下载链接（可在配置中替换，例如Linux静态编译版本或内网镜像）
+            ffmpeg_url = config.get("ffmpeg_download_url") or FFmpegInstaller.get_default_url()
             
-            cache_dir = self.get_ffmpeg_cache_dir()
-            zip_path = os.path.join(cache_dir, 'ffmpeg.zip')
-            
-            # 开始下载
-            self.parent.root.after(0, lambda: self.parent.update_progress(5, "🌐 连接到FFmpeg下载服务器..."))
-            
-            # 下载FFmpeg
-            response = requests.get(ffmpeg_url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            start_time = time.time()
-            
-            # 显示文件大小信息
-            if total_size > 0:
-                total_size_str = self.format_bytes(total_size)
-                self.parent.root.after(0, lambda: self.parent.update_progress(10, f"📥 开始下载FFmpeg ({total_size_str})..."))
-            else:
-                self.parent.root.after(0, lambda: self.parent.update_progress(10, "📥 开始下载FFmpeg..."))
-            
-            with open(zip_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        if total_size > 0:
-                            # 计算进度百分比
-                            progress_percent = (downloaded / total_size) * 100
-                            overall_progress = 10 + (progress_percent * 0.5)  # 10-60%
-                            
-                            # 计算下载速度
-                            elapsed_time = time.time() - start_time
-                            if elapsed_time > 0:
-                                speed_bps = downloaded / elapsed_time
-                                speed_str = self.format_bytes(speed_bps) + "/s"
-                                
-                                # 计算剩余时间
-                                if speed_bps > 0:
-                                    remaining_bytes = total_size - downloaded
-                                    eta_seconds = remaining_bytes / speed_bps
-                                    
-                                    if eta_seconds < 60:
-                                        eta_str = f"{eta_seconds:.0f}秒"
-                                    elif eta_seconds < 3600:
-                                        eta_str = f"{eta_seconds//60:.0f}分{eta_seconds%60:.0f}秒"
-                                    else:
-                                        eta_str = f"{eta_seconds//3600:.0f}时{(eta_seconds%3600)//60:.0f}分"
-                                else:
-                                    eta_str = "计算中..."
-                                
-                                downloaded_str = self.format_bytes(downloaded)
-                                total_str = self.format_bytes(total_size)
-                                
-                                status_text = f"📥 下载FFmpeg: {progress_percent:.1f}% ({downloaded_str}/{total_str}) | 速度: {speed_str} | 剩余: {eta_str}"
-                            else:
-                                downloaded_str = self.format_bytes(downloaded)
-                                total_str = self.format_bytes(total_size)
-                                status_text = f"📥 下载FFmpeg: {progress_percent:.1f}% ({downloaded_str}/{total_str})"
-                            
-                            # 更新进度（每下载1MB或每秒更新一次）
-                            if downloaded % (1024 * 1024) < 8192 or elapsed_time > getattr(self, '_last_update_time', 0) + 1:
-                                self.parent.root.after(0, lambda p=overall_progress, s=status_text: self.parent.update_progress(p, s))
-                                self._last_update_time = elapsed_time
-            
-            # 下载完成，开始解压
-            downloaded_str = self.format_bytes(downloaded)
-            self.parent.root.after(0, lambda: self.parent.update_progress(65, f"✅ 下载完成 ({downloaded_str}) - 开始解压..."))
-            
-            # 解压FFmpeg
-            self.parent.root.after(0, lambda: self.parent.update_progress(70, "📦 正在解压FFmpeg压缩包..."))
-            
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # 查找ffmpeg.exe文件
-                ffmpeg_found = False
-                for file_info in zip_ref.filelist:
-                    if file_info.filename.endswith('ffmpeg.exe'):
-                        # 显示解压进度
-                        self.parent.root.after(0, lambda: self.parent.update_progress(80, f"📦 解压FFmpeg可执行文件..."))
-                        
-                        # 解压到缓存目录
-                        with zip_ref.open(file_info) as source, open(self.get_local_ffmpeg_path(), 'wb') as target:
-                            shutil.copyfileobj(source, target)
-                        ffmpeg_found = True
-                        break
-                
-                if not ffmpeg_found:
-                    raise Exception("压缩包中未找到FFmpeg可执行文件")
-            
-            # 清理下载的zip文件
-            self.parent.root.after(0, lambda: self.parent.update_progress(90, "🧹 清理临时文件..."))
-            try:
-                os.remove(zip_path)
-            except:
-                pass
+            installer = FFmpegInstaller(
+                ffmpeg_url,
+                self.get_ffmpeg_cache_dir(),
+                os.path.basename(self.get_local_ffmpeg_path()),
+                progress_callback=lambda p, s: self.parent.root.after(0, lambda: self.parent.update_progress(p, s)),
+                connections=config.get("ffmpeg_download_connections", 4),
+                expected_sha256=config.get("ffmpeg_sha256", ""),
+            )
+            installer.install()
             
             # 验证安装
             self.parent.root.after(0, lambda: self.parent.update_progress(95, "🔍 验证FFmpeg安装..."))
@@ -607,7 +584,15 @@ A: 自动安装会放在：%APPDATA%\\YouTubeDownloader\\ffmpeg\\
                 progress_var.set("🔧 正在合并文件...")
                 progress_bar['value'] = 10
                 
-                result = self.merge_video_audio(video_path, audio_path, output_path)
+                # 手动合并优先于下载任务的自动合并
+                merge_task = self.parent.postprocessor.submit(
+                    self.merge_video_audio, video_path, audio_path, output_path,
+                    priority=self.parent.postprocessor.PRIORITY_INTERACTIVE,
+                    name=f"本地合并 {os.path.basename(output_path)}"
+                )
+                if merge_task.start_time is None:
+                    progress_var.set("⏳ 等待合并队列...")
+                result = merge_task.result()
                 
                 if result:
                     progress_var.set("✅ 合并完成!")
@@ -0,0 +1,102 @@
+"""
+文件转移模块 - 下载结果移动到目标目录：同一文件系统直接重命名，跨文件系统时由内核复制并报告进度
+"""
+import os
+import uuid
+import errno
+import shutil
+
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# 内核复制不可用时退回普通读写的错误（旧内核、文件系统或平台不支持）
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF,
+                    getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)}
+
+
+def _kernel_copy(src_fd, dst_fd, offset, count):
+    """在内核中复制一段数据（copy_file_range优先，其次sendfile），返回复制的字节数"""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+    if hasattr(os, 'sendfile') and os.name != 'nt':
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        return os.sendfile(dst_fd, src_fd, offset, count)
+    raise OSError(errno.ENOSYS, "内核复制不可用")
+
+
+def make_temp_path(target):
+    """目标目录中的临时文件名（隐藏、保留扩展名以便FFmpeg识别格式），写完后重命名为目标文件"""
+    directory, name = os.path.split(target)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{stem}.{uuid.uuid4().hex[:8]}.tmp{ext}")
+
+
+def copy_file(source, target, progress_callback=None, hasher=None):
+    """复制文件并按块报告进度progress_callback(已复制字节数, 总字节数)
+
+    数据在内核中直接从源文件写到目标文件，不经过用户态缓冲区；不支持时退回普通读写。
+    传入hasher（BlockHasher）时数据本来就要读一遍，改为普通读写并在复制时计算哈希。
+    """
+    total = os.path.getsize(source)
+    copied = 0
+    use_kernel = hasher is None
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        while copied < total:
+            count = min(COPY_CHUNK_SIZE, total - copied)
+            written = 0
+            if use_kernel:
+                try:
+                    written = _kernel_copy(src.fileno(), dst.fileno(), copied, count)
+                except OSError as e:
+                    if e.errno not in _FALLBACK_ERRNOS:
+                        raise
+                if written <= 0:
+                    # 部分文件系统的copy_file_range不复制任何数据而返回0
+                    use_kernel = False
+            if not use_kernel:
+                src.seek(copied)
+                dst.seek(copied)
+                data = src.read(count)
+                dst.write(data)
+                written = len(data)
+                if hasher is not None:
+                    hasher.update(copied, data)
+            if written <= 0:
+                break
+            copied += written
+            if progress_callback:
+                progress_callback(copied, total)
+        dst.flush()
+        os.fsync(dst.fileno())
+    if copied != total:
+        raise OSError(errno.EIO, f"复制不完整: {copied}/{total} 字节")
+    shutil.copystat(source, target)
+    return copied
+
+
+def move_file(source, target, progress_callback=None, hasher=None):
+    """移动文件，返回"rename"或"copy"
+
+    同一文件系统时直接重命名；跨文件系统时先复制到目标目录的临时文件，完成后再重命名为目标文件
+    并删除源文件，中途失败不会留下不完整的目标文件。
+    """
+    try:
+        os.replace(source, target)
+        return "rename"
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    temp_path = make_temp_path(target)
+    try:
+        copy_file(source, temp_path, progress_callback, hasher)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.remove(source)
+    return "copy"
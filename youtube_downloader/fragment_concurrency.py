@@ -0,0 +1,83 @@
+"""
+分片并发控制模块 - 按主机用AIMD方式自适应调整HLS/DASH分片下载并发数
+"""
+import threading
+from .config import config
+
+
+class DownloadLogger:
+    """yt-dlp日志接收器：统计重试和限流（429）次数，警告和错误照常输出"""
+
+    def __init__(self):
+        self.retries = 0
+        self.throttled = 0
+
+    def _count(self, message):
+        if 'Got error' in message or 'Retrying' in message:
+            self.retries += 1
+        if '429' in message or 'Too Many Requests' in message:
+            self.throttled += 1
+
+    def debug(self, message):
+        self._count(message)
+
+    def info(self, message):
+        self._count(message)
+
+    def warning(self, message):
+        self._count(message)
+        print(message)
+
+    def error(self, message):
+        self._count(message)
+        print(message)
+
+
+class FragmentConcurrencyController:
+    """分片并发数控制器
+
+    每个主机维护一个并发窗口：分片下载结束后按实测吞吐量和错误情况调整，
+    出现限流或错误率过高时减半（乘性减），吞吐量仍在提升时加一（加性增），
+    下一个任务使用新的窗口值。
+    """
+
+    # 错误率超过该值视为拥塞
+    ERROR_RATE_LIMIT = 0.05
+    # 吞吐量提升超过该比例才继续增加并发
+    IMPROVEMENT_THRESHOLD = 1.05
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}  # host -> {'window': float, 'throughput': float}
+
+    def _limits(self):
+        initial = max(1, int(config.get("concurrent_fragment_downloads", 4) or 1))
+        maximum = max(initial, int(config.get("max_fragment_concurrency", 16) or initial))
+        return initial, maximum
+
+    def get_concurrency(self, host):
+        """获取该主机当前应使用的分片并发数"""
+        initial, _ = self._limits()
+        if not config.get("adaptive_fragment_concurrency", True):
+            return initial
+        with self._lock:
+            state = self._hosts.get(host)
+            return int(state['window']) if state else initial
+
+    def report(self, host, concurrency, throughput, fragments, retries=0, throttled=0):
+        """报告一次分片下载的结果，返回调整后的窗口"""
+        if not config.get("adaptive_fragment_concurrency", True) or fragments <= 0:
+            return concurrency
+        _, maximum = self._limits()
+        with self._lock:
+            state = self._hosts.setdefault(host, {'window': float(concurrency), 'throughput': 0.0})
+            previous = state['throughput']
+            state['throughput'] = throughput
+            error_rate = retries / fragments
+            if throttled or error_rate > self.ERROR_RATE_LIMIT:
+                state['window'] = max(1.0, state['window'] / 2)
+                reason = "限流" if throttled else f"错误率{error_rate:.0%}"
+                print(f"📉 分片并发 {host}: {reason}，降为 {int(state['window'])}")
+            elif throughput > previous * self.IMPROVEMENT_THRESHOLD:
+                state['window'] = min(float(maximum), state['window'] + 1)
+            return int(state['window'])
@@ -4,10 +4,9 @@ UI组件模块 - 处理界面相关的功能
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
-import io
-import requests
 import os
 import sys
+from .multi_url import parse_url_list
 
 
 class GuiInterface:
@@ -76,6 +75,10 @@ class GuiInterface:
                                             command=self.parent.get_video_info)
         self.parent.info_button.grid(row=2, column=2, padx=(10, 0), pady=5)
         
+        self.parent.batch_button = ttk.Button(parent, text="批量链接", 
+                                             command=self.open_batch_dialog)
+        self.parent.batch_button.grid(row=2, column=3, padx=(10, 0), pady=5)
+        
     def _setup_info_display(self, parent):
         """设置视频信息显示区域"""
         info_frame = ttk.LabelFrame(parent, text="视频信息", padding="10")
@@ -178,6 +181,27 @@ class GuiInterface:
         self.parent.browse_button = ttk.Button(parent, text="浏览", command=self.parent.browse_path)
         self.parent.browse_button.grid(row=1, column=2, padx=(10, 0), pady=5)
         
+        # 播放列表/频道增量同步
+        self.parent.sync_only_var = tk.BooleanVar(value=False)
+        self.parent.sync_only_check = ttk.Checkbutton(
+            parent, text="列表/频道仅同步新上传（跳过已下载的视频）",
+            variable=self.parent.sync_only_var
+        )
+        self.parent.sync_only_check.grid(row=2, column=1, padx=(10, 0), sticky=tk.W)
+        
+        # 片段下载（只下载指定时间范围）
+        ttk.Label(parent, text="片段(可选):", font=('微软雅黑', 10)).grid(
+            row=3, column=0, sticky=tk.W, pady=5)
+        clip_frame = ttk.Frame(parent)
+        clip_frame.grid(row=3, column=1, columnspan=2, padx=(10, 0), pady=5, sticky=tk.W)
+        self.parent.clip_start_entry = ttk.Entry(clip_frame, width=10, font=('微软雅黑', 9))
+        self.parent.clip_start_entry.pack(side=tk.LEFT)
+        ttk.Label(clip_frame, text=" 至 ").pack(side=tk.LEFT)
+        self.parent.clip_end_entry = ttk.Entry(clip_frame, width=10, font=('微软雅黑', 9))
+        self.parent.clip_end_entry.pack(side=tk.LEFT)
+        ttk.Label(clip_frame, text="  如 1:30 或 90，留空下载完整视频", 
+                  font=('微软雅黑', 8), foreground='#666666').pack(side=tk.LEFT)
+        
     def _setup_download_buttons(self, parent):
         """设置下载按钮区域"""
         download_frame = ttk.Frame(parent)
@@ -195,25 +219,31 @@ class GuiInterface:
         )
         self.parent.pause_button.grid(row=0, column=1, padx=(0, 10))
         
+        self.parent.cancel_button = ttk.Button(
+            download_frame, text="取消下载", 
+            command=self.parent.cancel_download, state='disabled'
+        )
+        self.parent.cancel_button.grid(row=0, column=2, padx=(0, 10))
+        
         self.parent.merge_button = ttk.Button(
             download_frame, text="本地视频、音频合并", 
             command=self.parent.open_local_merge_dialog
         )
-        self.parent.merge_button.grid(row=0, column=2, padx=(0, 10))
+        self.parent.merge_button.grid(row=0, column=3, padx=(0, 10))
         
         # 添加缓存清理按钮
         self.parent.cache_button = ttk.Button(
             download_frame, text="清理缓存 (0MB)", 
             command=self.parent.clear_cache_simple
         )
-        self.parent.cache_button.grid(row=0, column=3, padx=(0, 10))
+        self.parent.cache_button.grid(row=0, column=4, padx=(0, 10))
         
         # 添加打赏按钮
         self.parent.donate_button = ttk.Button(
             download_frame, text="☕ 打赏支持", 
             command=self.show_donation_dialog
         )
-        self.parent.donate_button.grid(row=0, column=4, padx=(0, 10))
+        self.parent.donate_button.grid(row=0, column=5, padx=(0, 10))
         
         # 更新缓存按钮显示
         self.update_cache_button()
@@ -257,28 +287,13 @@ class GuiInterface:
         )
         self.parent.thumbnail_label.image = None
         
-    def download_and_display_thumbnail(self, thumbnail_url):
-        """下载并显示缩略图"""
+    def download_and_display_thumbnail(self, thumbnail_url, video_id=None):
+        """下载并显示缩略图（优先使用缩略图缓存）"""
         try:
-            response = requests.get(thumbnail_url, timeout=10)
-            if response.status_code == 200:
-                image_data = response.content
-                image = Image.open(io.BytesIO(image_data))
-                
-                # 调整图片大小以适应显示区域
-                display_width, display_height = 260, 195
-                image.thumbnail((display_width, display_height), Image.Resampling.LANCZOS)
-                
-                # 创建居中的背景
-                background = Image.new('RGB', (display_width, display_height), (240, 240, 240))
-                
-                # 计算居中位置
-                x = (display_width - image.width) // 2
-                y = (display_height - image.height) // 2
-                background.paste(image, (x, y))
-                
+            image = self.parent.thumbnail_cache.get_thumbnail(thumbnail_url, video_id)
+            if image is not None:
                 # 转换为tkinter可用的格式
-                photo = ImageTk.PhotoImage(background)
+                photo = ImageTk.PhotoImage(image)
                 
                 # 在主线程中更新显示
                 self.parent.root.after(0, lambda: self.update_thumbnail_display(photo))
@@ -288,6 +303,138 @@ class GuiInterface:
             # 在主线程中重置显示
             self.parent.root.after(0, self.reset_thumbnail_display)
     
+    def open_batch_dialog(self):
+        """打开批量链接对话框：并行解析多个链接并批量下载"""
+        batch_window = tk.Toplevel(self.parent.root)
+        batch_window.title("批量下载")
+        batch_window.geometry("760x580")
+        batch_window.transient(self.parent.root)
+        
+        main_frame = ttk.Frame(batch_window, padding="15")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        ttk.Label(main_frame, text="粘贴链接（每行一个，也可粘贴包含链接的任意文本）:", 
+                  font=('微软雅黑', 10)).pack(anchor=tk.W)
+        
+        url_text = tk.Text(main_frame, height=7, font=('微软雅黑', 9), wrap=tk.NONE)
+        url_text.pack(fill=tk.X, pady=(5, 10))
+        
+        # 解析结果列表
+        columns = ('链接', '状态', '标题')
+        tree = ttk.Treeview(main_frame, columns=columns, show='headings', height=10)
+        tree.heading('链接', text='链接')
+        tree.heading('状态', text='状态')
+        tree.heading('标题', text='标题')
+        tree.column('链接', width=250)
+        tree.column('状态', width=140)
+        tree.column('标题', width=320)
+        
+        status_var = tk.StringVar(value="")
+        results = {}      # url -> info
+        playlists = []    # 播放列表/频道链接
+        
+        def set_row(url, status, title=None):
+            if tree.exists(url):
+                tree.set(url, '状态', status)
+                if title is not None:
+                    tree.set(url, '标题', title)
+        
+        def load_from_file():
+            file_path = filedialog.askopenfilename(
+                title="选择链接列表文件",
+                filetypes=[("文本文件", "*.txt *.csv *.list"), ("所有文件", "*.*")]
+            )
+            if file_path:
+                try:
+                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                        url_text.insert(tk.END, "\n" + f.read())
+                except Exception as e:
+                    messagebox.showerror("错误", f"读取文件失败: {e}")
+        
+        def parse_urls():
+            urls = parse_url_list(url_text.get(1.0, tk.END))
+            if not urls:
+                messagebox.showerror("错误", "没有找到有效的链接")
+                return
+            
+            tree.delete(*tree.get_children())
+            results.clear()
+            del playlists[:]
+            video_urls = []
+            for url in urls:
+                if self.parent.downloader.is_playlist_url(url):
+                    playlists.append(url)
+                    tree.insert('', tk.END, iid=url, values=(url, "📃 列表（下载时枚举）", ""))
+                else:
+                    video_urls.append(url)
+                    tree.insert('', tk.END, iid=url, values=(url, "⏳ 解析中...", ""))
+            
+            parse_button.configure(state='disabled')
+            status_var.set(f"正在解析 {len(video_urls)} 个视频链接...")
+            
+            def on_result(url, info):
+                results[url] = info
+                title = info.get('title', '')
+                self.parent.root.after(0, lambda: set_row(url, "✅ 已解析", title))
+            
+            def on_error(url, error):
+                message = str(error).split('\n')[0][:60]
+                self.parent.root.after(0, lambda: set_row(url, f"❌ {message}"))
+            
+            def on_duplicate(url, video_id):
+                self.parent.root.after(0, lambda: set_row(url, f"🔁 重复 ({video_id})"))
+            
+            def on_done():
+                def finish():
+                    status_var.set(f"解析完成: 成功 {len(results)} 个，列表 {len(playlists)} 个")
+                    parse_button.configure(state='normal')
+                self.parent.root.after(0, finish)
+            
+            self.parent.multi_url_extractor.extract_all(
+                video_urls, on_result, on_error, on_duplicate=on_duplicate, on_done=on_done)
+        
+        def download_all():
+            download_path = self.parent.path_entry.get().strip()
+            quality = quality_combo.get()
+            if not os.path.exists(download_path):
+                messagebox.showerror("错误", f"下载路径不存在: {download_path}")
+                return
+            if not results and not playlists:
+                messagebox.showinfo("提示", "没有可下载的链接，请先解析")
+                return
+            
+            for url, info in list(results.items()):
+                self.parent.pipeline.submit(url, download_path, quality, info=info)
+                set_row(url, "📥 已加入队列")
+            for url in playlists:
+                self.parent.pipeline.submit_playlist(url, download_path, quality,
+                                                     sync=self.parent.sync_only_var.get())
+                set_row(url, "📥 已加入队列")
+            status_var.set(f"已加入下载队列: {len(results)} 个视频，{len(playlists)} 个列表")
+            results.clear()
+            del playlists[:]
+        
+        # 按钮区域
+        top_buttons = ttk.Frame(main_frame)
+        top_buttons.pack(fill=tk.X, pady=(0, 10))
+        ttk.Button(top_buttons, text="从文件导入", command=load_from_file).pack(side=tk.LEFT, padx=(0, 10))
+        parse_button = ttk.Button(top_buttons, text="解析链接", command=parse_urls)
+        parse_button.pack(side=tk.LEFT)
+        
+        tree.pack(fill=tk.BOTH, expand=True)
+        ttk.Label(main_frame, textvariable=status_var, font=('微软雅黑', 9), 
+                  foreground='#666666').pack(anchor=tk.W, pady=(5, 5))
+        
+        bottom_buttons = ttk.Frame(main_frame)
+        bottom_buttons.pack(fill=tk.X)
+        ttk.Label(bottom_buttons, text="下载质量:").pack(side=tk.LEFT)
+        quality_combo = ttk.Combobox(bottom_buttons, values=self.parent.downloader.GENERIC_QUALITY_OPTIONS,
+                                     state="readonly", width=28)
+        quality_combo.set(self.parent.downloader.GENERIC_QUALITY_OPTIONS[0])
+        quality_combo.pack(side=tk.LEFT, padx=(5, 10))
+        ttk.Button(bottom_buttons, text="全部下载", command=download_all).pack(side=tk.LEFT)
+        ttk.Button(bottom_buttons, text="关闭", command=batch_window.destroy).pack(side=tk.RIGHT)
+    
     def show_donation_dialog(self):
         """显示打赏对话框"""
         
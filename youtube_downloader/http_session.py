@@ -0,0 +1,89 @@
+"""
+HTTP会话模块 - 为缩略图、FFmpeg安装包等非yt-dlp请求提供共享的连接池
+"""
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .config import config
+
+
+class HttpSessionPool:
+    """共享的HTTP会话（长连接 + 按主机设置连接池大小）
+
+    requests.Session底层的urllib3连接池是线程安全的，多个线程共用同一个会话
+    即可复用已建立的TCP/TLS连接；会话的创建和重建由锁保护。
+    """
+
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_TIMEOUT = 15
+
+    def __init__(self):
+        self._session = None
+        self._session_key = None
+        self._lock = threading.Lock()
+
+    def _build_session(self, proxy, user_agent, pool_sizes):
+        """按当前配置创建会话"""
+        session = requests.Session()
+        retry = Retry(total=2, connect=2, read=0, backoff_factor=0.5,
+                      status_forcelist=(502, 503, 504), allowed_methods=('GET', 'HEAD'))
+
+        default_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.DEFAULT_POOL_SIZE,
+                                      max_retries=retry)
+        session.mount('http://', default_adapter)
+        session.mount('https://', default_adapter)
+
+        # 按主机单独设置连接池大小（如批量加载缩略图的i.ytimg.com）
+        for host, size in (pool_sizes or {}).items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(size), max_retries=retry)
+            session.mount(f'https://{host}', adapter)
+            session.mount(f'http://{host}', adapter)
+
+        if user_agent:
+            session.headers['User-Agent'] = user_agent
+        if proxy:
+            session.proxies = {'http': proxy, 'https': proxy}
+        return session
+
+    def get_session(self):
+        """获取共享会话，代理/UA/连接池配置变化时自动重建"""
+        proxy = config.get("proxy", "")
+        user_agent = config.get("user_agent", "")
+        pool_sizes = config.get("http_pool_sizes", {}) or {}
+        key = (proxy, user_agent, tuple(sorted(pool_sizes.items())))
+
+        with self._lock:
+            if self._session is None or self._session_key != key:
+                old_session = self._session
+                self._session = self._build_session(proxy, user_agent, pool_sizes)
+                self._session_key = key
+                if old_session is not None:
+                    old_session.close()
+            return self._session
+
+    def request(self, method, url, **kwargs):
+        """发送请求（默认带超时）"""
+        kwargs.setdefault('timeout', self.DEFAULT_TIMEOUT)
+        return self.get_session().request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """发送GET请求"""
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        """发送HEAD请求"""
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('HEAD', url, **kwargs)
+
+    def close(self):
+        """关闭会话并释放连接"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+                self._session_key = None
+
+
+# 全局HTTP会话实例
+http_pool = HttpSessionPool()
@@ -17,6 +17,7 @@ YouTube视频下载器
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
+import multiprocessing
 import os
 import time
 from .config import config
@@ -24,6 +25,14 @@ from .gui_interface import GuiInterface
 from .video_downloader import VideoDownloader
 from .ffmpeg_tools import FFmpegTools
 from .cache_manager import CacheManager
+from .postprocess_executor import PostProcessExecutor
+from .download_pipeline import DownloadPipeline
+from .thumbnail_cache import ThumbnailCache
+from .download_archive import DownloadArchive
+from .multi_url import MultiUrlExtractor
+from .extraction_pool import ExtractionWorkerPool
+from .retry_policy import DownloadFailure
+from .cancellation import CancelToken, DownloadCancelled
 from PIL import Image, ImageTk
 
 
@@ -41,6 +50,7 @@ class YouTubeDownloaderApp:
         self.download_path = config.get("download_path")
         self.download_paused = False
         self.current_download = None
+        self.download_cancel_token = None  # 当前单个下载的取消令牌
         self.download_stage = "waiting"
         self.video_file = None
         self.audio_file = None
@@ -54,12 +64,19 @@ class YouTubeDownloaderApp:
         self.needs_merge = False
         self.best_quality_text = ""
         self.direct_download_text = ""
+        self._info_request_id = 0  # 用于丢弃过期的信息获取结果
         
         # 初始化组件
         self.gui = GuiInterface(self)
         self.downloader = VideoDownloader(self)
         self.ffmpeg = FFmpegTools(self)
         self.cache_manager = CacheManager(self)
+        self.postprocessor = PostProcessExecutor(self)
+        self.pipeline = DownloadPipeline(self)
+        self.thumbnail_cache = ThumbnailCache(self)
+        self.download_archive = DownloadArchive()
+        self.multi_url_extractor = MultiUrlExtractor(self)
+        self.extraction_pool = ExtractionWorkerPool(self)
         
         # 设置窗口图标
         self.set_window_icon()
@@ -92,6 +109,9 @@ class YouTubeDownloaderApp:
     
     def check_environment_on_startup(self):
         """启动时检查环境"""
+        # 后台预热提取进程，首次获取信息时无需等待进程启动
+        threading.Thread(target=self.warm_up_extraction_pool, daemon=True).start()
+        
         if self.ffmpeg.check_ffmpeg_installed():
             self.progress_var.set("🚀 环境就绪 - 支持所有下载功能")
         else:
@@ -111,6 +131,13 @@ class YouTubeDownloaderApp:
         # 启动时清理过期缓存
         self.root.after(2000, self.cleanup_old_cache_on_startup)
     
+    def warm_up_extraction_pool(self):
+        """预热信息提取进程"""
+        try:
+            self.extraction_pool.warm_up()
+        except Exception as e:
+            print(f"提取进程启动失败: {e}")
+    
     def cleanup_old_cache_on_startup(self):
         """启动时清理过期缓存"""
         try:
@@ -138,11 +165,42 @@ class YouTubeDownloaderApp:
         self.update_progress(0, "🔍 正在获取视频信息...")
         self.gui.reset_thumbnail_display()
         
+        # 播放列表/频道：只预览前几个条目，不展开完整列表
+        if self.downloader.is_playlist_url(url):
+            self.get_playlist_info(url)
+            return
+        
+        self._info_request_id += 1
+        request_id = self._info_request_id
+        state = {'full_done': False, 'thumbnail_shown': False}
+        
+        def is_current():
+            return request_id == self._info_request_id
+        
+        def show_quick_info(quick):
+            """第一阶段：完整信息到达前先显示基本信息"""
+            if is_current() and not state['full_done']:
+                self.update_info_display(self._build_quick_info_text(quick))
+                self.update_progress(50, "📋 已获取基本信息，正在获取可用格式...")
+        
+        def get_quick_info_thread():
+            quick = self.downloader.get_quick_info(url)
+            if not quick or not is_current():
+                return
+            self.root.after(0, lambda: show_quick_info(quick))
+            if quick.get('thumbnail'):
+                state['thumbnail_shown'] = True
+                self.gui.download_and_display_thumbnail(quick['thumbnail'], quick.get('id'))
+        
         def get_info_thread():
             try:
                 # 更新进度
                 self.root.after(0, lambda: self.update_progress(30, "📡 连接视频源..."))
                 info = self.downloader.get_video_info(url)
+                if not is_current():
+                    return
+                # 界面只需要紧凑信息，下载时会重新获取
+                info.release_raw()
                 self.root.after(0, lambda: self.update_progress(70, "📋 解析视频信息..."))
                 
                 # 格式化视频信息
@@ -185,15 +243,18 @@ class YouTubeDownloaderApp:
 
 📝 描述: {desc_text}"""
                 
-                # 在主线程中更新UI
-                self.root.after(0, lambda: self.update_info_display(info_text))
+                # 第二阶段：在主线程中更新完整信息、格式和质量选项
+                def show_full_info():
+                    state['full_done'] = True
+                    self.update_info_display(info_text)
+                self.root.after(0, show_full_info)
                 self.root.after(0, lambda: self.update_quality_options(info))
                 self.root.after(0, lambda: self.display_available_formats(info))
                 
-                # 下载缩略图
+                # 下载缩略图（第一阶段已显示时不再重复获取）
                 thumbnail_url = info.get('thumbnail')
-                if thumbnail_url:
-                    self.gui.download_and_display_thumbnail(thumbnail_url)
+                if thumbnail_url and not state['thumbnail_shown']:
+                    self.gui.download_and_display_thumbnail(thumbnail_url, info.get('id'))
                 
                 # 启用下载按钮
                 self.root.after(0, lambda: self.download_button.configure(state='normal'))
@@ -201,21 +262,76 @@ class YouTubeDownloaderApp:
                 
             except Exception as e:
                 error_msg = str(e)
-                # 根据错误类型显示不同的提示信息
-                if "网络连接超时或无法访问YouTube" in error_msg:
+                # 已分类的错误自带提示信息
+                if isinstance(e, DownloadFailure):
                     display_msg = f"❌ {error_msg}"
                 else:
                     display_msg = f"❌ 获取视频信息失败:\n{error_msg}"
-                self.root.after(0, lambda: self.update_info_display(display_msg))
+                if is_current():
+                    state['full_done'] = True
+                    self.root.after(0, lambda: self.update_info_display(display_msg))
             
             finally:
                 self.root.after(0, self.reset_info_button)
                 # 3秒后清除进度信息
                 self.root.after(3000, lambda: self.update_progress(0, "⚡ 程序就绪"))
         
+        threading.Thread(target=get_quick_info_thread, daemon=True).start()
         thread = threading.Thread(target=get_info_thread, daemon=True)
         thread.start()
     
+    def _build_quick_info_text(self, quick):
+        """生成第一阶段的基本信息文本"""
+        lines = [f"📺 标题: {quick.get('title')}", ""]
+        if quick.get('duration'):
+            lines.append(f"⏱️ 时长: {self.downloader.format_duration(quick['duration'])}")
+        if quick.get('uploader'):
+            lines.append(f"👤 上传者: {quick['uploader']}")
+        upload_date = quick.get('upload_date')
+        if upload_date and len(upload_date) == 8:
+            lines.append(f"📅 上传日期: {upload_date[:4]}-{upload_date[4:6]}-{upload_date[6:8]}")
+        lines.extend(["", "⏳ 正在获取可用格式和详细信息..."])
+        return "\n".join(lines)
+    
+    def get_playlist_info(self, url, preview_count=20):
+        """预览播放列表/频道（扁平枚举前若干个视频）"""
+        def get_playlist_thread():
+            try:
+                self.root.after(0, lambda: self.update_progress(30, "📃 正在获取列表..."))
+                lines = []
+                entries = self.downloader.iter_playlist_entries(url)
+                try:
+                    for entry in entries:
+                        duration = self.downloader.format_duration(entry['duration']) if entry.get('duration') else "--:--"
+                        lines.append(f"{len(lines) + 1}. [{duration}] {entry.get('title') or entry['url']}")
+                        preview = "\n".join(lines)
+                        self.root.after(0, lambda t=preview: self.update_info_display(f"📃 播放列表/频道预览:\n\n{t}"))
+                        if len(lines) >= preview_count:
+                            break
+                finally:
+                    entries.close()
+                
+                if not lines:
+                    raise Exception("列表中没有可下载的视频")
+                
+                more_text = "\n...\n\n💡 下载时将边获取列表边下载，无需等待完整列表" if len(lines) >= preview_count else ""
+                preview_text = "📃 播放列表/频道预览:\n\n" + "\n".join(lines) + more_text
+                self.root.after(0, lambda: self.update_info_display(preview_text))
+                self.root.after(0, self.update_playlist_quality_options)
+                self.root.after(0, lambda: self.download_button.configure(state='normal'))
+                self.root.after(0, lambda: self.update_progress(100, "✅ 列表信息获取完成"))
+            
+            except Exception as e:
+                error_msg = str(e)
+                self.root.after(0, lambda: self.update_info_display(f"❌ 获取列表信息失败:\n{error_msg}"))
+            
+            finally:
+                self.root.after(0, self.reset_info_button)
+                self.root.after(3000, lambda: self.update_progress(0, "⚡ 程序就绪"))
+        
+        thread = threading.Thread(target=get_playlist_thread, daemon=True)
+        thread.start()
+    
     def update_info_display(self, text):
         """更新信息显示"""
         self.info_text.delete(1.0, tk.END)
@@ -227,10 +343,10 @@ class YouTubeDownloaderApp:
     
     def display_available_formats(self, info):
         """显示可用的视频格式信息"""
-        if not info or not info.get('formats'):
+        if not info or not info.formats:
             return
         
-        formats = info.get('formats', [])
+        formats = info.formats
         
         # 分析格式信息
         video_with_audio = []    # 有音频的视频格式
@@ -305,7 +421,7 @@ class YouTubeDownloaderApp:
     def update_quality_options(self, info=None):
         """更新质量选项"""
         if info:
-            self.available_formats = info.get('formats', [])
+            self.available_formats = info.formats
         
         # 分析可用格式
         max_video_only_height = 0      # 最高画质的仅视频格式
@@ -395,6 +511,17 @@ class YouTubeDownloaderApp:
             self.quality_combo.set(quality_options[0])  # 默认选择第一个（最佳）选项
         self.update_quality_description()
     
+    def update_playlist_quality_options(self):
+        """播放列表模式的通用质量选项（每个视频下载前再按实际格式选择）"""
+        self.available_formats = None
+        self.max_video_height = 0
+        self.needs_merge = True
+        quality_options = list(self.downloader.GENERIC_QUALITY_OPTIONS)
+        self.best_quality_text = quality_options[0]
+        self.quality_combo['values'] = quality_options
+        self.quality_combo.set(quality_options[0])
+        self.update_quality_description()
+    
     def on_quality_change(self, event=None):
         """质量选择改变时的回调"""
         self.update_quality_description()
@@ -405,7 +532,8 @@ class YouTubeDownloaderApp:
         
         # 处理动态选项
         if selected.startswith("🎯 最佳画质") and "分离合并" in selected:
-            desc = f"{self.max_video_height}p视频+音频分别下载后合并，画质最佳但耗时较长"
+            height_text = f"{self.max_video_height}p" if self.max_video_height else "最高画质"
+            desc = f"{height_text}视频+音频分别下载后合并，画质最佳但耗时较长"
         elif selected.startswith("🎯 最佳画质") and "仅视频" in selected:
             desc = f"下载{self.max_video_height}p最高画质视频，但该格式无音频"
         elif selected.startswith("🎯 最佳画质"):
@@ -451,14 +579,36 @@ class YouTubeDownloaderApp:
             messagebox.showerror("错误", f"下载路径不存在: {download_path}")
             return
         
+        try:
+            clip = self.downloader.parse_clip_range(self.clip_start_entry.get(), self.clip_end_entry.get())
+        except Exception as e:
+            messagebox.showerror("错误", str(e))
+            return
+        
+        # 播放列表/频道：边枚举边加入下载流水线
+        if self.downloader.is_playlist_url(url):
+            if clip:
+                messagebox.showerror("错误", "片段下载只支持单个视频")
+                return
+            sync = self.sync_only_var.get()
+            self.pipeline.submit_playlist(url, download_path, quality, sync=sync)
+            self.update_cancel_button()
+            if sync:
+                self.update_progress(0, "🔄 正在同步新上传的视频...")
+            else:
+                self.update_progress(0, "📃 正在获取列表并加入下载队列...")
+            return
+        
         # 重置状态
         self.download_paused = False
         self.video_file = None
         self.audio_file = None
+        cancel_token = self.download_cancel_token = CancelToken()
         
         # 更新UI状态
         self.download_button.configure(state='disabled')
         self.pause_button.configure(state='normal')
+        self.cancel_button.configure(state='normal')
         # 确保进度条重置为0
         self.progress_bar['value'] = 0
         self.update_progress(0, "🚀 准备下载...")
@@ -475,26 +625,31 @@ class YouTubeDownloaderApp:
                     self.root.after(0, lambda: self.update_progress(10, "⚠️ 无法预获取文件大小，将动态计算进度..."))
                 
                 # 第二步：执行实际下载
-                self.downloader.execute_download(url, download_path, quality)
+                cancel_token.check()
+                self.downloader.execute_download(url, download_path, quality, clip=clip, cancel_token=cancel_token)
                 self.root.after(0, lambda: self.update_progress(100, "✅ 下载完成!"))
                 
                 # 更新缓存状态显示
                 self.root.after(0, lambda: self.gui.update_cache_button())
                 
+            except DownloadCancelled:
+                self.root.after(0, lambda: self.update_progress(0, "⏹️ 下载已取消"))
             except Exception as e:
                 error_msg = str(e)
                 # 检查是否为文件已存在错误
                 if "文件已存在" in error_msg:
                     # 显示文件已存在的详细信息
                     self.root.after(0, lambda: messagebox.showwarning("文件已存在", error_msg))
-                # 检查是否为网络连接相关错误
-                elif any(keyword in error_msg.lower() for keyword in ['timeout', 'connection', 'network', 'resolve', 'unreachable', 'failed to extract']):
+                # 已分类的错误（网络、磁盘、限流等）自带提示信息
+                elif isinstance(e, DownloadFailure):
                     display_msg = f"❌ {error_msg}"
                     self.root.after(0, lambda: self.update_progress(0, display_msg))
                 else:
                     display_msg = f"❌ 下载失败: {error_msg}"
                     self.root.after(0, lambda: self.update_progress(0, display_msg))
             finally:
+                if self.download_cancel_token is cancel_token:
+                    self.download_cancel_token = None
                 self.root.after(0, self.reset_download_button)
         
         thread = threading.Thread(target=download_thread, daemon=True)
@@ -510,11 +665,28 @@ class YouTubeDownloaderApp:
             self.pause_button.configure(text="暂停下载")
             self.update_progress(self.progress_bar['value'], "▶️ 恢复下载中...")
     
+    def cancel_download(self):
+        """取消当前下载和批量队列中所有未完成的任务"""
+        if self.download_cancel_token is not None:
+            self.download_cancel_token.cancel()
+        cancelled = self.pipeline.cancel_all()
+        self.cancel_button.configure(state='disabled')
+        status_text = "⏹️ 正在取消下载..."
+        if cancelled:
+            status_text = f"⏹️ 正在取消下载（批量任务 {cancelled} 个）..."
+        self.update_progress(self.progress_bar['value'], status_text)
+    
+    def update_cancel_button(self):
+        """有进行中的下载（单个或批量）时才可以取消"""
+        active = self.download_cancel_token is not None or self.pipeline.has_active_jobs()
+        self.cancel_button.configure(state='normal' if active else 'disabled')
+    
     def reset_download_button(self):
         """重置下载按钮状态"""
         self.download_button.configure(state='normal')
         self.pause_button.configure(state='disabled', text="暂停下载")
         self.download_paused = False
+        self.update_cancel_button()
     
     def update_progress(self, percentage, status_text):
         """更新进度显示"""
@@ -777,7 +949,10 @@ class YouTubeDownloaderApp:
     
     def run(self):
         """运行应用程序"""
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            self.extraction_pool.shutdown()
 
 
 def main():
@@ -791,4 +966,5 @@ def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+多链接解析模块 - 并行提取多个链接的视频信息（按主机限制并发）
+"""
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+from .config import config
+
+
+URL_PATTERN = re.compile(r'https?://[^\s,;"\'<>]+')
+
+# 同一站点的不同域名归为一个主机计算并发
+HOST_ALIASES = {
+    'youtu.be': 'youtube.com',
+    'm.youtube.com': 'youtube.com',
+    'music.youtube.com': 'youtube.com',
+    'www.youtube.com': 'youtube.com',
+}
+
+
+def parse_url_list(text):
+    """从文本（粘贴内容或文件内容）中提取链接，保持顺序并去重"""
+    urls = []
+    seen = set()
+    for url in URL_PATTERN.findall(text or ""):
+        url = url.rstrip(').]')
+        if url not in seen:
+            seen.add(url)
+            urls.append(url)
+    return urls
+
+
+def get_host_key(url):
+    """获取用于并发限制的主机标识"""
+    host = (urlparse(url).hostname or "").lower()
+    return HOST_ALIASES.get(host, host)
+
+
+def guess_video_id(url):
+    """不联网从常见YouTube链接中解析视频ID，无法识别时返回None"""
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if host == 'youtu.be':
+        return parsed.path.strip('/').split('/')[0] or None
+    if host.endswith('youtube.com'):
+        if parsed.path == '/watch':
+            return parse_qs(parsed.query).get('v', [None])[0]
+        match = re.match(r'^/(?:shorts|embed|live|v)/([\w-]{11})', parsed.path)
+        if match:
+            return match.group(1)
+    return None
+
+
+class MultiUrlExtractor:
+    """多链接信息提取器
+
+    在有界线程池中并行提取，每个主机另有并发上限；每个链接完成后立即回调，
+    相同视频ID的链接只提取一次，单个链接失败不影响其它链接。
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+
+    def _get_host_semaphore(self, url):
+        """获取主机对应的并发信号量"""
+        host = get_host_key(url)
+        with self._lock:
+            if host not in self._host_semaphores:
+                limit = max(1, int(config.get("per_host_extractions", 2) or 1))
+                self._host_semaphores[host] = threading.Semaphore(limit)
+            return self._host_semaphores[host]
+
+    def extract_all(self, urls, on_result, on_error, on_duplicate=None, on_done=None):
+        """后台并行提取，回调在工作线程中执行
+
+        on_result(url, info) / on_error(url, exception) / on_duplicate(url, video_id)
+        """
+        max_workers = max(1, int(config.get("max_concurrent_extractions", 4) or 1))
+        claimed_ids = {}
+        claimed_lock = threading.Lock()
+
+        def claim(url, video_id):
+            """登记视频ID，已被其它链接登记时返回False"""
+            if not video_id:
+                return True
+            with claimed_lock:
+                owner = claimed_ids.setdefault(video_id, url)
+            return owner == url
+
+        def extract_one(url):
+            # 能直接从链接解析出ID的，提取前就去重
+            if not claim(url, guess_video_id(url)):
+                if on_duplicate:
+                    on_duplicate(url, guess_video_id(url))
+                return
+            try:
+                with self._get_host_semaphore(url):
+                    info = self.parent.downloader.get_video_info(url)
+            except Exception as e:
+                on_error(url, e)
+                return
+            # 短链接、重定向等情况在提取后按真实ID再去重一次
+            if not claim(url, info.get('id')):
+                if on_duplicate:
+                    on_duplicate(url, info.get('id'))
+                return
+            on_result(url, info)
+
+        def run_all():
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for url in urls:
+                    executor.submit(extract_one, url)
+            if on_done:
+                on_done()
+
+        thread = threading.Thread(target=run_all, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,184 @@
+"""
+后处理调度模块 - 限制FFmpeg合并等后处理任务的并发数
+"""
+import os
+import heapq
+import itertools
+import threading
+import time
+from .config import config
+
+
+class PostProcessTask:
+    """后处理任务，可等待执行结果"""
+
+    def __init__(self, func, args, kwargs, priority, name):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.name = name
+        self.submit_time = time.time()
+        self.start_time = None
+        self.finish_time = None
+        self.return_value = None
+        self.exception = None
+        self._done = threading.Event()
+
+    @property
+    def queue_time(self):
+        """排队等待时长（秒）"""
+        if self.start_time is None:
+            return time.time() - self.submit_time
+        return self.start_time - self.submit_time
+
+    @property
+    def run_time(self):
+        """执行时长（秒）"""
+        if self.start_time is None:
+            return 0.0
+        return (self.finish_time or time.time()) - self.start_time
+
+    def done(self):
+        """任务是否已结束"""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """等待任务结束并返回结果，任务异常时重新抛出"""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"后处理任务等待超时: {self.name}")
+        if self.exception:
+            raise self.exception
+        return self.return_value
+
+
+class PostProcessExecutor:
+    """后处理执行器（有界并发 + 优先级队列）"""
+
+    # 优先级数值越小越先执行
+    PRIORITY_INTERACTIVE = 0   # 用户手动发起的本地合并
+    PRIORITY_DOWNLOAD = 10     # 下载完成后的自动合并
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._queue = []  # (priority, seq, task) 堆
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._running = 0
+        self._metrics = {
+            'completed': 0,
+            'failed': 0,
+            'total_queue_time': 0.0,
+            'max_queue_time': 0.0,
+            'total_run_time': 0.0,
+        }
+
+    def submit(self, func, *args, priority=PRIORITY_DOWNLOAD, name=None, **kwargs):
+        """提交后处理任务，返回PostProcessTask"""
+        task = PostProcessTask(func, args, kwargs, priority, name or getattr(func, '__name__', 'task'))
+        with self._lock:
+            heapq.heappush(self._queue, (priority, next(self._counter), task))
+            waiting = len(self._queue)
+
+        if self._running >= self.get_concurrency_limit():
+            print(f"⏳ 后处理任务排队: {task.name} (等待中 {waiting} 个, 执行中 {self._running} 个)")
+
+        self._dispatch()
+        return task
+
+    def pending_count(self):
+        """排队中的任务数"""
+        with self._lock:
+            return len(self._queue)
+
+    def get_concurrency_limit(self):
+        """根据配置、CPU数量和当前I/O负载计算并发上限"""
+        configured = config.get("max_concurrent_merges", 0)
+        if configured and configured > 0:
+            return int(configured)
+
+        cpu_count = os.cpu_count() or 2
+        # 合并以流复制为主，瓶颈在磁盘，CPU再多也不宜同时跑太多FFmpeg
+        limit = max(1, min(4, cpu_count // 2))
+
+        io_pressure = self._get_io_pressure()
+        if io_pressure is not None:
+            if io_pressure > 40:
+                limit = 1
+            elif io_pressure > 15:
+                limit = max(1, limit // 2)
+        else:
+            load = self._get_load_ratio(cpu_count)
+            if load is not None and load > 1.0:
+                limit = max(1, limit // 2)
+
+        return limit
+
+    def _get_io_pressure(self):
+        """读取Linux PSI的I/O压力（最近10秒阻塞百分比），不可用时返回None"""
+        try:
+            with open('/proc/pressure/io', 'r') as f:
+                for line in f:
+                    if line.startswith('some'):
+                        for field in line.split():
+                            if field.startswith('avg10='):
+                                return float(field.split('=')[1])
+        except Exception:
+            pass
+        return None
+
+    def _get_load_ratio(self, cpu_count):
+        """获取平均负载与CPU数量的比值，不可用时返回None"""
+        try:
+            return os.getloadavg()[0] / cpu_count
+        except (AttributeError, OSError):
+            return None
+
+    def _dispatch(self):
+        """在并发上限内启动排队任务"""
+        limit = self.get_concurrency_limit()
+        to_start = []
+        with self._lock:
+            while self._queue and self._running < limit:
+                _, _, task = heapq.heappop(self._queue)
+                self._running += 1
+                to_start.append(task)
+
+        for task in to_start:
+            thread = threading.Thread(target=self._run_task, args=(task,), daemon=True)
+            thread.start()
+
+    def _run_task(self, task):
+        """执行单个任务并记录指标"""
+        task.start_time = time.time()
+        try:
+            task.return_value = task.func(*task.args, **task.kwargs)
+        except Exception as e:
+            task.exception = e
+        finally:
+            task.finish_time = time.time()
+            with self._lock:
+                self._running -= 1
+                queue_time = task.queue_time
+                self._metrics['total_queue_time'] += queue_time
+                self._metrics['max_queue_time'] = max(self._metrics['max_queue_time'], queue_time)
+                self._metrics['total_run_time'] += task.run_time
+                if task.exception:
+                    self._metrics['failed'] += 1
+                else:
+                    self._metrics['completed'] += 1
+            print(f"⏱️ 后处理任务结束: {task.name} | 排队 {queue_time:.1f}秒 | 执行 {task.run_time:.1f}秒")
+            task._done.set()
+            self._dispatch()
+
+    def get_metrics(self):
+        """获取队列指标"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['queued'] = len(self._queue)
+            metrics['running'] = self._running
+        finished = metrics['completed'] + metrics['failed']
+        metrics['avg_queue_time'] = metrics['total_queue_time'] / finished if finished else 0.0
+        metrics['avg_run_time'] = metrics['total_run_time'] / finished if finished else 0.0
+        metrics['concurrency_limit'] = self.get_concurrency_limit()
+        return metrics
@@ -0,0 +1,163 @@
+"""
+代理池模块 - 多个HTTP/SOCKS代理按健康度和吞吐量评分分配给任务，失败时自动切换
+"""
+import time
+import threading
+from .config import config
+
+
+class _ProxyState:
+    """单个代理的评分状态"""
+
+    __slots__ = ('url', 'health', 'throughput', 'active', 'down_until', 'failures')
+
+    def __init__(self, url):
+        self.url = url
+        self.health = 1.0        # 0~1，成功时回升、失败时减半
+        self.throughput = None   # 字节/秒的指数移动平均，未测量时为None
+        self.active = 0          # 当前分配到的任务数
+        self.down_until = 0      # 暂停使用直到该时间
+        self.failures = 0
+
+
+class ProxyPool:
+    """代理池
+
+    代理列表来自配置proxies（兼容旧的单个proxy），为空时直接连接（代理为None）。
+    每个任务在传输期间固定使用一个代理；新任务分配给"健康度 × 吞吐量 / (已分配任务数+1)"最高的代理，
+    使并发任务分散到各代理上叠加总带宽；代理出错时降低健康度，连续失败暂停一段时间，任务切换到其它代理。
+    """
+
+    HEALTH_RECOVERY = 0.2       # 每次成功向1回升的比例
+    THROUGHPUT_WEIGHT = 0.3     # 吞吐量移动平均中新样本的权重
+    DOWN_THRESHOLD = 0.2        # 健康度低于该值时暂停使用
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+        self._assignments = {}  # 任务 -> 代理
+
+    def _configured(self):
+        """配置中的代理列表（去重、保持顺序）"""
+        proxies = list(config.get("proxies") or [])
+        legacy = config.get("proxy", "")
+        if not proxies and legacy:
+            proxies = [legacy]
+        seen = []
+        for proxy in proxies:
+            proxy = (proxy or "").strip()
+            if proxy and proxy not in seen:
+                seen.append(proxy)
+        return seen
+
+    def _candidates(self, exclude=()):
+        """当前可用的代理状态（调用方持有锁）"""
+        now = time.time()
+        states = []
+        for url in self._configured():
+            state = self._states.get(url)
+            if state is None:
+                state = self._states[url] = _ProxyState(url)
+            if url not in exclude and state.down_until <= now:
+                states.append(state)
+        return states
+
+    def _score(self, state, default_throughput):
+        throughput = state.throughput if state.throughput is not None else default_throughput
+        return state.health * throughput / (state.active + 1)
+
+    def _choose(self, exclude=()):
+        """选择评分最高的代理（调用方持有锁）；没有配置代理时返回None"""
+        if not self._configured():
+            return None
+        candidates = self._candidates(exclude)
+        if not candidates:
+            # 全部暂停或已排除时，选最早恢复的，不让任务卡住
+            candidates = sorted((self._states[url] for url in self._configured()),
+                                key=lambda s: (s.url in exclude, s.down_until))[:1]
+        measured = [s.throughput for s in candidates if s.throughput]
+        # 未测量的代理按已知最快的估计，保证新代理会被尝试
+        default_throughput = max(measured) if measured else 1.0
+        return max(candidates, key=lambda s: self._score(s, default_throughput)).url
+
+    def choose(self):
+        """为单次请求（如信息提取）选择代理，不占用分配名额"""
+        with self._lock:
+            return self._choose()
+
+    def acquire(self, job):
+        """为任务分配代理（已分配且可用时沿用同一个）"""
+        with self._lock:
+            proxy = self._assignments.get(job)
+            state = self._states.get(proxy)
+            if proxy is not None and state is not None and state.down_until <= time.time():
+                return proxy
+            if proxy is not None and state is not None:
+                state.active -= 1
+            proxy = self._choose()
+            if proxy is not None:
+                self._assignments[job] = proxy
+                self._states[proxy].active += 1
+            return proxy
+
+    def release(self, job):
+        """任务传输结束，释放其代理"""
+        with self._lock:
+            proxy = self._assignments.pop(job, None)
+            state = self._states.get(proxy)
+            if state is not None:
+                state.active = max(0, state.active - 1)
+
+    def failover(self, job):
+        """任务当前代理出错，切换到其它代理并返回新代理"""
+        with self._lock:
+            current = self._assignments.get(job)
+            proxy = self._choose(exclude=(current,) if current else ())
+            if proxy is None or proxy == current:
+                return current
+            if current in self._states:
+                self._states[current].active = max(0, self._states[current].active - 1)
+            self._assignments[job] = proxy
+            self._states[proxy].active += 1
+            print(f"🔀 切换代理: {current} → {proxy}")
+            return proxy
+
+    def report_success(self, proxy, throughput=None):
+        """报告成功（可附带测得的吞吐量，字节/秒）"""
+        if proxy is None:
+            return
+        with self._lock:
+            state = self._states.get(proxy)
+            if state is None:
+                return
+            state.failures = 0
+            state.health += (1.0 - state.health) * self.HEALTH_RECOVERY
+            if throughput:
+                if state.throughput is None:
+                    state.throughput = throughput
+                else:
+                    state.throughput += (throughput - state.throughput) * self.THROUGHPUT_WEIGHT
+
+    def report_failure(self, proxy):
+        """报告失败：健康度减半，过低时暂停使用（多次失败暂停时间加长）"""
+        if proxy is None:
+            return
+        with self._lock:
+            state = self._states.get(proxy)
+            if state is None:
+                return
+            state.failures += 1
+            state.health /= 2
+            if state.health < self.DOWN_THRESHOLD:
+                cooldown = min(config.get("proxy_cooldown_seconds", 60) * state.failures, 600)
+                state.down_until = time.time() + cooldown
+                state.health = 0.5  # 恢复后以中等健康度重新参与分配
+                print(f"⛔ 代理暂停使用 {cooldown:.0f} 秒: {proxy}")
+
+    def get_stats(self):
+        """各代理的当前评分（用于显示和调试）"""
+        with self._lock:
+            self._candidates()
+            return [{'proxy': s.url, 'health': round(s.health, 2), 'throughput': s.throughput,
+                     'active': s.active, 'down': s.down_until > time.time()}
+                    for s in (self._states[url] for url in self._configured())]
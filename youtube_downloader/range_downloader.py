@@ -0,0 +1,302 @@
+"""
+多连接分段下载模块 - 渐进式（单一地址、非分片）格式按字节区间并行下载，支持断点续传
+"""
+import os
+import json
+import errno
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .http_session import http_pool
+from .throttle_detector import StreamThrottled
+
+
+class RangeNotSupported(Exception):
+    """服务器不支持Range请求或无法获得文件大小"""
+
+
+class RangeDownloader:
+    """多连接分段下载器
+
+    文件按固定大小分段，多个连接（来自共享连接池）并行下载各段并按偏移写入预分配的
+    .native.part文件（与yt-dlp的.part区分，避免yt-dlp把预分配的文件当作已下载完成）；
+    已完成的分段记录在位图中并持久化，中断后重新下载时只补齐缺失的分段。
+    检测到持续限速时通过url_refresher换用新的下载地址，各连接从当前偏移继续下载。
+    """
+
+    MIN_CHUNK_SIZE = 1024 * 1024          # 分段最小1MB
+    MAX_CHUNK_SIZE = 10 * 1024 * 1024     # 分段最大10MB（过大的区间请求容易被上游限速）
+    MIN_READ_SIZE = 64 * 1024
+    MAX_READ_SIZE = 1024 * 1024
+    STATE_SAVE_INTERVAL = 1.0             # 位图最多每秒写一次
+
+    def __init__(self, url, output_path, headers=None, connections=4, expected_size=None,
+                 max_chunk_size=None, progress_callback=None, throttle_detector=None, url_refresher=None,
+                 proxy=None, hasher=None):
+        self.url = url
+        self.output_path = output_path
+        self.headers = dict(headers or {})
+        self.connections = max(1, int(connections))
+        self.expected_size = expected_size
+        self.max_chunk_size = int(max_chunk_size or self.MAX_CHUNK_SIZE)
+        self.progress_callback = progress_callback  # 回调: progress_callback(已下载字节, 总字节, 速度)
+        self.throttle_detector = throttle_detector
+        self.url_refresher = url_refresher  # 返回(新地址, 请求头)，无法刷新时返回None
+        self.proxies = {'http': proxy, 'https': proxy} if proxy else None
+        self.hasher = hasher  # BlockHasher，写入时同时计算内容哈希
+
+        self.part_path, self.state_path = self.temp_paths(output_path)
+
+        self._state = None
+        self._state_lock = threading.Lock()
+        self._last_save = 0
+        self._total = 0
+        self._downloaded = 0
+        self._session_bytes = 0
+        self._start_time = None
+        self._last_report = 0
+        self._url_generation = 0  # 每次换用新地址加一，各连接据此切换
+        self._refresh_lock = threading.Lock()
+        self._aborted = False  # 某个分段失败（或任务取消）后其它连接尽快停止
+
+    # ------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------
+
+    @staticmethod
+    def temp_paths(output_path):
+        """下载中的.part文件和分段状态文件路径"""
+        part_path = output_path + ".native.part"
+        return part_path, part_path + ".ranges.json"
+
+    @classmethod
+    def discard(cls, output_path):
+        """删除未完成的.part文件和分段状态（改用其它下载器前调用）"""
+        for path in cls.temp_paths(output_path):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"删除分段下载临时文件失败: {e}")
+
+    def download(self):
+        """下载文件，返回输出路径；服务器不支持分段时抛出RangeNotSupported"""
+        size, etag = self._probe(self.url, self.headers)
+        if self.expected_size and size != self.expected_size:
+            raise RangeNotSupported(f"文件大小不符: {size}/{self.expected_size}")
+
+        self._load_state(size, etag)
+        chunk_size = self._state['chunk_size']
+        count = self._chunk_count(size, chunk_size)
+        pending = [index for index in range(count) if not self._is_done(index)]
+
+        self._total = size
+        self._downloaded = size - sum(self._chunk_length(index, chunk_size, size) for index in pending)
+        self._start_time = time.time()
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.connections, len(pending))) as executor:
+                futures = [executor.submit(self._fetch_chunk, index, chunk_size, size) for index in pending]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    self._aborted = True
+                    raise
+                finally:
+                    for future in futures:
+                        future.cancel()
+                    with self._state_lock:
+                        self._save_state(force=True)
+
+        if os.path.getsize(self.part_path) != size or not all(self._is_done(i) for i in range(count)):
+            raise Exception("分段下载不完整")
+        os.replace(self.part_path, self.output_path)
+        self._remove_state()
+        return self.output_path
+
+    # ------------------------------------------------
+    # 探测与状态
+    # ------------------------------------------------
+
+    def _probe(self, url, headers):
+        """请求第一个字节，确认支持Range并获取文件大小和ETag"""
+        headers = dict(headers, Range='bytes=0-0')
+        response = http_pool.get(url, headers=headers, stream=True, timeout=30, proxies=self.proxies)
+        try:
+            response.raise_for_status()
+            content_range = response.headers.get('Content-Range', '')
+            total = content_range.rsplit('/', 1)[-1]
+            if response.status_code != 206 or not total.isdigit():
+                raise RangeNotSupported("服务器不支持分段下载")
+            return int(total), response.headers.get('ETag', '')
+        finally:
+            response.close()
+
+    def _choose_chunk_size(self, size):
+        """根据文件大小和连接数选择分段大小"""
+        chunk_size = size // (self.connections * 4)
+        chunk_size = max(self.MIN_CHUNK_SIZE, min(self.max_chunk_size, chunk_size))
+        # 按1MB对齐，使内容哈希的块不跨分段
+        return chunk_size // self.MIN_CHUNK_SIZE * self.MIN_CHUNK_SIZE
+
+    def _chunk_count(self, size, chunk_size):
+        return (size + chunk_size - 1) // chunk_size
+
+    def _chunk_length(self, index, chunk_size, size):
+        return min(chunk_size, size - index * chunk_size)
+
+    def _load_state(self, size, etag):
+        """加载断点续传位图，文件变化或状态无效时重新预分配"""
+        state = None
+        try:
+            if os.path.exists(self.state_path) and os.path.exists(self.part_path):
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if (state.get('size') != size or state.get('etag') != etag or
+                        os.path.getsize(self.part_path) != size):
+                    state = None
+                else:
+                    state['bitmap'] = bytearray.fromhex(state['bitmap'])
+        except Exception as e:
+            print(f"读取分段状态失败: {e}")
+            state = None
+
+        if state is None:
+            chunk_size = self._choose_chunk_size(size)
+            count = self._chunk_count(size, chunk_size)
+            state = {'size': size, 'etag': etag, 'chunk_size': chunk_size,
+                     'bitmap': bytearray((count + 7) // 8)}
+            self._preallocate(size)
+        else:
+            done = sum(bin(byte).count('1') for byte in state['bitmap'])
+            print(f"⏯️ 恢复分段下载: 已完成 {done} 个分段")
+
+        self._state = state
+        with self._state_lock:
+            self._save_state(force=True)
+
+    def _preallocate(self, size):
+        """预分配.native.part文件，各连接按偏移写入"""
+        os.makedirs(os.path.dirname(self.part_path) or '.', exist_ok=True)
+        with open(self.part_path, 'wb') as f:
+            f.truncate(size)
+            if hasattr(os, 'posix_fallocate') and size > 0:
+                try:
+                    os.posix_fallocate(f.fileno(), 0, size)
+                except OSError as e:
+                    # 文件系统不支持预分配时忽略；空间不足时立即失败，不必等写到一半
+                    if e.errno in (errno.ENOSPC, getattr(errno, 'EDQUOT', errno.ENOSPC)):
+                        raise
+
+    def _is_done(self, index):
+        return bool(self._state['bitmap'][index // 8] & (1 << (index % 8)))
+
+    def _mark_done(self, index):
+        """在位图中标记分段完成（调用方持有锁）"""
+        self._state['bitmap'][index // 8] |= 1 << (index % 8)
+        self._save_state()
+
+    def _save_state(self, force=False):
+        """原子写入位图（调用方持有锁），默认限制写入频率"""
+        now = time.time()
+        if not force and now - self._last_save < self.STATE_SAVE_INTERVAL:
+            return
+        self._last_save = now
+        data = dict(self._state, bitmap=self._state['bitmap'].hex())
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.state_path)
+
+    def _remove_state(self):
+        try:
+            if os.path.exists(self.state_path):
+                os.remove(self.state_path)
+        except OSError:
+            pass
+
+    # ------------------------------------------------
+    # 下载
+    # ------------------------------------------------
+
+    def _fetch_chunk(self, index, chunk_size, size):
+        """下载单个分段并写入对应偏移；下载地址被刷新时从当前偏移用新地址继续"""
+        start = index * chunk_size
+        end = start + self._chunk_length(index, chunk_size, size) - 1
+        position = start
+        read_size = self.MIN_READ_SIZE
+        with open(self.part_path, 'r+b') as f:
+            while position <= end:
+                generation = self._url_generation
+                headers = dict(self.headers, Range=f'bytes={position}-{end}')
+                response = http_pool.get(self.url, headers=headers, stream=True, timeout=30,
+                                         proxies=self.proxies)
+                try:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise Exception(f"服务器未返回分段内容 (HTTP {response.status_code})")
+
+                    f.seek(position)
+                    while position <= end and generation == self._url_generation and not self._aborted:
+                        read_start = time.time()
+                        chunk = response.raw.read(min(read_size, end - position + 1))
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        if self.hasher is not None:
+                            self.hasher.update(position, chunk)
+                        position += len(chunk)
+                        self._add_progress(len(chunk))
+                        # 读取很快说明带宽充足，增大缓冲减少系统调用
+                        if time.time() - read_start < 0.05 and read_size < self.MAX_READ_SIZE:
+                            read_size *= 2
+                finally:
+                    response.close()
+
+                if self._aborted:
+                    return
+                if position <= end and generation == self._url_generation:
+                    raise Exception(f"分段 {index} 不完整: {position - start}/{end - start + 1}")
+
+        with self._state_lock:
+            self._mark_done(index)
+
+    def _add_progress(self, length):
+        """累计进度并限频回调，同时检测限速"""
+        with self._state_lock:
+            self._downloaded += length
+            self._session_bytes += length
+            downloaded = self._downloaded
+            throttled = self.throttle_detector is not None and self.throttle_detector.update(downloaded)
+            now = time.time()
+            report = now - self._last_report >= 0.2 or downloaded >= self._total
+            if report:
+                self._last_report = now
+        if throttled:
+            self._refresh_url()
+        if report and self.progress_callback:
+            elapsed = max(now - self._start_time, 0.001)
+            self.progress_callback(downloaded, self._total, self._session_bytes / elapsed)
+
+    def _refresh_url(self):
+        """换用刷新后的下载地址；无法刷新时抛出StreamThrottled"""
+        # 只由一个连接执行刷新，其它连接照常继续
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            result = self.url_refresher() if self.url_refresher else None
+            if result is None:
+                raise StreamThrottled("下载速度持续过低，且无法刷新下载地址")
+            url, headers = result
+            size, _ = self._probe(url, headers or {})
+            if size != self._total:
+                raise StreamThrottled(f"刷新后的文件大小不符: {size}/{self._total}")
+            with self._state_lock:
+                self.url = url
+                self.headers = dict(headers or {})
+                self._url_generation += 1
+                self.throttle_detector.reset()
+            print("🔄 已换用新的下载地址，从当前位置继续")
+        finally:
+            self._refresh_lock.release()
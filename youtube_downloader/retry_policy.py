@@ -0,0 +1,294 @@
+"""
+重试策略模块 - 错误分类、带抖动的指数退避，以及所有任务共享的按主机熔断器
+"""
+import re
+import ssl
+import time
+import errno
+import random
+import socket
+import threading
+from .config import config
+from .multi_url import get_host_key
+
+
+# 错误类型
+DNS = "dns"
+CONNECT = "connect"
+TIMEOUT = "timeout"
+EXTRACT_TIMEOUT = "extract_timeout"
+TLS = "tls"
+HTTP_403 = "http_403"
+HTTP_429 = "http_429"
+HTTP_5XX = "http_5xx"
+HTTP_OTHER = "http"
+DISK = "disk"
+UNKNOWN = "unknown"
+
+ERROR_LABELS = {
+    DNS: "域名解析失败",
+    CONNECT: "连接失败",
+    TIMEOUT: "网络超时",
+    EXTRACT_TIMEOUT: "信息提取超时",
+    TLS: "TLS握手失败",
+    HTTP_403: "访问被拒绝(403)",
+    HTTP_429: "请求过于频繁(429)",
+    HTTP_5XX: "服务器错误(5xx)",
+    HTTP_OTHER: "HTTP错误",
+    DISK: "磁盘写入失败",
+    UNKNOWN: "未知错误",
+}
+
+# 可以重试的类型（403通常是地址过期，重试前会重新提取）；提取超时时进程已等满超时后被结束，
+# 重试只会让卡住的视频占用更久
+RETRYABLE = {DNS, CONNECT, TIMEOUT, TLS, HTTP_403, HTTP_429, HTTP_5XX}
+# 网络问题（界面提示检查网络）
+NETWORK = {DNS, CONNECT, TIMEOUT, TLS}
+# 说明主机过载或不可达，计入熔断器
+HOST_FAILURES = {DNS, CONNECT, TIMEOUT, EXTRACT_TIMEOUT, HTTP_429, HTTP_5XX}
+# 经代理访问时可能由代理引起（网络问题、代理故障返回的502/503、出口IP被拒绝/限流），计入代理健康度
+PROXY_FAILURES = NETWORK | {EXTRACT_TIMEOUT, HTTP_403, HTTP_429, HTTP_5XX}
+
+DISK_ERRNOS = {errno.ENOSPC, errno.EROFS, errno.EACCES, getattr(errno, 'EDQUOT', errno.ENOSPC)}
+
+# 只有文本时（如提取进程传回的错误信息）按文本分类
+MESSAGE_PATTERNS = [
+    (DISK, re.compile(r'No space left|Errno 28|Read-only file system|磁盘空间不足', re.I)),
+    (HTTP_429, re.compile(r'HTTP Error 429|\b429\b.*Too Many|Too Many Requests', re.I)),
+    (HTTP_403, re.compile(r'HTTP Error 403|\b403\b.*Forbidden', re.I)),
+    (HTTP_5XX, re.compile(r'HTTP Error 5\d\d|\b5\d\d\b.*(Server Error|Service Unavailable|Bad Gateway)', re.I)),
+    (DNS, re.compile(r'getaddrinfo|Name or service not known|Temporary failure in name resolution|'
+                     r'nodename nor servname|Failed to resolve|NameResolutionError', re.I)),
+    (TLS, re.compile(r'\[SSL|SSLError|CERTIFICATE_VERIFY_FAILED|TLS', re.I)),
+    (TIMEOUT, re.compile(r'timed out|timeout', re.I)),
+    (CONNECT, re.compile(r'Connection (refused|reset|aborted)|Network is unreachable|No route to host|'
+                         r'RemoteDisconnected|ConnectionError|Max retries exceeded|IncompleteRead', re.I)),
+]
+
+NETWORK_HINT = "网络连接超时或无法访问YouTube\n\n请检查：\n1. 网络连接是否正常\n2. 是否能够访问YouTube网站\n3. 防火墙或代理设置\n"
+
+
+class DownloadFailure(Exception):
+    """已分类的下载/提取错误，kind为错误类型"""
+
+    def __init__(self, kind, message, host=None, retry_after=None):
+        super().__init__(message)
+        self.kind = kind
+        self.host = host
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.kind in RETRYABLE
+
+    @property
+    def is_network(self):
+        return self.kind in NETWORK
+
+    @property
+    def label(self):
+        return ERROR_LABELS.get(self.kind, ERROR_LABELS[UNKNOWN])
+
+
+def get_breaker_key(url):
+    """熔断器按主机分组；YouTube的各个视频服务器节点视为同一主机"""
+    host = get_host_key(url) if '://' in (url or '') else (url or '')
+    if host.endswith('.googlevideo.com'):
+        return 'googlevideo.com'
+    return host
+
+
+def _iter_causes(error):
+    """遍历异常链（含yt-dlp包装的原始异常）"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        exc_info = getattr(error, 'exc_info', None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1 and isinstance(exc_info[1], BaseException):
+            error = exc_info[1]
+        else:
+            error = error.__cause__ or error.__context__
+
+
+def _get_status(error):
+    """取出HTTP状态码和Retry-After（兼容requests、urllib和yt-dlp的HTTPError）"""
+    response = getattr(error, 'response', None)
+    status = getattr(error, 'status', None) or getattr(error, 'code', None)
+    if status is None and response is not None:
+        status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+    if not isinstance(status, int):
+        return None, None
+    headers = getattr(response, 'headers', None) or getattr(error, 'headers', None) or {}
+    retry_after = None
+    try:
+        retry_after = float(headers.get('Retry-After'))
+    except (TypeError, ValueError, AttributeError):
+        pass
+    return status, retry_after
+
+
+def _kind_from_status(status):
+    if status == 403:
+        return HTTP_403
+    if status == 429:
+        return HTTP_429
+    if 500 <= status < 600:
+        return HTTP_5XX
+    return HTTP_OTHER
+
+
+def classify_error(error):
+    """返回(错误类型, Retry-After秒数)"""
+    if isinstance(error, DownloadFailure):
+        return error.kind, error.retry_after
+
+    for cause in _iter_causes(error):
+        status, retry_after = _get_status(cause)
+        if status is not None and status >= 400:
+            return _kind_from_status(status), retry_after
+        if isinstance(cause, socket.gaierror):
+            return DNS, None
+        if isinstance(cause, ssl.SSLError) or type(cause).__name__ in ('SSLError', 'CertificateVerifyError'):
+            return TLS, None
+        if type(cause).__name__ == 'ExtractionTimeout':
+            return EXTRACT_TIMEOUT, None
+        if isinstance(cause, (socket.timeout, TimeoutError)) or type(cause).__name__ in (
+                'ReadTimeout', 'ConnectTimeout'):
+            return TIMEOUT, None
+        if isinstance(cause, ConnectionError):
+            return CONNECT, None
+        if isinstance(cause, OSError) and cause.errno in DISK_ERRNOS:
+            return DISK, None
+
+    message = str(error)
+    for kind, pattern in MESSAGE_PATTERNS:
+        if pattern.search(message):
+            return kind, None
+    return UNKNOWN, None
+
+
+def wrap_error(error, host=None, prefix="下载失败"):
+    """把任意异常转换为带用户提示的DownloadFailure"""
+    if isinstance(error, DownloadFailure):
+        return error
+    kind, retry_after = classify_error(error)
+    detail = str(error)
+    if kind in NETWORK:
+        message = f"{NETWORK_HINT}\n详细错误信息：{detail}"
+    elif kind == DISK:
+        message = f"磁盘空间不足或无法写入，请检查保存目录\n\n详细错误信息：{detail}"
+    elif kind == HTTP_429:
+        message = f"请求过于频繁，YouTube暂时限制了访问，请稍后再试\n\n详细错误信息：{detail}"
+    else:
+        message = f"{prefix}: {detail}"
+    failure = DownloadFailure(kind, message, host, retry_after)
+    failure.__cause__ = error
+    return failure
+
+
+def compute_backoff(attempt, base=None, cap=None):
+    """带完全抖动的指数退避：在[0, min(上限, 基数*2^次数)]中随机取值"""
+    base = config.get("retry_backoff_base", 1.0) if base is None else base
+    cap = config.get("retry_backoff_max", 60) if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class HostCircuitBreaker:
+    """按主机的熔断器（所有任务共享）
+
+    同一主机连续失败达到阈值后熔断：冷却期内该主机的请求全部等待而不是各自重试；
+    冷却结束后只放行一个试探请求，成功则恢复，失败则冷却时间加倍。
+    """
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._hosts = {}  # host -> {'failures', 'open_until', 'cooldown', 'probing'}
+
+    def _state(self, host):
+        return self._hosts.setdefault(host, {'failures': 0, 'open_until': 0, 'cooldown': 0, 'probing': False})
+
+    def wait(self, host, cancel_event=None):
+        """等待该主机可以发起请求；冷却结束后的第一个请求作为试探"""
+        with self._lock:
+            while True:
+                state = self._state(host)
+                now = time.time()
+                if state['open_until'] == 0:
+                    return
+                if now >= state['open_until'] and not state['probing']:
+                    state['probing'] = True
+                    return
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                timeout = state['open_until'] - now if now < state['open_until'] else 1.0
+                self._lock.wait(max(0.1, min(timeout, 1.0)))
+
+    def record_success(self, host):
+        with self._lock:
+            state = self._state(host)
+            if state['open_until']:
+                print(f"✅ {host} 已恢复，解除熔断")
+            state.update(failures=0, open_until=0, cooldown=0, probing=False)
+            self._lock.notify_all()
+
+    def record_failure(self, host, kind, retry_after=None):
+        with self._lock:
+            state = self._state(host)
+            if kind not in HOST_FAILURES:
+                # 与主机状态无关的错误只结束试探
+                state['probing'] = False
+                self._lock.notify_all()
+                return
+            state['failures'] += 1
+            threshold = config.get("circuit_failure_threshold", 5)
+            if state['probing'] or state['failures'] >= threshold:
+                base = config.get("circuit_cooldown_seconds", 30)
+                cooldown = min(max(base, state['cooldown'] * 2), config.get("circuit_cooldown_max", 300))
+                cooldown = max(cooldown, retry_after or 0)
+                state.update(open_until=time.time() + cooldown, cooldown=cooldown, probing=False, failures=0)
+                print(f"⛔ {host} 连续失败（{ERROR_LABELS.get(kind)}），暂停请求 {cooldown:.0f} 秒")
+            self._lock.notify_all()
+
+    def is_open(self, host):
+        with self._lock:
+            return self._state(host)['open_until'] > time.time()
+
+
+class RetryPolicy:
+    """按错误类型决定是否重试，退避等待并经熔断器协调同一主机的所有任务"""
+
+    def __init__(self, breaker=None):
+        self.breaker = breaker or HostCircuitBreaker()
+
+    def run(self, func, host, description, passthrough=(), cancel_event=None, prefix="下载失败"):
+        """执行func(上次的DownloadFailure或None)，可重试的错误按退避重试
+
+        passthrough中的异常（如取消）原样抛出；最终失败时抛出DownloadFailure。
+        """
+        max_attempts = max(1, int(config.get("retry_max_attempts", 4)))
+        last_failure = None
+        for attempt in range(max_attempts):
+            self.breaker.wait(host, cancel_event)
+            try:
+                result = func(last_failure)
+            except passthrough:
+                # 取消等原样抛出的异常也要结束试探，否则该主机后续的请求会一直等待
+                self.breaker.record_failure(host, UNKNOWN)
+                raise
+            except Exception as e:
+                last_failure = wrap_error(e, host, prefix)
+                self.breaker.record_failure(host, last_failure.kind, last_failure.retry_after)
+                if not last_failure.retryable or attempt + 1 >= max_attempts:
+                    raise last_failure
+                delay = max(compute_backoff(attempt), last_failure.retry_after or 0)
+                print(f"🔁 {description}失败（{last_failure.label}），{delay:.1f}秒后重试"
+                      f"（{attempt + 1}/{max_attempts - 1}）")
+                if cancel_event is not None:
+                    if cancel_event.wait(delay):
+                        raise last_failure
+                else:
+                    time.sleep(delay)
+                continue
+            self.breaker.record_success(host)
+            return result
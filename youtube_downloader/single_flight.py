@@ -0,0 +1,87 @@
+"""
+单次执行模块 - 相同键的并发请求只执行一次，其余请求等待并共享结果和进度
+"""
+import threading
+
+
+class _Flight:
+    """一次正在执行的调用"""
+
+    __slots__ = ('done', 'result', 'error', 'listeners', 'followers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.listeners = []
+        self.followers = 0
+
+
+class SingleFlight:
+    """按键合并并发调用
+
+    第一个调用者执行函数，执行期间到达的相同键调用只等待并得到同一结果（或同一异常）；
+    函数通过notify回调报告的进度会转发给所有调用者的listener。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, func, listener=None, cancel_check=None):
+        """执行func(notify)，返回(结果, 是否为共享的结果)
+
+        cancel_check在等待其它调用者期间定期调用，抛出异常即放弃等待（执行者的取消由func自己处理）。
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            else:
+                flight.followers += 1
+                if listener is not None:
+                    flight.listeners.append(listener)
+
+        if not leader:
+            while not flight.done.wait(0.2 if cancel_check is not None else None):
+                try:
+                    cancel_check()
+                except BaseException:
+                    with self._lock:
+                        flight.followers -= 1
+                        if listener in flight.listeners:
+                            flight.listeners.remove(listener)
+                    raise
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        def notify(*args):
+            # 执行者自己的回调可以抛出异常中断执行，等待者的回调出错则忽略
+            if listener is not None:
+                listener(*args)
+            with self._lock:
+                listeners = list(flight.listeners)
+            for callback in listeners:
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"进度回调出错: {e}")
+
+        try:
+            flight.result = func(notify)
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self, key):
+        """该键是否有正在执行的调用"""
+        with self._lock:
+            return key in self._flights
@@ -0,0 +1,112 @@
+"""
+流缓存模块 - 按(视频ID, 格式ID, 文件大小)保存下载完成的单个流，供其它下载复用
+"""
+import os
+import time
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Linux的FICLONE ioctl：在支持的文件系统（btrfs、xfs等）上创建写时复制副本
+FICLONE = 0x40049409
+
+
+def clone_file(source, target, allow_link=True):
+    """把文件放到目标路径：优先硬链接，其次写时复制（reflink），最后普通复制
+
+    目标会成为用户的下载结果时不使用硬链接，避免修改其中一个文件影响另一个。
+    """
+    if os.path.exists(target):
+        os.remove(target)
+    if allow_link:
+        try:
+            os.link(source, target)
+            return "link"
+        except OSError:
+            pass
+
+    if fcntl is not None:
+        try:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return "reflink"
+        except OSError:
+            if os.path.exists(target):
+                os.remove(target)
+
+    shutil.copy2(source, target)
+    return "copy"
+
+
+class StreamStore:
+    """内容寻址的流缓存
+
+    下载完成的视频流/音频流以(视频ID, 格式ID, 文件大小)为键保存在缓存目录的streams下，
+    再次需要同一个流时（如先下载仅音频、再下载最佳画质）直接链接到会话目录，不再下载。
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+
+    def _make_name(self, video_id, fmt):
+        """生成缓存文件名"""
+        size = fmt.get('filesize') or 'na'
+        name = f"{video_id}_{fmt.get('format_id')}_{size}.{fmt.get('ext') or 'bin'}"
+        return "".join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+    def lookup(self, video_id, fmt):
+        """查找已保存的完整流，返回路径；不存在或大小不符时返回None"""
+        if not video_id or not fmt.get('format_id'):
+            return None
+        path = os.path.join(self.store_dir, self._make_name(video_id, fmt))
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        expected = fmt.get('filesize')
+        if (expected and size != expected) or size == 0:
+            return None
+        return path
+
+    def add(self, video_id, fmt, source, allow_link=True):
+        """保存下载完成的流"""
+        if not video_id or not fmt.get('format_id') or not source or not os.path.exists(source):
+            return None
+        expected = fmt.get('filesize')
+        if expected and os.path.getsize(source) != expected:
+            return None
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            # 在下载目录暂存的流与缓存不在同一文件系统，只为复用而整份复制得不偿失
+            if os.stat(source).st_dev != os.stat(self.store_dir).st_dev:
+                return None
+            path = os.path.join(self.store_dir, self._make_name(video_id, fmt))
+            if not os.path.exists(path):
+                clone_file(source, path, allow_link)
+            return path
+        except Exception as e:
+            print(f"保存流缓存失败: {e}")
+            return None
+
+    def cleanup(self, max_age_hours):
+        """删除保存时间超过期限的流，返回删除的文件数
+
+        按修改时间判断而不更新它：缓存文件与下载结果可能是同一个硬链接文件。
+        """
+        if not os.path.isdir(self.store_dir):
+            return 0
+        cutoff = time.time() - max_age_hours * 3600
+        removed = 0
+        for name in os.listdir(self.store_dir):
+            path = os.path.join(self.store_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
@@ -0,0 +1,85 @@
+"""
+限速检测模块 - 根据下载任务自身的历史吞吐量判断下载地址是否被持续限速
+"""
+import time
+import statistics
+from .config import config
+
+
+class StreamThrottled(Exception):
+    """下载速度持续骤降，需要刷新下载地址或更换格式"""
+
+
+class ThrottleDetector:
+    """吞吐量骤降检测器
+
+    按固定时间窗口统计下载速度，以此前各窗口速度的中位数为基准；
+    当前速度持续低于基准的一定比例超过设定时长时判定为被限速。
+    刷新地址后调用reset()，保留基准重新计时。
+    """
+
+    def __init__(self, drop_ratio=0.3, sustain_seconds=8.0, window_seconds=1.0, warmup_windows=2):
+        self.drop_ratio = drop_ratio
+        self.sustain_seconds = sustain_seconds
+        self.window_seconds = window_seconds
+        self.warmup_windows = warmup_windows
+        self._history = []          # 各窗口的速度（字节/秒）
+        self._window_start = None
+        self._window_bytes = 0
+        self._last_bytes = None
+        self._slow_since = None
+
+    @classmethod
+    def from_config(cls):
+        """按配置创建检测器，未启用时返回None"""
+        if not config.get("throttle_detection", True):
+            return None
+        return cls(drop_ratio=config.get("throttle_drop_ratio", 0.3),
+                   sustain_seconds=config.get("throttle_sustain_seconds", 8))
+
+    @property
+    def baseline(self):
+        """历史速度基准，样本不足时为None"""
+        if len(self._history) < self.warmup_windows:
+            return None
+        return statistics.median(self._history[-30:])
+
+    def update(self, downloaded_bytes, now=None):
+        """报告累计下载字节数，判定为持续限速时返回True"""
+        now = time.time() if now is None else now
+        if self._last_bytes is None or downloaded_bytes < self._last_bytes:
+            # 首次报告或下载重新开始
+            self._last_bytes = downloaded_bytes
+            self._window_start = now
+            self._window_bytes = 0
+            return False
+
+        self._window_bytes += downloaded_bytes - self._last_bytes
+        self._last_bytes = downloaded_bytes
+        elapsed = now - self._window_start
+        if elapsed < self.window_seconds:
+            return self._is_sustained(now)
+
+        speed = self._window_bytes / elapsed
+        baseline = self.baseline
+        self._window_start = now
+        self._window_bytes = 0
+
+        if baseline is not None and speed < baseline * self.drop_ratio:
+            if self._slow_since is None:
+                self._slow_since = now - elapsed
+        else:
+            # 慢速窗口不计入基准，避免限速拉低基准
+            self._slow_since = None
+            self._history.append(speed)
+        return self._is_sustained(now)
+
+    def _is_sustained(self, now):
+        return self._slow_since is not None and now - self._slow_since >= self.sustain_seconds
+
+    def reset(self):
+        """刷新地址后重新计时（保留速度基准）"""
+        self._window_start = None
+        self._window_bytes = 0
+        self._last_bytes = None
+        self._slow_since = None
@@ -0,0 +1,118 @@
+"""
+缩略图缓存模块 - 内存LRU + 磁盘两级缓存，避免重复下载和解码大尺寸封面
+"""
+import os
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+from .config import config
+from .http_session import http_pool
+
+
+class ThumbnailCache:
+    """缩略图两级缓存"""
+
+    DISPLAY_SIZE = (260, 195)
+    BACKGROUND_COLOR = (240, 240, 240)
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.cache_dir = os.path.join(parent.cache_manager.cache_dir, "thumbnails")
+        self.max_memory_items = config.get("thumbnail_memory_cache_size", 128)
+        self._memory = OrderedDict()  # key -> 已缩放并居中的PIL图像
+        self._lock = threading.Lock()
+        self.hits = {'memory': 0, 'disk': 0, 'network': 0}
+
+    def _make_key(self, url, video_id, size):
+        """生成缓存键：优先使用视频ID，其次使用URL摘要"""
+        base = video_id or hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        safe_base = "".join(c if c.isalnum() or c in '-_' else '_' for c in base)
+        return f"{safe_base}_{size[0]}x{size[1]}"
+
+    def get_thumbnail(self, url, video_id=None, size=None):
+        """获取可直接转换为PhotoImage的缩略图（PIL图像），失败返回None"""
+        size = size or self.DISPLAY_SIZE
+        key = self._make_key(url, video_id, size)
+
+        # 第一级：内存LRU
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                self.hits['memory'] += 1
+                return image
+
+        # 第二级：磁盘上已缩放的JPEG
+        disk_path = os.path.join(self.cache_dir, f"{key}.jpg")
+        image = self._load_from_disk(disk_path)
+        if image is not None:
+            self.hits['disk'] += 1
+        else:
+            # 未命中：下载并以降低的分辨率解码
+            image = self._fetch_and_resize(url, size)
+            if image is None:
+                return None
+            self.hits['network'] += 1
+            self._save_to_disk(disk_path, image)
+
+        self._remember(key, image)
+        return image
+
+    def _remember(self, key, image):
+        """放入内存LRU并淘汰最久未使用的条目"""
+        with self._lock:
+            self._memory[key] = image
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def _load_from_disk(self, disk_path):
+        """从磁盘缓存读取缩略图"""
+        try:
+            if os.path.exists(disk_path):
+                with Image.open(disk_path) as cached:
+                    return cached.convert('RGB')
+        except Exception as e:
+            print(f"读取缩略图缓存失败: {e}")
+            try:
+                os.remove(disk_path)
+            except OSError:
+                pass
+        return None
+
+    def _save_to_disk(self, disk_path, image):
+        """将缩放后的缩略图写入磁盘缓存"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = disk_path + ".tmp"
+            image.save(temp_path, 'JPEG', quality=85)
+            os.replace(temp_path, disk_path)
+        except Exception as e:
+            print(f"写入缩略图缓存失败: {e}")
+
+    def _fetch_and_resize(self, url, size):
+        """下载缩略图并缩放到显示尺寸"""
+        response = http_pool.get(url, timeout=10)
+        if response.status_code != 200:
+            return None
+
+        image = Image.open(io.BytesIO(response.content))
+        display_width, display_height = size
+        if image.format == 'JPEG':
+            # JPEG按比例缩小解码（1/2、1/4、1/8），不必解码完整的maxres图像
+            image.draft('RGB', (display_width, display_height))
+        image.thumbnail((display_width, display_height), Image.Resampling.LANCZOS)
+
+        # 创建居中的背景
+        background = Image.new('RGB', (display_width, display_height), self.BACKGROUND_COLOR)
+        x = (display_width - image.width) // 2
+        y = (display_height - image.height) // 2
+        background.paste(image.convert('RGB'), (x, y))
+        return background
+
+    def clear_memory(self):
+        """清空内存缓存"""
+        with self._lock:
+            self._memory.clear()
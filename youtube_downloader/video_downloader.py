@@ -5,12 +5,40 @@ import yt_dlp
 import threading
 import os
 import time
-import shutil
+from urllib.parse import urlparse, parse_qs
+from .config import config
+from .http_session import http_pool
+from .multi_url import guess_video_id
+from .download_pipeline import DownloadJob
+from .video_info import VideoInfo
+from .single_flight import SingleFlight
+from .stream_store import clone_file
+from .fragment_concurrency import FragmentConcurrencyController
+from .throttle_detector import ThrottleDetector, StreamThrottled
+from .download_backends import YtdlpBackend, NativeRangeBackend, Aria2cBackend
+from .retry_policy import (RetryPolicy, DownloadFailure, HTTP_403, DISK, EXTRACT_TIMEOUT, PROXY_FAILURES,
+                           get_breaker_key, wrap_error, classify_error)
+from .proxy_pool import ProxyPool
+from .disk_space import DiskSpaceReserver, get_volume_key
+from .file_transfer import move_file
+from .content_hash import BlockHasher, HASH_ALGORITHM
+from .cancellation import DownloadCancelled
+from .extraction_pool import (ExtractionCancelled,
+                              get_extraction_profile, apply_extraction_profile)
 
 
 class VideoDownloader:
     """下载管理类"""
     
+    # 不针对具体视频的通用质量选项（播放列表、批量下载时使用）
+    GENERIC_QUALITY_OPTIONS = [
+        "🎯 最佳画质 (分离合并，耗时较长)",
+        "📺 1080p",
+        "📺 720p",
+        "📺 480p",
+        "🎵 仅音频",
+    ]
+    
     def __init__(self, parent):
         self.parent = parent
         # 添加大小缓存，防止总大小动态变化
@@ -18,77 +46,241 @@ class VideoDownloader:
         self._download_id = 0  # 下载任务ID计数器
         self._prefetched_sizes = {}  # 预获取的文件大小信息
         self._current_download_type = "main"  # 当前下载类型标识
+        # 相同视频的并发提取、相同视频+格式的并发下载只执行一次
+        self._info_flights = SingleFlight()
+        self._transfer_flights = SingleFlight()
+        self._info_cache = {}  # 键 -> (完成时间, VideoInfo)，短时间内重复获取直接复用
+        self._info_cache_lock = threading.Lock()
+        self.fragment_controller = FragmentConcurrencyController()
+        # 可用的下载后端，按格式协议在配置中选择
+        self.backends = {backend.name: backend for backend in
+                         (YtdlpBackend(self), NativeRangeBackend(self), Aria2cBackend(self))}
+        # 错误分类与退避重试，按主机的熔断状态由所有任务共享
+        self.retry_policy = RetryPolicy()
+        # 代理池：提取时按评分选择代理，传输时每个任务固定一个代理
+        self.proxy_pool = ProxyPool()
+        # 各任务按预估大小预留的磁盘空间
+        self.disk_reservations = DiskSpaceReserver()
+        
+    def get_video_info(self, url, cancel_event=None, profile=None, fresh_after=None):
+        """获取视频信息（在提取进程池中执行，超时或取消时直接结束提取进程）
+        
+        同一视频正在提取时等待并共享其结果，刚提取过的视频直接复用缓存；
+        fresh_after为时间戳时只复用此后提取的缓存（用于刷新下载地址）。
+        每个调用者得到独立的VideoInfo副本。
+        """
+        key = (guess_video_id(url) or url, profile)
+        cached = self._get_cached_info(key, fresh_after)
+        if cached is not None:
+            return cached
         
-    def get_video_info(self, url):
-        """获取视频信息"""
-        import signal
-        import threading
+        while True:
+            try:
+                info, shared = self._info_flights.do(
+                    key, lambda notify: self._extract_video_info(url, cancel_event, profile))
+            except ExtractionCancelled:
+                # 等待的是被其它调用者取消的提取，自己未取消时重新发起
+                if cancel_event is not None and cancel_event.is_set():
+                    raise
+                continue
+            if not shared:
+                with self._info_cache_lock:
+                    self._info_cache[key] = (time.time(), info)
+            return info.copy()
+    
+    def _get_cached_info(self, key, fresh_after=None):
+        """获取短时缓存中仍可用于下载的信息副本"""
+        ttl = config.get("info_cache_ttl", 60)
+        now = time.time()
+        with self._info_cache_lock:
+            # 顺便清理过期条目
+            for cache_key in [k for k, (t, _) in self._info_cache.items() if now - t > ttl]:
+                del self._info_cache[cache_key]
+            entry = self._info_cache.get(key)
+        if entry and entry[1].is_reusable() and entry[0] > (fresh_after or 0):
+            return entry[1].copy()
+        return None
+    
+    def _extract_video_info(self, url, cancel_event=None, profile=None):
+        """按配置的提取方案提取视频信息
         
+        精简方案失败或拿不到可用格式（如直播）时，用完整方案重试一次。
+        返回VideoInfo，原始信息字典保存在其raw属性中供下载复用。
+        """
+        profile_name, profile_settings = get_extraction_profile(profile)
+        try:
+            info = self._extract_with_profile(url, profile_settings, cancel_event)
+            if profile_name == "full" or (info.get('formats') and not info.get('is_live')):
+                return VideoInfo(info)
+        except ExtractionCancelled:
+            raise
+        except Exception as e:
+            # 网络问题和提取超时换方案也无济于事，直接报错
+            if profile_name == "full" or (isinstance(e, DownloadFailure) and
+                                          (e.is_network or e.kind == EXTRACT_TIMEOUT)):
+                raise
+            print(f"精简提取失败，改用完整提取: {e}")
+        
+        return VideoInfo(self._extract_with_profile(url, {}, cancel_event))
+    
+    def _extract_with_profile(self, url, profile_settings, cancel_event=None):
+        """按指定提取方案在进程池中提取（网络类错误按退避重试）"""
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
             'extract_flat': False,
             'socket_timeout': 20,  # 添加20秒网络超时
         }
+        ydl_opts, drop_fields = apply_extraction_profile(ydl_opts, profile_settings)
+        timeout = config.get("extraction_timeout", 20)
         
-        result = [None]
-        exception = [None]
-        
-        def extract_info():
+        def extract(last_failure):
+            proxy = self.proxy_pool.choose()
+            opts = dict(ydl_opts, proxy=proxy) if proxy else ydl_opts
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    result[0] = info
+                info = self.parent.extraction_pool.extract(url, opts, timeout=timeout,
+                                                           cancel_event=cancel_event, drop_fields=drop_fields)
+            except ExtractionCancelled:
+                raise
             except Exception as e:
-                exception[0] = e
+                if classify_error(e)[0] in PROXY_FAILURES:
+                    self.proxy_pool.report_failure(proxy)
+                raise
+            self.proxy_pool.report_success(proxy)
+            return info
         
-        # 创建线程执行操作
-        thread = threading.Thread(target=extract_info)
-        thread.daemon = True
-        thread.start()
+        return self.retry_policy.run(extract, get_breaker_key(url), "获取视频信息",
+                                     passthrough=(ExtractionCancelled,), cancel_event=cancel_event,
+                                     prefix="获取视频信息失败")
+    
+    def get_quick_info(self, url):
+        """快速获取基本信息（标题、上传者、时长、缩略图），用于完整提取前先行显示
         
-        # 等待最多20秒
-        thread.join(20)
+        优先使用下载记录中保存的信息，其次使用oEmbed接口；都获取不到时返回None。
+        """
+        video_id = guess_video_id(url)
+        quick = {'id': video_id}
+        if video_id:
+            quick['thumbnail'] = f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+            record = self.parent.download_archive.get_video(video_id)
+            if record:
+                quick.update({
+                    'title': record.get('title'),
+                    'uploader': record.get('uploader'),
+                    'duration': record.get('duration'),
+                    'upload_date': record.get('upload_date'),
+                })
         
-        if thread.is_alive():
-            # 超时了，抛出超时错误
-            raise Exception("网络连接超时或无法访问YouTube\n\n请检查：\n1. 网络连接是否正常\n2. 是否能够访问YouTube网站\n3. 防火墙或代理设置\n")
+        if not quick.get('title') or not quick.get('uploader'):
+            try:
+                response = http_pool.get("https://www.youtube.com/oembed",
+                                         params={'url': url, 'format': 'json'}, timeout=5)
+                response.raise_for_status()
+                data = response.json()
+                quick['title'] = quick.get('title') or data.get('title')
+                quick['uploader'] = quick.get('uploader') or data.get('author_name')
+                if not video_id and data.get('thumbnail_url'):
+                    quick['thumbnail'] = data['thumbnail_url']
+            except Exception as e:
+                print(f"快速信息获取失败: {e}")
         
-        if exception[0]:
-            error_msg = str(exception[0])
-            # 检查是否为网络连接相关错误
-            if any(keyword in error_msg.lower() for keyword in ['timeout', 'connection', 'network', 'resolve', 'unreachable', 'failed to extract']):
-                raise Exception(f"网络连接超时或无法访问YouTube\n\n请检查：\n1. 网络连接是否正常\n2. 是否能够访问YouTube网站\n3. 防火墙或代理设置\n\n详细错误信息：{error_msg}")
-            else:
-                raise Exception(f"获取视频信息失败: {error_msg}")
+        return quick if quick.get('title') else None
+    
+    def is_playlist_url(self, url):
+        """判断是否为播放列表或频道链接（带list参数的单个视频链接仍按单视频处理）"""
+        parsed = urlparse(url)
+        path = parsed.path.rstrip('/')
+        query = parse_qs(parsed.query)
+        if path == '/playlist' and 'list' in query:
+            return True
+        if path.startswith(('/@', '/channel/', '/c/', '/user/')):
+            return True
+        return False
+    
+    def iter_playlist_entries(self, url):
+        """惰性枚举播放列表/频道中的视频
+        
+        只做扁平提取并按页获取，边枚举边产出，内存占用与列表长度无关；
+        每个视频的完整信息在下载前才提取。
+        """
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+            'socket_timeout': 20,
+        }
         
-        return result[0]
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            result = ydl.extract_info(url, download=False, process=False)
+            # 频道首页等链接会先重定向到具体的标签页
+            for _ in range(3):
+                if result and result.get('_type') in ('url', 'url_transparent'):
+                    result = ydl.extract_info(result['url'], download=False, process=False)
+            
+            yield from self._iter_flat_entries(ydl, result, 0)
     
-    def _get_stable_total_bytes(self, d, download_type="main"):
+    def _iter_flat_entries(self, ydl, result, depth):
+        """遍历扁平提取结果中的视频条目（展开嵌套的标签页/子列表）"""
+        for entry in (result or {}).get('entries') or []:
+            if not entry:
+                continue
+            
+            if entry.get('_type') == 'playlist' or entry.get('ie_key') == 'YoutubeTab':
+                if depth >= 2:
+                    continue
+                sub_result = entry
+                if entry.get('entries') is None:
+                    sub_result = ydl.extract_info(entry['url'], download=False, process=False)
+                yield from self._iter_flat_entries(ydl, sub_result, depth + 1)
+                continue
+            
+            video_id = entry.get('id')
+            video_url = entry.get('url') or entry.get('webpage_url') or video_id
+            if video_url and not video_url.startswith('http'):
+                video_url = f"https://www.youtube.com/watch?v={video_id or video_url}"
+            
+            yield {
+                'id': video_id,
+                'url': video_url,
+                'title': entry.get('title'),
+                'duration': entry.get('duration'),
+                'upload_date': entry.get('upload_date'),
+                'timestamp': entry.get('timestamp'),
+            }
+    
+    def _get_stable_total_bytes(self, d, download_type="main", job=None):
         """获取稳定的总字节数，避免动态变化"""
-        # 为每个下载任务生成唯一标识
-        task_key = f"{download_type}_{self._download_id}"
+        # 每个下载任务使用自己的大小缓存，支持多任务并行
+        if job:
+            prefetched_sizes = job.prefetched_sizes
+            cached_total_bytes = job.cached_total_bytes
+            task_key = download_type
+        else:
+            prefetched_sizes = self._prefetched_sizes
+            cached_total_bytes = self._cached_total_bytes
+            task_key = f"{download_type}_{self._download_id}"
         
         # 优先使用预获取的大小信息
-        if download_type in self._prefetched_sizes:
-            prefetched_size = self._prefetched_sizes[download_type]
+        if download_type in prefetched_sizes:
+            prefetched_size = prefetched_sizes[download_type]
             if prefetched_size and prefetched_size > 0:
                 # 如果还没有缓存，则缓存预获取的大小
-                if task_key not in self._cached_total_bytes:
-                    self._cached_total_bytes[task_key] = prefetched_size
+                if task_key not in cached_total_bytes:
+                    cached_total_bytes[task_key] = prefetched_size
                     print(f"📏 [{download_type}] 使用预获取的文件大小: {self.format_bytes(prefetched_size)}")
                 return prefetched_size
         
         # 如果已经缓存了总大小，直接返回
-        if task_key in self._cached_total_bytes:
-            cached_size = self._cached_total_bytes[task_key]
+        if task_key in cached_total_bytes:
+            cached_size = cached_total_bytes[task_key]
             # 验证缓存的数据是否合理
             if cached_size and cached_size > 0:
                 return cached_size
             else:
                 print(f"⚠️ [{download_type}] 缓存的总大小异常: {cached_size}")
                 # 清除异常缓存
-                del self._cached_total_bytes[task_key]
+                del cached_total_bytes[task_key]
         
         # 尝试从下载数据中获取总字节数
         total_bytes = None
@@ -108,8 +300,8 @@ class VideoDownloader:
                 return None
             
             # 检查是否与预获取的大小差异过大
-            if download_type in self._prefetched_sizes:
-                prefetched_size = self._prefetched_sizes[download_type]
+            if download_type in prefetched_sizes:
+                prefetched_size = prefetched_sizes[download_type]
                 if prefetched_size and prefetched_size > 0:
                     diff_ratio = abs(total_bytes - prefetched_size) / prefetched_size
                     if diff_ratio > 0.5:  # 差异超过50%
@@ -118,10 +310,10 @@ class VideoDownloader:
                               f"实际={self.format_bytes(total_bytes)}, " +
                               f"差异={diff_ratio*100:.1f}%")
                         # 优先使用预获取的大小
-                        self._cached_total_bytes[task_key] = prefetched_size
+                        cached_total_bytes[task_key] = prefetched_size
                         return prefetched_size
             
-            self._cached_total_bytes[task_key] = total_bytes
+            cached_total_bytes[task_key] = total_bytes
             print(f"📏 [{download_type}] 缓存文件总大小: {self.format_bytes(total_bytes)}")
             
         return total_bytes
@@ -137,46 +329,75 @@ class VideoDownloader:
         try:
             # 获取视频信息
             info = self.get_video_info(url)
-            formats = info.get('formats', [])
+            formats = info.formats
             
             if not formats:
                 print("⚠️ 无法获取视频格式信息")
                 return False
             
-            # 判断下载模式并获取对应的格式大小
-            if ("分离合并" in quality) or (quality.startswith("🎯 最佳画质") and hasattr(self.parent, 'needs_merge') and self.parent.needs_merge):
-                # 分离下载模式：获取视频和音频的大小
-                video_size = self._get_best_video_size(formats)
-                audio_size = self._get_best_audio_size(formats)
-                
-                self._prefetched_sizes['video'] = video_size
-                self._prefetched_sizes['audio'] = audio_size
-                
-                total_size = (video_size or 0) + (audio_size or 0)
-                if total_size > 0:
-                    self._prefetched_sizes['total'] = total_size
-                
-                print(f"📏 预获取大小 - 视频: {self.format_bytes(video_size) if video_size else '未知'}, " +
-                      f"音频: {self.format_bytes(audio_size) if audio_size else '未知'}, " +
-                      f"总计: {self.format_bytes(total_size) if total_size > 0 else '未知'}")
-            else:
-                # 普通下载模式：获取完整文件大小
-                format_selector = self._get_format_selector(quality)
-                file_size = self._get_format_size_by_selector(formats, format_selector)
-                
-                if file_size:
-                    self._prefetched_sizes['main'] = file_size
-                    self._prefetched_sizes['total'] = file_size
-                    print(f"📏 预获取文件大小: {self.format_bytes(file_size)}")
-                else:
-                    print("⚠️ 无法预获取文件大小，将在下载时动态计算")
-            
+            self._prefetched_sizes.update(
+                self._compute_prefetched_sizes(formats, quality, self._is_merge_mode(quality, formats)))
             return True
             
         except Exception as e:
             print(f"⚠️ 预获取文件大小失败: {e}")
             return False
     
+    def _compute_prefetched_sizes(self, formats, quality, needs_merge):
+        """根据格式列表计算各下载部分的预估大小"""
+        sizes = {}
+        if needs_merge:
+            # 分离下载模式：获取视频和音频的大小
+            video_size = self._get_best_video_size(formats)
+            audio_size = self._get_best_audio_size(formats)
+            
+            sizes['video'] = video_size
+            sizes['audio'] = audio_size
+            
+            total_size = (video_size or 0) + (audio_size or 0)
+            if total_size > 0:
+                sizes['total'] = total_size
+            
+            print(f"📏 预获取大小 - 视频: {self.format_bytes(video_size) if video_size else '未知'}, " +
+                  f"音频: {self.format_bytes(audio_size) if audio_size else '未知'}, " +
+                  f"总计: {self.format_bytes(total_size) if total_size > 0 else '未知'}")
+        else:
+            # 普通下载模式：获取完整文件大小
+            format_selector = self._get_format_selector(quality)
+            file_size = self._get_format_size_by_selector(formats, format_selector)
+            
+            if file_size:
+                sizes['main'] = file_size
+                sizes['total'] = file_size
+                print(f"📏 预获取文件大小: {self.format_bytes(file_size)}")
+            else:
+                print("⚠️ 无法预获取文件大小，将在下载时动态计算")
+        return sizes
+    
+    def _is_merge_mode(self, quality, formats):
+        """判断该质量选项是否需要分离下载后合并"""
+        if "分离合并" in quality:
+            return True
+        if not quality.startswith("🎯 最佳画质"):
+            return False
+        
+        # 与界面分析一致：仅视频格式画质更高且存在独立音频流时需要合并
+        max_video_only_height = 0
+        max_combined_height = 0
+        has_audio_stream = False
+        for fmt in formats or []:
+            height = fmt.get('height') or 0
+            vcodec = fmt.get('vcodec', 'none')
+            acodec = fmt.get('acodec', 'none')
+            if height and vcodec != 'none':
+                if acodec != 'none':
+                    max_combined_height = max(max_combined_height, height)
+                else:
+                    max_video_only_height = max(max_video_only_height, height)
+            elif acodec != 'none':
+                has_audio_stream = True
+        return max_video_only_height > max_combined_height and has_audio_stream
+    
     def _get_best_video_size(self, formats):
         """获取最佳视频格式的文件大小"""
         try:
@@ -328,7 +549,7 @@ class VideoDownloader:
         
         return filename
     
-    def progress_hook(self, d):
+    def progress_hook(self, d, job=None):
         """下载进度回调（用于单一文件下载）"""
         if self.parent.download_paused:
             return
@@ -375,11 +596,11 @@ class VideoDownloader:
                             eta_str = "计算中..."
                         
                         status_text = f"📥 正在下载: {percentage:.1f}% {size_info} | 速度: {speed_str} | 剩余: {eta_str}"
-                        self.parent.root.after(0, lambda: self.parent.update_progress(percentage, status_text))
+                        self._report_progress(job, percentage, status_text)
                         return
                 
                 # 回退到字节进度计算（适用于普通下载）
-                total_bytes = self._get_stable_total_bytes(d, "main")
+                total_bytes = self._get_stable_total_bytes(d, "main", job)
                 
                 if total_bytes and 'downloaded_bytes' in d:
                     downloaded_bytes = d['downloaded_bytes']
@@ -394,8 +615,9 @@ class VideoDownloader:
                     # HLS流的总大小经常不准确，如果超过120%就改为无百分比模式
                     if percentage > 120:
                         # 使用预获取的大小重新计算
-                        if 'main' in self._prefetched_sizes:
-                            prefetched_total = self._prefetched_sizes['main']
+                        prefetched_sizes = job.prefetched_sizes if job else self._prefetched_sizes
+                        if 'main' in prefetched_sizes:
+                            prefetched_total = prefetched_sizes['main']
                             if prefetched_total and prefetched_total > 0:
                                 percentage = (downloaded_bytes / prefetched_total) * 100
                                 # 如果仍然超过120%，则使用无百分比模式
@@ -404,7 +626,7 @@ class VideoDownloader:
                                     speed = d.get('speed', 0)
                                     speed_str = self.format_bytes(speed) + "/s" if speed else "计算中..."
                                     status_text = f"📥 正在下载: {downloaded_str} | 速度: {speed_str}"
-                                    self.parent.root.after(0, lambda: self.parent.update_progress(50, status_text))
+                                    self._report_progress(job, 50, status_text)
                                     return
                     
                     # 获取文件大小信息
@@ -432,7 +654,7 @@ class VideoDownloader:
                         eta_str = "计算中..."
                     
                     status_text = f"📥 正在下载: {percentage:.1f}% {size_info} | 速度: {speed_str} | 剩余: {eta_str}"
-                    self.parent.root.after(0, lambda: self.parent.update_progress(percentage, status_text))
+                    self._report_progress(job, percentage, status_text)
                 else:
                     # 无法获取总大小时显示已下载量和速度
                     downloaded_bytes = d.get('downloaded_bytes', 0)
@@ -445,7 +667,7 @@ class VideoDownloader:
                     else:
                         status_text = "📥 正在下载..."
                     
-                    self.parent.root.after(0, lambda: self.parent.update_progress(50, status_text))
+                    self._report_progress(job, 50, status_text)
                     
             except Exception as e:
                 print(f"进度更新错误: {e}")
@@ -453,9 +675,9 @@ class VideoDownloader:
         elif d['status'] == 'finished':
             file_size = self.format_bytes(os.path.getsize(d['filename']))
             status_text = f"✅ 下载完成 ({file_size})"
-            self.parent.root.after(0, lambda: self.parent.update_progress(100, status_text))
+            self._report_progress(job, 100, status_text)
     
-    def video_progress_hook(self, d):
+    def video_progress_hook(self, d, job=None):
         """视频下载进度回调（用于分离下载模式）"""
         if self.parent.download_paused:
             return
@@ -505,11 +727,11 @@ class VideoDownloader:
                         
                         # 视频下载占总进度的60%
                         overall_progress = percentage * 0.6
-                        self.parent.root.after(0, lambda: self.parent.update_progress(overall_progress, status_text))
+                        self._report_progress(job, overall_progress, status_text)
                         return
                 
                 # 回退到字节进度计算（适用于普通下载）
-                total_bytes = self._get_stable_total_bytes(d, "video")
+                total_bytes = self._get_stable_total_bytes(d, "video", job)
                 
                 if total_bytes and 'downloaded_bytes' in d:
                     downloaded_bytes = d['downloaded_bytes']
@@ -524,8 +746,9 @@ class VideoDownloader:
                     # HLS流的总大小经常不准确，如果超过120%就改为无百分比模式
                     if percentage > 120:
                         # 使用预获取的大小重新计算
-                        if 'video' in self._prefetched_sizes:
-                            prefetched_total = self._prefetched_sizes['video']
+                        prefetched_sizes = job.prefetched_sizes if job else self._prefetched_sizes
+                        if 'video' in prefetched_sizes:
+                            prefetched_total = prefetched_sizes['video']
                             if prefetched_total and prefetched_total > 0:
                                 percentage = (downloaded_bytes / prefetched_total) * 100
                                 # 如果仍然超过120%，则使用无百分比模式
@@ -534,7 +757,7 @@ class VideoDownloader:
                                     speed = d.get('speed', 0)
                                     speed_str = self.format_bytes(speed) + "/s" if speed else "计算中..."
                                     status_text = f"🎬 步骤1/3 - 下载视频: {downloaded_str} | 速度: {speed_str}"
-                                    self.parent.root.after(0, lambda: self.parent.update_progress(30, status_text))
+                                    self._report_progress(job, 30, status_text)
                                     return
                     
                     # 获取文件大小信息
@@ -565,7 +788,7 @@ class VideoDownloader:
                     
                     # 视频下载占总进度的60%
                     overall_progress = percentage * 0.6
-                    self.parent.root.after(0, lambda: self.parent.update_progress(overall_progress, status_text))
+                    self._report_progress(job, overall_progress, status_text)
                 else:
                     # 无法获取总大小时显示已下载量和速度
                     downloaded_bytes = d.get('downloaded_bytes', 0)
@@ -578,18 +801,18 @@ class VideoDownloader:
                     else:
                         status_text = "🎬 步骤1/3 - 正在下载视频..."
                     
-                    self.parent.root.after(0, lambda: self.parent.update_progress(30, status_text))
+                    self._report_progress(job, 30, status_text)
                     
             except Exception as e:
                 print(f"视频进度更新错误: {e}")
                 
         elif d['status'] == 'finished':
-            self.parent.video_file = d['filename']
+            self._record_stream_file(job, 'video', d['filename'])
             video_size = self.format_bytes(os.path.getsize(d['filename']))
             status_text = f"✅ 步骤1/3 完成 - 视频已下载 ({video_size})"
-            self.parent.root.after(0, lambda: self.parent.update_progress(60, status_text))
+            self._report_progress(job, 60, status_text)
     
-    def audio_progress_hook(self, d):
+    def audio_progress_hook(self, d, job=None):
         """音频下载进度回调（用于分离下载模式）"""
         if self.parent.download_paused:
             return
@@ -639,11 +862,11 @@ class VideoDownloader:
                         
                         # 音频下载占总进度的30% (从60%到90%)
                         overall_progress = 60 + (percentage * 0.3)
-                        self.parent.root.after(0, lambda: self.parent.update_progress(overall_progress, status_text))
+                        self._report_progress(job, overall_progress, status_text)
                         return
                 
                 # 回退到字节进度计算（适用于普通下载）
-                total_bytes = self._get_stable_total_bytes(d, "audio")
+                total_bytes = self._get_stable_total_bytes(d, "audio", job)
                 
                 if total_bytes and 'downloaded_bytes' in d:
                     downloaded_bytes = d['downloaded_bytes']
@@ -658,8 +881,9 @@ class VideoDownloader:
                     # HLS流的总大小经常不准确，如果超过120%就改为无百分比模式
                     if percentage > 120:
                         # 使用预获取的大小重新计算
-                        if 'audio' in self._prefetched_sizes:
-                            prefetched_total = self._prefetched_sizes['audio']
+                        prefetched_sizes = job.prefetched_sizes if job else self._prefetched_sizes
+                        if 'audio' in prefetched_sizes:
+                            prefetched_total = prefetched_sizes['audio']
                             if prefetched_total and prefetched_total > 0:
                                 percentage = (downloaded_bytes / prefetched_total) * 100
                                 # 如果仍然超过120%，则使用无百分比模式
@@ -668,7 +892,7 @@ class VideoDownloader:
                                     speed = d.get('speed', 0)
                                     speed_str = self.format_bytes(speed) + "/s" if speed else "计算中..."
                                     status_text = f"🎵 步骤2/3 - 下载音频: {downloaded_str} | 速度: {speed_str}"
-                                    self.parent.root.after(0, lambda: self.parent.update_progress(75, status_text))
+                                    self._report_progress(job, 75, status_text)
                                     return
                     
                     # 获取文件大小信息
@@ -699,7 +923,7 @@ class VideoDownloader:
                     
                     # 音频下载占总进度的30% (从60%到90%)
                     overall_progress = 60 + (percentage * 0.3)
-                    self.parent.root.after(0, lambda: self.parent.update_progress(overall_progress, status_text))
+                    self._report_progress(job, overall_progress, status_text)
                 else:
                     # 无法获取总大小时显示已下载量和速度
                     downloaded_bytes = d.get('downloaded_bytes', 0)
@@ -712,16 +936,16 @@ class VideoDownloader:
                     else:
                         status_text = "🎵 步骤2/3 - 正在下载音频..."
                     
-                    self.parent.root.after(0, lambda: self.parent.update_progress(75, status_text))
+                    self._report_progress(job, 75, status_text)
                     
             except Exception as e:
                 print(f"音频进度更新错误: {e}")
                 
         elif d['status'] == 'finished':
-            self.parent.audio_file = d['filename']
+            self._record_stream_file(job, 'audio', d['filename'])
             audio_size = self.format_bytes(os.path.getsize(d['filename']))
             status_text = f"✅ 步骤2/3 完成 - 音频已下载 ({audio_size})"
-            self.parent.root.after(0, lambda: self.parent.update_progress(90, status_text))
+            self._report_progress(job, 90, status_text)
     
     def format_bytes(self, bytes_val):
         """格式化字节数"""
@@ -731,14 +955,21 @@ class VideoDownloader:
             bytes_val /= 1024.0
         return f"{bytes_val:.1f}TB"
     
-    def check_disk_space(self, path, required_size_mb=1000):
-        """检查磁盘空间"""
-        try:
-            free_bytes = shutil.disk_usage(path).free
-            free_mb = free_bytes / (1024 * 1024)
-            return free_mb >= required_size_mb
-        except:
-            return True
+    def _preflight_disk_space(self, job, staging_root):
+        """按预估大小检查并预留暂存盘和目标盘的空间，空间不足时在下载前就失败
+        
+        流先下载到暂存目录；合并时输入仍在而输出写入目标目录，峰值约为两倍；
+        不合并且暂存与目标不在同一卷时，移动文件需要在目标卷再写一份。
+        """
+        total = job.prefetched_sizes.get('total')
+        if not total:
+            print("⚠️ 无法预估文件大小，跳过磁盘空间检查")
+            return
+        same_volume = get_volume_key(staging_root)[0] == get_volume_key(job.download_path)[0]
+        needs = [(staging_root, total)]
+        if job.needs_merge or not same_volume:
+            needs.append((job.download_path, total))
+        self.disk_reservations.reserve(job, needs)
     
     def get_estimated_size(self, url):
         """获取预估文件大小"""
@@ -765,166 +996,541 @@ class VideoDownloader:
         except:
             return 100  # 默认100MB
     
-    def execute_download(self, url, download_path, quality):
-        """执行下载"""
+    def execute_download(self, url, download_path, quality, clip=None, cancel_token=None):
+        """执行下载（clip为(开始秒, 结束秒)时只下载该片段；cancel_token取消时抛出DownloadCancelled）"""
+        # 接管预获取的大小信息，并清理大小缓存，开始新的下载任务
+        job = DownloadJob(url, download_path, quality, clip=clip, cancel_token=cancel_token)
+        job.prefetched_sizes = dict(self._prefetched_sizes)
+        self._clear_size_cache()
         try:
-            # 清理大小缓存，开始新的下载任务
-            self._clear_size_cache()
-            
-            # 获取格式信息
-            info = self.get_video_info(url)
-            title = info.get('title', 'video')
-            clean_title = self.clean_filename(title)
-            
-            # 获取清晰度信息并生成最终文件名
-            resolution_suffix = self._get_resolution_suffix(quality)
-            final_filename = self._get_final_filename(clean_title, resolution_suffix)
-            final_path = os.path.join(download_path, final_filename)
-            
-            # 检查是否已存在相同清晰度的文件
-            if os.path.exists(final_path):
-                file_size = os.path.getsize(final_path)
-                size_str = self.format_bytes(file_size)
-                raise Exception(f"文件已存在: {final_filename}\n\n"
-                              f"文件大小: {size_str}\n"
-                              f"清晰度: {resolution_suffix}\n\n"
-                              f"如需重新下载，请先删除现有文件或选择不同清晰度。")
-            
-            # 创建下载会话
-            session_id, session_dir = self.parent.cache_manager.create_download_session(title, quality)
-            
-            # 判断下载模式
-            if ("分离合并" in quality) or (quality.startswith("🎯 最佳画质") and hasattr(self.parent, 'needs_merge') and self.parent.needs_merge):
-                # 分离下载+合并模式
-                self.parent.download_stage = "downloading_video"
-                
-                # 下载视频（无音频）到缓存目录
-                video_temp_path = os.path.join(session_dir, f'{clean_title}_video.%(ext)s')
-                video_opts = {
-                    'format': 'bestvideo[ext=mp4]/bestvideo',
-                    'outtmpl': video_temp_path,
-                    'progress_hooks': [self.video_progress_hook],
-                    'socket_timeout': 20,  # 添加20秒网络超时
-                    'retries': 3,
-                    'fragment_retries': 3,
-                }
-                
-                with yt_dlp.YoutubeDL(video_opts) as ydl:
-                    ydl.download([url])
-                
-                # 更新会话状态
-                self.parent.cache_manager.update_session_status(session_dir, "video_downloaded")
-                
-                # 下载音频到缓存目录
-                self.parent.download_stage = "downloading_audio"
-                
-                audio_temp_path = os.path.join(session_dir, f'{clean_title}_audio.%(ext)s')
-                audio_opts = {
-                    'format': 'bestaudio[ext=m4a]/bestaudio',
-                    'outtmpl': audio_temp_path,
-                    'progress_hooks': [self.audio_progress_hook],
-                    'socket_timeout': 20,  # 添加20秒网络超时
-                    'retries': 3,
-                    'fragment_retries': 3,
-                }
-                
-                with yt_dlp.YoutubeDL(audio_opts) as ydl:
-                    ydl.download([url])
-                
-                # 更新会话状态
-                self.parent.cache_manager.update_session_status(session_dir, "audio_downloaded")
-                
-                # 合并视频和音频
-                if self.parent.video_file and self.parent.audio_file:
-                    self.parent.download_stage = "merging"
-                    
-                    # 执行合并
-                    success = self.parent.ffmpeg.merge_video_audio(
-                        self.parent.video_file, 
-                        self.parent.audio_file, 
-                        final_path
-                    )
-                    
-                    if success:
-                        # 更新会话状态为完成
-                        self.parent.cache_manager.update_session_status(session_dir, "completed")
-                        
-                        # 清理临时文件
-                        try:
-                            if os.path.exists(self.parent.video_file):
-                                os.remove(self.parent.video_file)
-                            if os.path.exists(self.parent.audio_file):
-                                os.remove(self.parent.audio_file)
-                            print(f"✅ 清理临时文件完成")
-                        except Exception as e:
-                            print(f"清理临时文件时出错: {e}")
-                        
-                        # 显示最终完成状态
-                        print(f"✅ 下载完成: {final_path}")
-                    else:
-                        # 更新会话状态为失败
-                        self.parent.cache_manager.update_session_status(session_dir, "failed")
-                        raise Exception("视频合并失败")
-                        
-            else:
-                # 普通下载模式（直接下载完整文件）
-                format_selector = self._get_format_selector(quality)
-                
-                # 下载到缓存目录
-                temp_path = os.path.join(session_dir, f'{clean_title}.%(ext)s')
-                ydl_opts = {
-                    'format': format_selector,
-                    'outtmpl': temp_path,
-                    'progress_hooks': [self.progress_hook],
-                    'socket_timeout': 20,  # 添加20秒网络超时
-                    'retries': 3,
-                    'fragment_retries': 3,
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
-                
-                # 更新会话状态
-                self.parent.cache_manager.update_session_status(session_dir, "downloaded")
-                
-                # 移动文件到目标目录
-                try:
-                    # 查找下载的文件
-                    downloaded_files = []
-                    for file in os.listdir(session_dir):
-                        if file != "session_info.json" and not file.endswith('.part'):
-                            downloaded_files.append(os.path.join(session_dir, file))
-                    
-                    if downloaded_files:
-                        downloaded_file = downloaded_files[0]  # 取第一个文件
-                        
-                        # 获取文件扩展名
-                        _, ext = os.path.splitext(downloaded_file)
-                        
-                        # 移动文件到目标目录，使用最终文件名
-                        shutil.move(downloaded_file, final_path)
-                        
-                        # 更新会话状态为完成
-                        self.parent.cache_manager.update_session_status(session_dir, "completed")
-                        
-                        print(f"✅ 下载完成: {final_path}")
-                    else:
-                        raise Exception("未找到下载的文件")
-                        
-                except Exception as e:
-                    # 更新会话状态为失败
-                    self.parent.cache_manager.update_session_status(session_dir, "failed")
-                    raise Exception(f"移动文件失败: {e}")
+            # 依次执行各阶段（批量下载时由DownloadPipeline并行调度这些阶段）
+            job.cancel_token.check()
+            self.prepare_job(job)
+            self.transfer_job(job)
+            if job.needs_merge:
+                self.merge_job(job)
+            self.finalize_job(job)
             
             return True
             
         except Exception as e:
-            error_msg = str(e)
-            # 检查是否为网络连接相关错误
-            if any(keyword in error_msg.lower() for keyword in ['timeout', 'connection', 'network', 'resolve', 'unreachable', 'failed to extract']):
-                raise Exception(f"网络连接超时或无法访问YouTube\n\n请检查：\n1. 网络连接是否正常\n2. 是否能够访问YouTube网站\n3. 防火墙或代理设置\n\n详细错误信息：{error_msg}")
+            if job.cancelled:
+                self.release_cancelled_job(job)
+                raise DownloadCancelled()
+            # 按错误类型给出提示（网络、磁盘、限流等）
+            raise wrap_error(e)
+        finally:
+            self.disk_reservations.release(job)
+    
+    def release_cancelled_job(self, job):
+        """任务取消后释放其占用的资源：磁盘预留，以及会话目录（按配置保留供续传或删除）"""
+        job.stage = "cancelled"
+        job.info = None
+        job.stream_hashers = {}
+        self.disk_reservations.release(job)
+        cache_manager = self.parent.cache_manager
+        if job.session_dir and os.path.isdir(job.session_dir):
+            if config.get("cancelled_session_policy", "keep") == "clean":
+                # 下载目录暂存区中的会话连同空的暂存区一起删除
+                cache_manager.release_staging_session(job.session_dir)
+                cache_manager.cleanup_session(job.session_dir)
             else:
-                raise Exception(f"下载失败: {error_msg}")
+                cache_manager.update_session_status(job.session_dir, "cancelled")
+        print(f"⏹️ 已取消: {job.display_name}")
+    
+    def _get_job_info(self, job, fresh_after=None):
+        """为任务提取视频信息；任务取消时结束提取进程并抛出DownloadCancelled"""
+        try:
+            return self.get_video_info(job.url, cancel_event=job.cancel_token, fresh_after=fresh_after)
+        except ExtractionCancelled:
+            job.cancel_token.check()
+            raise
+    
+    def prepare_job(self, job):
+        """阶段1：获取视频信息、确定文件名并创建下载会话"""
+        job.stage = "extracting"
+        
+        # 获取格式信息
+        # 复用已有信息；原始信息已释放或格式地址即将过期时重新提取
+        if job.info is None or not job.info.is_reusable():
+            job.info = self._get_job_info(job)
+        info = job.info
+        job.video_id = info.get('id')
+        job.upload_date = info.get('upload_date')
+        job.title = info.get('title', 'video')
+        job.clean_title = self.clean_filename(job.title)
+        
+        # 片段下载由FFmpeg按时间范围只拉取需要的部分
+        if job.clip:
+            if not self.parent.ffmpeg.ensure_ffmpeg_on_path():
+                raise Exception("片段下载需要FFmpeg，请先安装FFmpeg")
+            duration = info.get('duration')
+            if duration and job.clip[0] >= duration:
+                raise Exception(f"片段开始时间超出视频时长（{self.format_duration(duration)}）")
+        
+        # 获取清晰度信息并生成最终文件名
+        resolution_suffix = self._get_resolution_suffix(job.quality) + self._get_clip_suffix(job.clip)
+        job.final_filename = self._get_final_filename(job.clean_title, resolution_suffix)
+        job.final_path = os.path.join(job.download_path, job.final_filename)
+        
+        # 检查是否已存在相同清晰度的文件
+        if os.path.exists(job.final_path):
+            file_size = os.path.getsize(job.final_path)
+            size_str = self.format_bytes(file_size)
+            raise Exception(f"文件已存在: {job.final_filename}\n\n"
+                          f"文件大小: {size_str}\n"
+                          f"清晰度: {resolution_suffix}\n\n"
+                          f"如需重新下载，请先删除现有文件或选择不同清晰度。")
+        
+        # 判断下载模式，并在未预获取时根据已有信息计算文件大小
+        formats = info.formats
+        job.needs_merge = self._is_merge_mode(job.quality, formats)
+        if not job.prefetched_sizes and formats:
+            job.prefetched_sizes = self._compute_prefetched_sizes(formats, job.quality, job.needs_merge)
+        if job.clip and info.get('duration'):
+            # 按片段占总时长的比例估算大小
+            clip_length = min(job.clip[1], info.get('duration')) - job.clip[0]
+            ratio = max(0.0, min(1.0, clip_length / info.get('duration')))
+            job.prefetched_sizes = {key: int(size * ratio) for key, size in job.prefetched_sizes.items() if size}
+        
+        # 尽量在目标目录所在的文件系统上暂存，完成时只需重命名；检查磁盘空间（计入其它排队任务的预留）
+        staging_root = self.parent.cache_manager.get_staging_root(job.download_path)
+        self._preflight_disk_space(job, staging_root)
+        
+        # 创建下载会话
+        job.session_id, job.session_dir = self.parent.cache_manager.create_download_session(
+            job.title, job.quality, staging_root, video_id=job.video_id, resume=not job.clip)
+        return job
+    
+    def transfer_job(self, job):
+        """阶段2：将所需的流下载到会话缓存目录（传输期间固定使用分配到的代理）"""
+        job.proxy = self.proxy_pool.acquire(job)
+        try:
+            return self._transfer_streams(job)
+        finally:
+            self.proxy_pool.release(job)
+    
+    def _transfer_streams(self, job):
+        """依下载模式下载视频/音频流或完整文件"""
+        if job.needs_merge:
+            # 分离下载+合并模式
+            job.stage = "downloading_video"
+            self.parent.download_stage = job.stage
+            
+            # 下载视频（无音频）到缓存目录
+            video_temp_path = os.path.join(job.session_dir, f'{job.clean_title}_video.%(ext)s')
+            self._download_stream(job, 'bestvideo[ext=mp4]/bestvideo', video_temp_path,
+                                  lambda d: self.video_progress_hook(d, job))
+            
+            # 更新会话状态
+            self.parent.cache_manager.update_session_status(job.session_dir, "video_downloaded")
+            
+            # 下载音频到缓存目录
+            job.stage = "downloading_audio"
+            self.parent.download_stage = job.stage
+            
+            audio_temp_path = os.path.join(job.session_dir, f'{job.clean_title}_audio.%(ext)s')
+            self._download_stream(job, 'bestaudio[ext=m4a]/bestaudio', audio_temp_path,
+                                  lambda d: self.audio_progress_hook(d, job))
+            
+            # 更新会话状态
+            self.parent.cache_manager.update_session_status(job.session_dir, "audio_downloaded")
+        else:
+            # 普通下载模式（直接下载完整文件）
+            job.stage = "downloading"
+            self.parent.download_stage = job.stage
+            format_selector = self._get_format_selector(job.quality)
+            
+            # 下载到缓存目录
+            temp_path = os.path.join(job.session_dir, f'{job.clean_title}.%(ext)s')
+            self._download_stream(job, format_selector, temp_path,
+                                  lambda d: self.progress_hook(d, job))
+            
+            # 更新会话状态
+            self.parent.cache_manager.update_session_status(job.session_dir, "downloaded")
+        
+        # 流已下载完成，不再需要原始信息字典；已写入缓存盘的部分不再预留
+        job.info.release_raw()
+        self.disk_reservations.shrink(job, job.session_dir, job.prefetched_sizes.get('total') or 0)
+        return job
+    
+    def _download_stream(self, job, format_selector, outtmpl, hook):
+        """下载单个格式到指定路径
+        
+        流缓存中已有同一视频、同一格式的完整文件时直接链接到会话目录；
+        同一流正在被其它任务下载时等待其完成（期间共享其进度），再链接其结果。
+        """
+        # 片段与完整流内容不同，不使用流缓存
+        fmt = None if job.clip else self._resolve_single_format(job, format_selector)
+        store = self.parent.cache_manager.stream_store
+        # 分离下载的流只作为合并输入，可以硬链接；直接下载的文件会成为用户文件，需独立副本
+        allow_link = job.needs_merge
+        if fmt is not None:
+            stored = store.lookup(job.video_id, fmt)
+            if stored:
+                target = outtmpl.replace('%(ext)s', fmt.get('ext') or 'mp4')
+                clone_file(stored, target, allow_link)
+                print(f"♻️ 复用已下载的流: {fmt.get('format_id')} ({self.format_bytes(os.path.getsize(target))})")
+                hook({'status': 'finished', 'filename': target})
+                return target
+        
+        if not job.video_id:
+            return self._transfer_with_retry(job, format_selector, outtmpl, hook, fmt)
+        
+        key = (job.video_id, fmt.get('format_id') if fmt is not None else format_selector, job.clip)
+        try:
+            filename, shared = self._transfer_flights.do(
+                key, lambda notify: self._transfer_with_retry(job, format_selector, outtmpl, notify, fmt),
+                listener=hook, cancel_check=job.cancel_token.check)
+        except DownloadCancelled:
+            if job.cancelled:
+                raise
+            # 共享的下载被其它任务取消，自己重新下载
+            return self._transfer_with_retry(job, format_selector, outtmpl, hook, fmt)
+        if not shared:
+            # 只保存合并输入的流（硬链接，不占额外空间）；直接下载的文件保存需要整份复制，
+            # 会让写入量和占用翻倍且不在磁盘空间预检之内
+            if fmt is not None and allow_link:
+                store.add(job.video_id, fmt, filename, allow_link)
+            return filename
+        
+        if not filename:
+            # 共享的下载没有报告结果文件，自己重新下载
+            return self._transfer_with_retry(job, format_selector, outtmpl, hook, fmt)
+        try:
+            target = os.path.join(job.session_dir, os.path.basename(filename))
+            clone_file(filename, target, allow_link)
+        except OSError as e:
+            # 共享的文件已被移走或合并删除，自己重新下载
+            print(f"共享下载结果不可用，重新下载: {e}")
+            return self._transfer_with_retry(job, format_selector, outtmpl, hook, fmt)
+        
+        # 进度回调记录的是共享任务的文件路径，改为本任务会话中的副本
+        for stream_type in ('video', 'audio'):
+            if getattr(job, f"{stream_type}_file") == filename:
+                self._record_stream_file(job, stream_type, target)
+        return target
+    
+    def _transfer_with_retry(self, job, format_selector, outtmpl, hook, fmt=None):
+        """下载单个格式，可重试的错误按退避重试（从已下载的部分继续）
+        
+        403通常是下载地址已过期，重试前重新提取视频信息；可能由代理引起的错误同时切换到其它代理。
+        """
+        current = {'fmt': fmt}
+        
+        def checked_hook(d):
+            # 只检查本任务的取消（共享下载时hook为转发给所有等待者的notify）
+            job.cancel_token.check()
+            hook(d)
+        
+        def transfer(last_failure):
+            job.cancel_token.check()
+            if last_failure is not None and last_failure.kind in PROXY_FAILURES and job.proxy:
+                self.proxy_pool.report_failure(job.proxy)
+                job.proxy = self.proxy_pool.failover(job)
+            if last_failure is not None and last_failure.kind == HTTP_403:
+                print("🔄 下载地址可能已过期，重新获取视频信息")
+                job.info = self._get_job_info(job, fresh_after=time.time())
+                if current['fmt'] is not None:
+                    current['fmt'] = self._resolve_single_format(job, format_selector)
+            start = time.time()
+            filename = self._run_stream_download(job, format_selector, outtmpl, checked_hook, current['fmt'])
+            # 按实测吞吐量更新代理评分
+            if job.proxy and filename and os.path.exists(filename):
+                elapsed = max(time.time() - start, 0.001)
+                self.proxy_pool.report_success(job.proxy, os.path.getsize(filename) / elapsed)
+            return filename
+        
+        host = get_breaker_key(fmt.get('url') if fmt is not None and fmt.get('url') else job.url)
+        return self.retry_policy.run(transfer, host, "下载", passthrough=(DownloadCancelled,),
+                                     cancel_event=job.cancel_token)
+    
+    def _resolve_single_format(self, job, format_selector):
+        """用yt-dlp的格式选择规则确定将要下载的格式
+        
+        只处理选中单个格式的情况（合并格式不进入流缓存）；没有原始信息时返回None。
+        """
+        if job.info is None or not job.info.raw or not job.video_id:
+            return None
+        formats = job.info.raw.get('formats') or []
+        if not formats:
+            return None
+        try:
+            with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+                selector = ydl.build_format_selector(format_selector)
+                selected = list(selector({
+                    'formats': formats,
+                    'has_merged_format': any('none' not in (f.get('acodec'), f.get('vcodec')) for f in formats),
+                    'incomplete_formats': (all(f.get('vcodec') == 'none' for f in formats)
+                                           or all(f.get('acodec') == 'none' for f in formats)),
+                }))
+        except Exception as e:
+            print(f"解析格式失败: {e}")
+            return None
+        if len(selected) != 1 or selected[0].get('requested_formats'):
+            return None
+        return selected[0]
+    
+    def _run_stream_download(self, job, format_selector, outtmpl, hook, fmt=None):
+        """下载单个格式，返回下载完成的文件路径
+        
+        按格式协议选择下载后端（yt-dlp、内置分段下载或aria2c），其它后端不适用或失败时交给yt-dlp。
+        下载速度相对自身历史持续骤降时，先经信息缓存重新提取新的签名地址并从当前位置继续，
+        刷新次数用完仍被限速时换用等效的其它格式/协议，不重新开始整个任务。
+        """
+        detector = ThrottleDetector.from_config()
+        max_refreshes = config.get("throttle_max_refreshes", 2)
+        refreshes = 0
+        tried_formats = {fmt.get('format_id')} if fmt is not None else set()
+        
+        def refresh_url():
+            # 内置分段下载原地换用新地址，与其它后端共用刷新次数
+            nonlocal refreshes
+            if refreshes >= max_refreshes:
+                return None
+            refreshes += 1
+            fresh = self._refresh_stream_format(job, fmt.get('format_id'), refreshes)
+            return (fresh['url'], fresh.get('http_headers')) if fresh else None
+        
+        while True:
+            backend = self._select_backend(fmt)
+            try:
+                if backend.name != "ytdlp":
+                    try:
+                        return backend.download(job, fmt, format_selector, outtmpl, hook, detector, refresh_url)
+                    except (StreamThrottled, DownloadCancelled):
+                        raise
+                    except Exception as e:
+                        # 磁盘空间不足换后端也无济于事
+                        if classify_error(e)[0] == DISK:
+                            raise
+                        print(f"⚠️ {backend.name}下载失败，改用yt-dlp下载: {e}")
+                        # 限速和取消时保留已下载的部分供同一后端续传；改用yt-dlp前删除，
+                        # 以免yt-dlp续传或直接采用其它后端预分配的不完整文件
+                        backend.discard(fmt, outtmpl)
+                return self.backends["ytdlp"].download(job, fmt, format_selector, outtmpl, hook, detector)
+            except StreamThrottled as e:
+                print(f"🐢 {e}")
+            
+            # 刷新地址后重新开始，yt-dlp和aria2c从已下载的部分继续
+            if refreshes < max_refreshes:
+                refreshes += 1
+                fresh = self._refresh_stream_format(job, fmt.get('format_id') if fmt else None, refreshes)
+                if fmt is None or fresh is not None:
+                    fmt = fresh
+                    detector.reset()
+                    continue
+            
+            alternative = self._find_alternative_format(job, fmt, tried_formats) if fmt is not None else None
+            if alternative is None:
+                print("⚠️ 没有可替代的格式，以当前速度继续下载")
+                detector = None
+                continue
+            print(f"🔀 换用等效格式: {fmt.get('format_id')} → {alternative.get('format_id')} "
+                  f"({alternative.get('protocol')})")
+            tried_formats.add(alternative.get('format_id'))
+            fmt, format_selector = alternative, alternative.get('format_id')
+            refreshes = 0
+            detector = ThrottleDetector.from_config()
+    
+    def _select_backend(self, fmt):
+        """按格式协议选择配置的下载后端；未配置、不可用或不支持该格式时使用yt-dlp"""
+        if fmt is not None:
+            backends = config.get("download_backends") or {}
+            backend = self.backends.get(backends.get(fmt.get('protocol')))
+            if backend is not None and backend.is_available() and backend.supports(fmt):
+                return backend
+        return self.backends["ytdlp"]
+    
+    def _refresh_stream_format(self, job, format_id, attempt):
+        """经信息缓存重新提取视频信息，返回刷新后的同一格式（格式已不存在时返回None）"""
+        print(f"🔄 检测到限速，刷新下载地址（第{attempt}次）")
+        job.info = self._get_job_info(job, fresh_after=time.time())
+        if format_id is None:
+            return None
+        for candidate in job.info.raw.get('formats') or []:
+            if candidate.get('format_id') == format_id:
+                return candidate
+        return None
+    
+    def _find_alternative_format(self, job, fmt, tried_formats):
+        """找出与当前格式等效（同类型、同分辨率/相近码率）且未尝试过的其它格式"""
+        if job.info is None or not job.info.raw:
+            return None
+        formats = job.info.raw.get('formats') or []
+        video_only = fmt.get('acodec') == 'none'
+        audio_only = fmt.get('vcodec') == 'none'
+        candidates = []
+        for candidate in formats:
+            if candidate.get('format_id') in tried_formats or not candidate.get('url'):
+                continue
+            if (candidate.get('acodec') == 'none') != video_only or (candidate.get('vcodec') == 'none') != audio_only:
+                continue
+            if audio_only:
+                abr, candidate_abr = fmt.get('abr') or 0, candidate.get('abr') or 0
+                if abr and abs(candidate_abr - abr) > abr * 0.25:
+                    continue
+            elif candidate.get('height') != fmt.get('height'):
+                continue
+            candidates.append(candidate)
+        if not candidates:
+            return None
+        # 优先同容器（不影响后续合并），其次换用不同协议
+        candidates.sort(key=lambda c: (c.get('ext') != fmt.get('ext'), c.get('protocol') == fmt.get('protocol')))
+        return candidates[0]
+    
+    def merge_job(self, job):
+        """阶段3：合并视频和音频"""
+        if not (job.video_file and job.audio_file):
+            self.parent.cache_manager.update_session_status(job.session_dir, "failed")
+            raise Exception("视频或音频文件缺失，无法合并")
+        
+        job.stage = "merging"
+        self.parent.download_stage = job.stage
+        
+        # 提交到后处理队列执行合并，避免同时启动过多FFmpeg进程
+        if self.parent.postprocessor.pending_count() > 0:
+            self._report_progress(job, 90, "⏳ 步骤3/3 - 等待合并队列...")
+        progress_callback = None
+        if job.on_progress:
+            progress_callback = lambda p, t: self._report_progress(job, p, t)
+        merge_task = self.parent.postprocessor.submit(
+            self.parent.ffmpeg.merge_video_audio,
+            job.video_file, 
+            job.audio_file, 
+            job.final_path,
+            progress_callback=progress_callback,
+            shortest=bool(job.clip),
+            cancel_event=job.cancel_token,
+            name=f"合并 {job.final_filename}"
+        )
+        # 排队或合并期间取消时立即返回；FFmpeg进程由合并任务自行结束
+        while True:
+            try:
+                success = merge_task.result(timeout=0.5)
+                break
+            except TimeoutError:
+                job.cancel_token.check()
+        
+        if not success:
+            # 更新会话状态为失败
+            self.parent.cache_manager.update_session_status(job.session_dir, "failed")
+            raise Exception("视频合并失败")
+        
+        # 合并结果由FFmpeg写出，不经过本程序；记录下载时已计算的输入流哈希，不再读取合并结果
+        if config.get("record_content_hash", True):
+            hashes = {'video': self._stream_content_hash(job, job.video_file),
+                      'audio': self._stream_content_hash(job, job.audio_file)}
+            job.stream_hashes = {stream_type: h for stream_type, h in hashes.items() if h}
+        
+        # 清理临时文件
+        try:
+            if os.path.exists(job.video_file):
+                os.remove(job.video_file)
+            if os.path.exists(job.audio_file):
+                os.remove(job.audio_file)
+            print(f"✅ 清理临时文件完成")
+        except Exception as e:
+            print(f"清理临时文件时出错: {e}")
+        job.merged = True
+        self.disk_reservations.shrink(job, job.final_path, job.prefetched_sizes.get('total') or 0)
+        return job
+    
+    def finalize_job(self, job):
+        """阶段4：将结果移动到目标目录并结束会话"""
+        job.stage = "moving"
+        if not job.needs_merge:
+            # 移动文件到目标目录
+            try:
+                # 查找下载的文件
+                downloaded_files = []
+                for file in os.listdir(job.session_dir):
+                    # 跳过未完成的临时文件和断点续传的控制文件（续传的会话中可能残留）
+                    if file != "session_info.json" and not file.endswith(('.part', '.ranges.json', '.aria2', '.ytdl')):
+                        downloaded_files.append(os.path.join(job.session_dir, file))
+                
+                if downloaded_files:
+                    downloaded_file = downloaded_files[0]  # 取第一个文件
+                    hasher = None
+                    if config.get("record_content_hash", True):
+                        hasher = job.stream_hashers.pop(downloaded_file, None) or BlockHasher()
+                    
+                    # 移动文件到目标目录，使用最终文件名（跨文件系统时经临时文件复制并显示进度，同时计算哈希）
+                    method = move_file(downloaded_file, job.final_path, hasher=hasher,
+                                       progress_callback=lambda copied, total: self._report_copy_progress(job, copied, total))
+                    if hasher is not None:
+                        job.stream_hashers[job.final_path] = hasher
+                    if method == "copy":
+                        print(f"📦 已跨文件系统复制到目标目录: {self.format_bytes(os.path.getsize(job.final_path))}")
+                else:
+                    raise Exception("未找到下载的文件")
+                    
+            except Exception as e:
+                # 更新会话状态为失败
+                self.parent.cache_manager.update_session_status(job.session_dir, "failed")
+                raise Exception(f"移动文件失败: {e}")
+        
+        # 更新会话状态为完成（下载目录中的暂存会话直接删除），写入下载记录，并释放原始信息字典
+        self.parent.cache_manager.update_session_status(job.session_dir, "completed")
+        self.parent.cache_manager.release_staging_session(job.session_dir)
+        info = job.info or {}
+        extra = {}
+        if config.get("record_content_hash", True):
+            extra = {'size': os.path.getsize(job.final_path), 'content_hash': self._compute_content_hash(job),
+                     'hash_algorithm': HASH_ALGORITHM}
+            if job.stream_hashes:
+                extra['stream_hashes'] = job.stream_hashes
+        self.parent.download_archive.record_download(
+            job.video_id, job.title, job.final_path, job.quality,
+            collection=job.collection, upload_date=job.upload_date,
+            uploader=info.get('uploader'), duration=info.get('duration'), **extra)
+        job.stage = "completed"
+        job.info = None
+        self.disk_reservations.release(job)
+        print(f"✅ 下载完成: {job.final_path}")
+        return job
+    
+    def _compute_content_hash(self, job):
+        """结果文件的内容哈希，只使用下载或跨盘复制时已顺带计算的块
+        
+        合并结果、yt-dlp下载后在同一文件系统内重命名的文件数据没有经过本程序，不为计算哈希重新读取
+        （可能有数GB），此时返回None。
+        """
+        job.content_hash = self._stream_content_hash(job, job.final_path)
+        job.stream_hashers = {}
+        return job.content_hash
+    
+    def _stream_content_hash(self, job, path):
+        """写入时已完整计算的文件内容哈希，没有（需要重新读取文件）时返回None"""
+        hasher = job.stream_hashers.get(path)
+        if hasher is None:
+            return None
+        try:
+            return hasher.digest(os.path.getsize(path))
+        except OSError as e:
+            print(f"获取内容哈希失败: {e}")
+            return None
+    
+    def _report_copy_progress(self, job, copied, total):
+        """跨文件系统复制到目标目录时的进度（取消时中止复制）"""
+        job.cancel_token.check()
+        percent = copied * 100 / total if total else 100
+        self._report_progress(job, 99, f"📦 复制到目标目录... {percent:.0f}% "
+                                        f"({self.format_bytes(copied)}/{self.format_bytes(total)})")
+    
+    def _report_progress(self, job, percentage, status_text):
+        """上报进度：批量任务交给任务回调，单任务直接更新主界面"""
+        if job is not None and job.on_progress:
+            job.on_progress(job, percentage, status_text)
+        else:
+            self.parent.root.after(0, lambda: self.parent.update_progress(percentage, status_text))
+    
+    def _record_stream_file(self, job, stream_type, filename):
+        """记录已下载完成的视频/音频文件路径"""
+        if job is not None:
+            setattr(job, f"{stream_type}_file", filename)
+        else:
+            setattr(self.parent, f"{stream_type}_file", filename)
     
     def _get_resolution_suffix(self, quality):
         """根据质量选择获取清晰度后缀"""
@@ -953,6 +1559,50 @@ class VideoDownloader:
         else:
             return ""
     
+    def _get_clip_suffix(self, clip):
+        """片段下载的文件名后缀，如 _片段1m30s-2m00s"""
+        if not clip:
+            return ""
+        
+        def format_time(seconds):
+            if seconds == float('inf'):
+                return "结尾"
+            seconds = int(seconds)
+            hours, rest = divmod(seconds, 3600)
+            minutes, secs = divmod(rest, 60)
+            if hours:
+                return f"{hours}h{minutes:02d}m{secs:02d}s"
+            return f"{minutes}m{secs:02d}s"
+        
+        return f"_片段{format_time(clip[0])}-{format_time(clip[1])}"
+    
+    def parse_timestamp(self, text):
+        """解析时间文本（如 90、1:30、1:02:03.5），返回秒数；空文本返回None"""
+        text = (text or "").strip()
+        if not text:
+            return None
+        try:
+            seconds = 0.0
+            for part in text.split(':'):
+                seconds = seconds * 60 + float(part)
+        except ValueError:
+            raise Exception(f"无法识别的时间: {text}\n\n请使用 秒数 或 分:秒 或 时:分:秒 格式")
+        if seconds < 0 or text.count(':') > 2:
+            raise Exception(f"无法识别的时间: {text}")
+        return seconds
+    
+    def parse_clip_range(self, start_text, end_text):
+        """解析片段的开始/结束时间，都为空时返回None；结束为空表示到视频结尾"""
+        start = self.parse_timestamp(start_text)
+        end = self.parse_timestamp(end_text)
+        if start is None and end is None:
+            return None
+        start = start or 0.0
+        end = float('inf') if end is None else end
+        if end <= start:
+            raise Exception("片段结束时间必须晚于开始时间")
+        return (start, end)
+    
     def _get_final_filename(self, clean_title, resolution_suffix):
         """生成最终文件名"""
         # 检查是否已经有清晰度后缀
@@ -0,0 +1,100 @@
+"""
+视频信息模块 - 用紧凑对象代替yt-dlp返回的原始信息字典
+"""
+import re
+import time
+from urllib.parse import urlparse, parse_qs
+
+
+def parse_url_expiry(url):
+    """从格式地址中解析过期时间戳（查询参数expire或路径/expire/<时间戳>/），解析不到时返回None"""
+    if not url:
+        return None
+    try:
+        parsed = urlparse(url)
+        expire = parse_qs(parsed.query).get('expire', [None])[0]
+        if expire is None:
+            match = re.search(r'/expire/(\d+)', parsed.path)
+            expire = match.group(1) if match else None
+        return int(expire) if expire else None
+    except (ValueError, TypeError):
+        return None
+
+
+class FormatRecord:
+    """单个格式的紧凑记录，只保留界面和大小计算用到的字段"""
+
+    __slots__ = ('format_id', 'height', 'fps', 'ext', 'vcodec', 'acodec', 'abr',
+                 'filesize', 'filesize_approx', 'expires')
+
+    def __init__(self, fmt):
+        self.format_id = fmt.get('format_id')
+        self.height = fmt.get('height')
+        self.fps = fmt.get('fps')
+        self.ext = fmt.get('ext')
+        self.vcodec = fmt.get('vcodec', 'none')
+        self.acodec = fmt.get('acodec', 'none')
+        self.abr = fmt.get('abr')
+        self.filesize = fmt.get('filesize')
+        self.filesize_approx = fmt.get('filesize_approx')
+        self.expires = parse_url_expiry(fmt.get('url'))
+
+    def get(self, key, default=None):
+        """与字典相同的取值方式，值为None时返回默认值"""
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+
+class VideoInfo:
+    """视频信息的紧凑对象
+
+    raw保存原始信息字典，仅在下载时复用（避免重复提取）；下载开始后或排队较深时
+    调用release_raw()释放，之后只保留显示和大小计算需要的字段。
+    """
+
+    __slots__ = ('id', 'title', 'uploader', 'duration', 'upload_date', 'view_count',
+                 'description', 'thumbnail', 'is_live', 'formats', 'raw')
+
+    # 界面最多显示800字描述，多保留一些用于判断是否截断
+    DESCRIPTION_LIMIT = 1000
+
+    def __init__(self, info, keep_raw=True):
+        self.id = info.get('id')
+        self.title = info.get('title')
+        self.uploader = info.get('uploader')
+        self.duration = info.get('duration')
+        self.upload_date = info.get('upload_date')
+        self.view_count = info.get('view_count')
+        self.description = (info.get('description') or '')[:self.DESCRIPTION_LIMIT] or None
+        self.thumbnail = info.get('thumbnail')
+        self.is_live = info.get('is_live')
+        self.formats = tuple(FormatRecord(fmt) for fmt in info.get('formats') or ())
+        self.raw = info if keep_raw else None
+
+    def get(self, key, default=None):
+        """与字典相同的取值方式，值为None时返回默认值"""
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    @property
+    def expires(self):
+        """格式地址中最早的过期时间，未知时返回None"""
+        return min((fmt.expires for fmt in self.formats if fmt.expires), default=None)
+
+    def is_reusable(self, margin=300):
+        """原始信息是否仍可用于下载（未释放且格式地址未过期）"""
+        if self.raw is None:
+            return False
+        expires = self.expires
+        return expires is None or expires - margin > time.time()
+
+    def copy(self):
+        """浅拷贝（共享格式记录和原始字典），各使用者可独立释放raw"""
+        clone = VideoInfo.__new__(VideoInfo)
+        for name in self.__slots__:
+            setattr(clone, name, getattr(self, name))
+        return clone
+
+    def release_raw(self):
+        """释放原始信息字典"""
+        self.raw = None